@@ -1,5 +1,4 @@
 import streamlit as st
-import pandas as pd
 from datetime import date, datetime
 from database.crud import crud
 from utils.helpers import format_currency, show_success_message, show_error_message
@@ -158,22 +157,9 @@ def show_account_statements():
         end_date = st.date_input("إلى تاريخ", value=date.today(), key="stmt_end")
     
     try:
-        payments_df = crud.get_all_payments()
-        expenses_df = crud.get_all_expenses()
-        
-        if not payments_df.empty:
-            payments_df['payment_date'] = pd.to_datetime(payments_df['payment_date']).dt.date
-            filtered_payments = payments_df[
-                (payments_df['payment_date'] >= start_date) & 
-                (payments_df['payment_date'] <= end_date)
-            ]
-        
-        if not expenses_df.empty:
-            expenses_df['expense_date'] = pd.to_datetime(expenses_df['expense_date']).dt.date
-            filtered_expenses = expenses_df[
-                (expenses_df['expense_date'] >= start_date) & 
-                (expenses_df['expense_date'] <= end_date)
-            ]
+        # جلب بيانات الفترة فقط
+        filtered_payments = crud.get_all_payments(start_date=start_date, end_date=end_date)
+        filtered_expenses = crud.get_all_expenses(start_date=start_date, end_date=end_date)
         
         # حساب الإجماليات
         total_revenue = filtered_payments['amount'].sum() if not filtered_payments.empty else 0
@@ -1,5 +1,7 @@
 import streamlit as st
+from datetime import date
 from database.crud import crud
+from database.export import available_formats
 
 def render():
     """صفحة سجل الأنشطة"""
@@ -50,3 +52,30 @@ def render():
                 st.metric("أكثر جدول استخداماً", most_used_table)
     else:
         st.info("لا يوجد سجل أنشطة")
+    
+    render_export()
+
+def render_export():
+    """تصدير سجل الأنشطة لفترة كاملة (بدون تحميله في الذاكرة)"""
+    st.markdown("---")
+    with st.expander("📥 تصدير سجل الأنشطة"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            start_date = st.date_input("من تاريخ", value=date(date.today().year, 1, 1), key="log_export_start")
+        with col2:
+            end_date = st.date_input("إلى تاريخ", value=date.today(), key="log_export_end")
+        with col3:
+            fmt = st.selectbox("الصيغة", available_formats(), key="log_export_format")
+        
+        if st.button("📤 تجهيز الملف", key="log_export"):
+            try:
+                export_file = crud.export('activity_log', fmt, start_date=start_date, end_date=end_date)
+                with export_file.open() as data:
+                    st.download_button(
+                        label=f"📥 تحميل ({export_file.rows} سجل)",
+                        data=data,
+                        file_name=export_file.file_name,
+                        mime=export_file.mime
+                    )
+            except Exception as e:
+                st.error(f"خطأ في التصدير: {str(e)}")
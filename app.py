@@ -4,7 +4,12 @@ from datetime import datetime, date, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from database.crud import crud
-from database.models import db
+from database.scheduling import AppointmentConflict
+from database.models import db, Database, DEFAULT_DB_PATH
+from settings import render_performance as render_performance_settings
+from pickers import patient_picker, appointment_picker
+from payments import render_receivables
+from appointments import render_free_slots
 
 # ========================
 # صفحة التهيئة الأساسية
@@ -21,9 +26,8 @@ st.set_page_config(
 # ========================
 @st.cache_resource
 def init_database():
-    """تهيئة قاعدة البيانات"""
-    db.initialize()
-    return True
+    """إعداد قاعدة البيانات - الجداول والترقيات تُنشأ عند أول استعلام (ensure_ready)"""
+    return Database.open(DEFAULT_DB_PATH)
 
 init_database()
 
@@ -180,6 +184,35 @@ def load_custom_css():
 
 load_custom_css()
 
+# ========================
+# الترقيم بين الصفحات
+# ========================
+def render_pagination(key, filters, fetch_page, page_size=50):
+    """جلب الصفحة الحالية وعرض أزرار التنقل (مؤشرات الصفحات محفوظة في session_state)"""
+    state_key = f"{key}_pagination"
+    state = st.session_state.get(state_key)
+    
+    # إعادة الترقيم من البداية عند تغيير الفلاتر
+    if state is None or state['filters'] != filters:
+        state = {'filters': filters, 'cursors': [None]}
+        st.session_state[state_key] = state
+    
+    page = fetch_page(page_size=page_size, cursor=state['cursors'][-1], **filters)
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("➡️ السابق", key=f"{key}_prev", disabled=len(state['cursors']) == 1):
+            state['cursors'].pop()
+            st.rerun()
+    with col2:
+        st.caption(f"الصفحة {len(state['cursors'])} - إجمالي السجلات: {page['total_estimate']:,}")
+    with col3:
+        if st.button("التالي ⬅️", key=f"{key}_next", disabled=page['next_cursor'] is None):
+            state['cursors'].append(page['next_cursor'])
+            st.rerun()
+    
+    return page
+
 # ========================
 # الشريط الجانبي - التنقل
 # ========================
@@ -227,8 +260,8 @@ def render_sidebar():
         today = date.today()
         st.info(f"📅 {today.strftime('%Y-%m-%d')}")
         
-        # إحصائيات سريعة
-        stats = crud.get_dashboard_stats()
+        # إحصائيات سريعة (من لقطة لوحة التحكم المخزنة مؤقتاً)
+        stats = crud.get_dashboard_snapshot()
         
         st.success(f"📌 مواعيد اليوم: {stats['today_appointments']}")
         
@@ -259,9 +292,9 @@ def render_dashboard():
         </div>
     """, unsafe_allow_html=True)
     
-    # الإحصائيات الرئيسية
-    stats = crud.get_dashboard_stats()
-    financial_summary = crud.get_financial_summary()
+    # الإحصائيات الرئيسية - استعلام واحد لكل أرقام وقوائم الصفحة
+    stats = crud.get_dashboard_snapshot()
+    financial_summary = stats
     
     # البطاقات الإحصائية
     col1, col2, col3, col4 = st.columns(4)
@@ -351,13 +384,12 @@ def render_dashboard():
     with col2:
         st.markdown("### 📅 حالة المواعيد")
         
-        all_appointments = crud.get_all_appointments()
-        if not all_appointments.empty:
-            status_counts = all_appointments['status'].value_counts()
+        if stats['appointment_status']:
+            status_names, status_values = zip(*stats['appointment_status'])
             
             fig = px.pie(
-                values=status_counts.values,
-                names=status_counts.index,
+                values=status_values,
+                names=status_names,
                 hole=0.4,
                 color_discrete_sequence=px.colors.qualitative.Set3
             )
@@ -368,11 +400,13 @@ def render_dashboard():
     
     # مواعيد اليوم
     st.markdown("### 📅 مواعيد اليوم")
-    today_appointments = crud.get_appointments_by_date(date.today().isoformat())
-    
-    if not today_appointments.empty:
+    if stats['today_schedule']:
+        today_appointments = pd.DataFrame(
+            stats['today_schedule'],
+            columns=['patient_name', 'doctor_name', 'treatment_name', 'appointment_time', 'status']
+        )
         st.dataframe(
-            today_appointments[['patient_name', 'doctor_name', 'treatment_name', 'appointment_time', 'status']],
+            today_appointments,
             use_container_width=True,
             hide_index=True
         )
@@ -384,11 +418,10 @@ def render_dashboard():
     
     with col1:
         st.markdown("### ⚠️ تنبيهات المخزون")
-        low_stock = crud.get_low_stock_items()
-        if not low_stock.empty:
-            st.warning(f"يوجد {len(low_stock)} عنصر بمخزون منخفض")
+        if stats['low_stock_items'] > 0:
+            st.warning(f"يوجد {stats['low_stock_items']} عنصر بمخزون منخفض")
             st.dataframe(
-                low_stock[['item_name', 'quantity', 'min_stock_level']].head(5),
+                pd.DataFrame(stats['low_stock'], columns=['item_name', 'quantity', 'min_stock_level']),
                 use_container_width=True,
                 hide_index=True
             )
@@ -397,10 +430,10 @@ def render_dashboard():
     
     with col2:
         st.markdown("### 📆 المواعيد القادمة")
-        upcoming = crud.get_upcoming_appointments(days=7)
-        if not upcoming.empty:
+        if stats['upcoming']:
             st.dataframe(
-                upcoming[['appointment_date', 'patient_name', 'doctor_name', 'status']].head(5),
+                pd.DataFrame(stats['upcoming'],
+                             columns=['appointment_date', 'patient_name', 'doctor_name', 'status']),
                 use_container_width=True,
                 hide_index=True
             )
@@ -416,39 +449,36 @@ def render_appointments():
     tab1, tab2, tab3, tab4 = st.tabs(["📋 جميع المواعيد", "➕ موعد جديد", "🔍 بحث", "📊 جدول الأطباء"])
     
     with tab1:
-        appointments = crud.get_all_appointments()
+        # الفلاتر تُطبق في قاعدة البيانات
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            status_filter = st.selectbox("فلترة حسب الحالة", ["الكل", "مجدول", "مؤكد", "مكتمل", "ملغي"])
+        
+        with col2:
+            doctor_names = crud.get_name_map('doctors', active_only=False)
+            doctor_filter = st.selectbox(
+                "فلترة حسب الطبيب",
+                [None] + list(doctor_names),
+                format_func=lambda x: "الكل" if x is None else doctor_names[x]
+            )
+        
+        with col3:
+            date_filter = st.date_input("التاريخ (اختياري)", value=None)
+        
+        filters = {
+            'status': None if status_filter == "الكل" else status_filter,
+            'doctor_id': doctor_filter,
+            'start_date': date_filter.isoformat() if date_filter else None,
+            'end_date': date_filter.isoformat() if date_filter else None,
+        }
+        page = render_pagination("appointments", filters, crud.get_appointments_page)
+        appointments = page['data']
+        
         if not appointments.empty:
-            # فلترة حسب الحالة
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                status_filter = st.selectbox("فلترة حسب الحالة", ["الكل"] + appointments['status'].unique().tolist())
-            
-            with col2:
-                if not appointments.empty:
-                    doctors = appointments['doctor_name'].unique().tolist()
-                    doctor_filter = st.selectbox("فلترة حسب الطبيب", ["الكل"] + doctors)
-            
-            with col3:
-                date_filter = st.date_input("التاريخ (اختياري)", value=None)
-            
-            # تطبيق الفلاتر
-            filtered_appointments = appointments.copy()
-            
-            if status_filter != "الكل":
-                filtered_appointments = filtered_appointments[filtered_appointments['status'] == status_filter]
-            
-            if doctor_filter != "الكل":
-                filtered_appointments = filtered_appointments[filtered_appointments['doctor_name'] == doctor_filter]
-            
-            if date_filter:
-                filtered_appointments = filtered_appointments[
-                    filtered_appointments['appointment_date'] == date_filter.isoformat()
-                ]
-            
             st.dataframe(
-                filtered_appointments[['id', 'patient_name', 'doctor_name', 'treatment_name', 
-                                      'appointment_date', 'appointment_time', 'status', 'total_cost']],
+                appointments[['id', 'patient_name', 'doctor_name', 'treatment_name', 
+                              'appointment_date', 'appointment_time', 'status', 'total_cost']],
                 use_container_width=True,
                 hide_index=True
             )
@@ -474,26 +504,22 @@ def render_appointments():
     with tab2:
         st.markdown("#### إضافة موعد جديد")
         
-        patients = crud.get_all_patients()
-        doctors = crud.get_all_doctors()
-        treatments = crud.get_all_treatments()
+        doctor_names = crud.get_name_map('doctors')
+        treatments = crud.get_all_treatments().set_index('id')
         
-        if patients.empty or doctors.empty:
-            st.warning("يجب إضافة مرضى وأطباء أولاً")
+        if not doctor_names:
+            st.warning("يجب إضافة أطباء أولاً")
         else:
             col1, col2 = st.columns(2)
             
             with col1:
-                patient_id = st.selectbox(
-                    "المريض*",
-                    patients['id'].tolist(),
-                    format_func=lambda x: patients[patients['id'] == x]['name'].iloc[0]
-                )
+                # البحث بالاسم أو الهاتف بدلاً من تحميل كل المرضى
+                patient_id = patient_picker(key="app_appointment_patient")
                 
                 treatment_id = st.selectbox(
                     "العلاج*",
-                    treatments['id'].tolist(),
-                    format_func=lambda x: treatments[treatments['id'] == x]['name'].iloc[0]
+                    treatments.index.tolist(),
+                    format_func=lambda x: treatments.at[x, 'name']
                 ) if not treatments.empty else None
                 
                 appointment_date = st.date_input("تاريخ الموعد*", min_value=date.today())
@@ -501,14 +527,14 @@ def render_appointments():
             with col2:
                 doctor_id = st.selectbox(
                     "الطبيب*",
-                    doctors['id'].tolist(),
-                    format_func=lambda x: doctors[doctors['id'] == x]['name'].iloc[0]
+                    list(doctor_names),
+                    format_func=doctor_names.get
                 )
                 
                 appointment_time = st.time_input("وقت الموعد*")
                 
                 if treatment_id:
-                    total_cost = treatments[treatments['id'] == treatment_id]['base_price'].iloc[0]
+                    total_cost = treatments.at[treatment_id, 'base_price']
                     total_cost = st.number_input("التكلفة الإجمالية*", value=float(total_cost), min_value=0.0, step=10.0)
                 else:
                     total_cost = st.number_input("التكلفة الإجمالية*", min_value=0.0, step=10.0)
@@ -516,21 +542,26 @@ def render_appointments():
             notes = st.text_area("ملاحظات")
             
             if st.button("حجز الموعد", type="primary", use_container_width=True):
-                try:
-                    crud.create_appointment(
-                        patient_id,
-                        doctor_id,
-                        treatment_id,
-                        appointment_date.isoformat(),
-                        appointment_time.strftime("%H:%M"),
-                        notes,
-                        total_cost
-                    )
-                    st.success("✅ تم حجز الموعد بنجاح!")
-                    st.balloons()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"حدث خطأ: {str(e)}")
+                if patient_id is None:
+                    st.warning("الرجاء اختيار المريض")
+                else:
+                    try:
+                        crud.create_appointment(
+                            patient_id,
+                            doctor_id,
+                            treatment_id,
+                            appointment_date.isoformat(),
+                            appointment_time.strftime("%H:%M"),
+                            notes,
+                            total_cost
+                        )
+                        st.success("✅ تم حجز الموعد بنجاح!")
+                        st.balloons()
+                        st.rerun()
+                    except AppointmentConflict as e:
+                        st.warning(f"⚠️ {e}")
+                    except Exception as e:
+                        st.error(f"حدث خطأ: {str(e)}")
     
     with tab3:
         st.markdown("#### البحث عن مواعيد")
@@ -547,19 +578,22 @@ def render_appointments():
                 st.dataframe(results, use_container_width=True, hide_index=True)
             else:
                 st.info("لا توجد مواعيد في هذا التاريخ")
+        
+        st.markdown("---")
+        render_free_slots()
     
     with tab4:
         st.markdown("#### جدول مواعيد الأطباء")
         
-        doctors = crud.get_all_doctors()
-        if not doctors.empty:
+        doctor_names = crud.get_name_map('doctors')
+        if doctor_names:
             col1, col2 = st.columns(2)
             
             with col1:
                 selected_doctor = st.selectbox(
                     "اختر الطبيب",
-                    doctors['id'].tolist(),
-                    format_func=lambda x: doctors[doctors['id'] == x]['name'].iloc[0]
+                    list(doctor_names),
+                    format_func=lambda x: doctor_names[x]
                 )
             
             with col2:
@@ -581,22 +615,24 @@ def render_patients():
     tab1, tab2, tab3 = st.tabs(["📋 جميع المرضى", "➕ مريض جديد", "📝 سجل مريض"])
     
     with tab1:
-        patients = crud.get_all_patients()
+        # البحث يستخدم فهرس البحث مباشرة، وبدون بحث يتم العرض صفحة بصفحة
+        search = st.text_input("🔍 بحث عن مريض", placeholder="اسم، هاتف، بريد إلكتروني...")
+        
+        if search:
+            patients = crud.search_patients(search)
+        else:
+            patients = render_pagination("patients", {}, crud.get_patients_page)['data']
+        
         if not patients.empty:
-            # بحث
-            search = st.text_input("🔍 بحث عن مريض", placeholder="اسم، هاتف، بريد إلكتروني...")
-            
-            if search:
-                patients = crud.search_patients(search)
-            
             st.dataframe(
                 patients[['id', 'name', 'phone', 'email', 'gender', 'date_of_birth', 'blood_type']],
                 use_container_width=True,
                 hide_index=True
             )
-            st.info(f"إجمالي المرضى: {len(patients)}")
+            if search:
+                st.info(f"نتائج البحث: {len(patients)}")
         else:
-            st.info("لا يوجد مرضى")
+            st.info("لا توجد نتائج" if search else "لا يوجد مرضى")
     
     with tab2:
         st.markdown("#### إضافة مريض جديد")
@@ -606,6 +642,10 @@ def render_patients():
         with col1:
             name = st.text_input("الاسم الكامل*")
             phone = st.text_input("رقم الهاتف*")
+            if phone:
+                existing = crud.find_patient_by_phone(phone)
+                if not existing.empty:
+                    st.warning(f"⚠️ هذا الرقم مسجل بالفعل للمريض: {'، '.join(existing['name'])}")
             email = st.text_input("البريد الإلكتروني")
             date_of_birth = st.date_input("تاريخ الميلاد", max_value=date.today())
             gender = st.selectbox("النوع*", ["ذكر", "أنثى"])
@@ -810,10 +850,15 @@ def render_treatments():
 def render_payments():
     st.markdown("### 💰 إدارة المدفوعات")
     
-    tab1, tab2, tab3 = st.tabs(["📋 جميع المدفوعات", "➕ دفعة جديدة", "📊 أرباح الأطباء"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 جميع المدفوعات", "➕ دفعة جديدة", "📊 أرباح الأطباء", "📒 المستحقات"])
     
     with tab1:
-        payments = crud.get_all_payments()
+        method_filter = st.selectbox("فلترة حسب طريقة الدفع", ["الكل", "نقدي", "بطاقة ائتمان", "تحويل بنكي", "شيك"])
+        
+        filters = {'payment_method': None if method_filter == "الكل" else method_filter}
+        page = render_pagination("payments", filters, crud.get_payments_page)
+        payments = page['data']
+        
         if not payments.empty:
             # عرض الأعمدة الجديدة
             display_df = payments[[
@@ -835,9 +880,9 @@ def render_payments():
             # الإحصائيات
             col1, col2, col3 = st.columns(3)
             
-            total = payments['amount'].sum()
-            doctor_total = payments['doctor_share'].sum()
-            clinic_total = payments['clinic_share'].sum()
+            total = page['totals']['amount']
+            doctor_total = page['totals']['doctor_share']
+            clinic_total = page['totals']['clinic_share']
             
             with col1:
                 st.metric("💰 إجمالي المدفوعات", f"{total:,.2f} ج.م")
@@ -851,44 +896,28 @@ def render_payments():
     with tab2:
         st.markdown("#### إضافة دفعة جديدة")
         
-        patients = crud.get_all_patients()
-        appointments = crud.get_all_appointments()
+        # اختيار الموعد أولاً (اختياري) - البحث برقم الموعد أو اسم المريض
+        appointment_id = appointment_picker(key="app_payment_appointment")
         
-        if not patients.empty:
-            # اختيار الموعد أولاً (اختياري)
-            appointment_id = st.selectbox(
-                "الموعد (اختياري)",
-                [None] + appointments['id'].tolist() if not appointments.empty else [None],
-                format_func=lambda x: "دفعة بدون موعد" if x is None else 
-                    f"موعد #{x} - {appointments[appointments['id']==x]['patient_name'].iloc[0]} - {appointments[appointments['id']==x]['treatment_name'].iloc[0]}"
-            )
-            
+        billing = crud.get_appointment_billing_context(appointment_id) if appointment_id else None
+        if appointment_id and billing is None:
+            # الموعد حُذف بعد فتح النموذج
+            st.error("❌ الموعد المحدد غير موجود")
+        else:
             col1, col2 = st.columns(2)
             
             with col1:
-                # إذا تم اختيار موعد، املأ البيانات تلقائياً
+                # إذا تم اختيار موعد، املأ البيانات تلقائياً من سياق المحاسبة
                 if appointment_id:
-                    appointment_data = appointments[appointments['id'] == appointment_id].iloc[0]
-                    patient_name = appointment_data['patient_name']
-                    amount = st.number_input("المبلغ (ج.م)*", value=float(appointment_data['total_cost']), min_value=0.0, step=10.0)
+                    patient_id = billing['patient_id']
+                    amount = st.number_input("المبلغ (ج.م)*", value=float(billing['total_cost']), min_value=0.0, step=10.0)
                     
-                    st.info(f"المريض: {patient_name}")
+                    st.info(f"المريض: {billing['patient_name']}")
+                    if billing['paid_amount']:
+                        st.caption(f"المدفوع سابقاً: {billing['paid_amount']:,.2f} ج.م من {billing['total_cost']:,.2f} ج.م")
                     
-                    # جلب نسب التقسيم من العلاج
-                    treatments = crud.get_all_treatments()
-                    if not treatments.empty:
-                        treatment_name = appointment_data['treatment_name']
-                        treatment_info = treatments[treatments['name'] == treatment_name]
-                        
-                        if not treatment_info.empty:
-                            doctor_pct = treatment_info['doctor_percentage'].iloc[0]
-                            clinic_pct = treatment_info['clinic_percentage'].iloc[0]
-                        else:
-                            doctor_pct = 50.0
-                            clinic_pct = 50.0
-                    else:
-                        doctor_pct = 50.0
-                        clinic_pct = 50.0
+                    doctor_pct = billing['doctor_percentage']
+                    clinic_pct = billing['clinic_percentage']
                     
                     # عرض التقسيم المتوقع
                     st.markdown("---")
@@ -901,15 +930,8 @@ def render_payments():
                     with col_b:
                         clinic_share = (amount * clinic_pct) / 100
                         st.info(f"🏥 العيادة ({clinic_pct}%): **{clinic_share:,.2f} ج.م**")
-                    
-                    # إيجاد patient_id الحقيقي
-                    patient_id = patients[patients['name'] == patient_name]['id'].iloc[0]
                 else:
-                    patient_id = st.selectbox(
-                        "المريض*",
-                        patients['id'].tolist(),
-                        format_func=lambda x: patients[patients['id'] == x]['name'].iloc[0]
-                    )
+                    patient_id = patient_picker(key="app_payment_patient")
                     amount = st.number_input("المبلغ (ج.م)*", min_value=0.0, step=10.0)
                     
                     st.warning("⚠️ دفعة بدون موعد - ستذهب 100% للعيادة")
@@ -921,7 +943,9 @@ def render_payments():
                 notes = st.text_area("ملاحظات")
             
             if st.button("تسجيل الدفعة", type="primary", use_container_width=True):
-                if amount > 0:
+                if patient_id is None:
+                    st.warning("الرجاء اختيار المريض")
+                elif amount > 0:
                     try:
                         crud.create_payment(
                             appointment_id, patient_id, amount,
@@ -934,8 +958,6 @@ def render_payments():
                         st.error(f"حدث خطأ: {str(e)}")
                 else:
                     st.warning("الرجاء إدخال مبلغ صحيح")
-        else:
-            st.warning("يجب إضافة مرضى أولاً")
     
     with tab3:
         st.markdown("#### 💼 أرباح الأطباء")
@@ -946,42 +968,49 @@ def render_payments():
         with col2:
             end_date = st.date_input("إلى تاريخ", value=date.today(), key="doc_earnings_end")
         
-        doctors = crud.get_all_doctors()
+        earnings = crud.get_all_doctor_earnings(start_date.isoformat(), end_date.isoformat())
+        summary = earnings['summary']
         
-        if not doctors.empty:
-            earnings_data = []
+        if not summary.empty:
+            earnings_df = pd.DataFrame({
+                'الطبيب': summary['doctor_name'],
+                'التخصص': summary['specialization'],
+                'عدد المدفوعات': summary['payment_count'].astype(int),
+                'إجمالي الأرباح': summary['total_earnings'].fillna(0).astype(float),
+                'متوسط النسبة': summary['avg_percentage'].fillna(0).astype(float)
+            })
+            st.dataframe(earnings_df, use_container_width=True, hide_index=True)
             
-            for _, doctor in doctors.iterrows():
-                earnings = crud.get_doctor_earnings(
-                    doctor['id'], 
-                    start_date.isoformat(), 
-                    end_date.isoformat()
-                )
-                
-                if not earnings.empty and earnings.iloc[0]['total_earnings'] is not None:
-                    earnings_data.append({
-                        'الطبيب': doctor['name'],
-                        'التخصص': doctor['specialization'],
-                        'عدد المدفوعات': int(earnings.iloc[0]['payment_count'] or 0),
-                        'إجمالي الأرباح': float(earnings.iloc[0]['total_earnings'] or 0),
-                        'متوسط النسبة': float(earnings.iloc[0]['avg_percentage'] or 0)
-                    })
-            
-            if earnings_data:
-                earnings_df = pd.DataFrame(earnings_data)
-                st.dataframe(earnings_df, use_container_width=True, hide_index=True)
-                
-                # رسم بياني
-                fig = px.bar(
-                    earnings_df,
-                    x='الطبيب',
-                    y='إجمالي الأرباح',
-                    color='التخصص',
-                    title='أرباح الأطباء'
+            # رسم بياني
+            fig = px.bar(
+                earnings_df,
+                x='الطبيب',
+                y='إجمالي الأرباح',
+                color='التخصص',
+                title='أرباح الأطباء'
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            
+            # التفصيل حسب العلاج
+            with st.expander("📋 الأرباح حسب العلاج"):
+                breakdown = earnings['by_treatment']
+                st.dataframe(
+                    pd.DataFrame({
+                        'الطبيب': breakdown['doctor_name'],
+                        'العلاج': breakdown['treatment_name'].fillna('-'),
+                        'عدد المدفوعات': breakdown['payment_count'].astype(int),
+                        'إجمالي الإيرادات': breakdown['total_revenue'].fillna(0).astype(float),
+                        'أرباح الطبيب': breakdown['total_earnings'].fillna(0).astype(float),
+                        'متوسط النسبة': breakdown['avg_percentage'].fillna(0).astype(float)
+                    }),
+                    use_container_width=True,
+                    hide_index=True
                 )
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("لا توجد بيانات للفترة المحددة")
+        else:
+            st.info("لا توجد بيانات للفترة المحددة")
+    
+    with tab4:
+        render_receivables()
 
 # سأكمل في الرسالة التالية...
 # ========================
@@ -1154,15 +1183,15 @@ def render_expenses():
     tab1, tab2 = st.tabs(["📋 جميع المصروفات", "➕ مصروف جديد"])
     
     with tab1:
-        expenses = crud.get_all_expenses()
+        # فلترة حسب الفئة
+        categories = crud.get_expense_categories()
+        category_filter = st.selectbox("فلترة حسب الفئة", ["الكل"] + categories)
+        
+        filters = {'category': None if category_filter == "الكل" else category_filter}
+        page = render_pagination("expenses", filters, crud.get_expenses_page)
+        expenses = page['data']
+        
         if not expenses.empty:
-            # فلترة حسب الفئة
-            categories = expenses['category'].unique().tolist()
-            category_filter = st.selectbox("فلترة حسب الفئة", ["الكل"] + categories)
-            
-            if category_filter != "الكل":
-                expenses = expenses[expenses['category'] == category_filter]
-            
             st.dataframe(
                 expenses[['id', 'category', 'description', 'amount', 'expense_date', 
                          'payment_method', 'receipt_number']],
@@ -1171,7 +1200,7 @@ def render_expenses():
             )
             
             # الإحصائيات
-            total = expenses['amount'].sum()
+            total = page['totals']['amount']
             st.error(f"💸 إجمالي المصروفات: {total:,.2f} ج.م")
         else:
             st.info("لا توجد مصروفات")
@@ -1852,7 +1881,7 @@ def render_reports():
 def render_settings():
     st.markdown("### ⚙️ إعدادات النظام")
     
-    tab1, tab2 = st.tabs(["🏥 معلومات العيادة", "💾 النسخ الاحتياطي"])
+    tab1, tab2, tab3 = st.tabs(["🏥 معلومات العيادة", "💾 النسخ الاحتياطي", "⚡ أداء قاعدة البيانات"])
     
     with tab1:
         st.markdown("#### معلومات العيادة")
@@ -1930,6 +1959,9 @@ def render_settings():
             - احفظ النسخة الاحتياطية في مكان آمن
             - يُنصح بإنشاء نسخ احتياطية دورية
             """)
+    
+    with tab3:
+        render_performance_settings()
 
 # ========================
 # صفحة سجل الأنشطة
@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 from database.crud import crud
+from database.scheduling import AppointmentConflict
+from pickers import patient_picker
 
 def render():
     """صفحة إدارة المواعيد"""
@@ -17,6 +19,8 @@ def render():
     
     with tab3:
         render_search_appointments()
+        st.markdown("---")
+        render_free_slots()
     
     with tab4:
         render_doctor_schedule()
@@ -82,26 +86,22 @@ def render_add_appointment():
     """نموذج إضافة موعد جديد"""
     st.markdown("#### إضافة موعد جديد")
     
-    patients = crud.get_all_patients()
-    doctors = crud.get_all_doctors()
-    treatments = crud.get_all_treatments()
+    doctor_names = crud.get_name_map('doctors')
+    treatments = crud.get_all_treatments().set_index('id')
     
-    if patients.empty or doctors.empty:
-        st.warning("يجب إضافة مرضى وأطباء أولاً")
+    if not doctor_names:
+        st.warning("يجب إضافة أطباء أولاً")
     else:
         col1, col2 = st.columns(2)
         
         with col1:
-            patient_id = st.selectbox(
-                "المريض*",
-                patients['id'].tolist(),
-                format_func=lambda x: patients[patients['id'] == x]['name'].iloc[0]
-            )
+            # البحث بالاسم أو الهاتف بدلاً من تحميل كل المرضى
+            patient_id = patient_picker(key="appointment_patient")
             
             treatment_id = st.selectbox(
                 "العلاج*",
-                treatments['id'].tolist(),
-                format_func=lambda x: treatments[treatments['id'] == x]['name'].iloc[0]
+                treatments.index.tolist(),
+                format_func=lambda x: treatments.at[x, 'name']
             ) if not treatments.empty else None
             
             appointment_date = st.date_input("تاريخ الموعد*", min_value=date.today())
@@ -109,14 +109,14 @@ def render_add_appointment():
         with col2:
             doctor_id = st.selectbox(
                 "الطبيب*",
-                doctors['id'].tolist(),
-                format_func=lambda x: doctors[doctors['id'] == x]['name'].iloc[0]
+                list(doctor_names),
+                format_func=doctor_names.get
             )
             
             appointment_time = st.time_input("وقت الموعد*")
             
             if treatment_id:
-                total_cost = treatments[treatments['id'] == treatment_id]['base_price'].iloc[0]
+                total_cost = treatments.at[treatment_id, 'base_price']
                 total_cost = st.number_input("التكلفة الإجمالية*", value=float(total_cost), min_value=0.0, step=10.0)
             else:
                 total_cost = st.number_input("التكلفة الإجمالية*", min_value=0.0, step=10.0)
@@ -124,21 +124,26 @@ def render_add_appointment():
         notes = st.text_area("ملاحظات")
         
         if st.button("حجز الموعد", type="primary", use_container_width=True):
-            try:
-                crud.create_appointment(
-                    patient_id,
-                    doctor_id,
-                    treatment_id,
-                    appointment_date.isoformat(),
-                    appointment_time.strftime("%H:%M"),
-                    notes,
-                    total_cost
-                )
-                st.success("✅ تم حجز الموعد بنجاح!")
-                st.balloons()
-                st.rerun()
-            except Exception as e:
-                st.error(f"حدث خطأ: {str(e)}")
+            if patient_id is None:
+                st.warning("الرجاء اختيار المريض")
+            else:
+                try:
+                    crud.create_appointment(
+                        patient_id,
+                        doctor_id,
+                        treatment_id,
+                        appointment_date.isoformat(),
+                        appointment_time.strftime("%H:%M"),
+                        notes,
+                        total_cost
+                    )
+                    st.success("✅ تم حجز الموعد بنجاح!")
+                    st.balloons()
+                    st.rerun()
+                except AppointmentConflict as e:
+                    st.warning(f"⚠️ {e}")
+                except Exception as e:
+                    st.error(f"حدث خطأ: {str(e)}")
 
 def render_search_appointments():
     """البحث عن مواعيد"""
@@ -157,19 +162,64 @@ def render_search_appointments():
         else:
             st.info("لا توجد مواعيد في هذا التاريخ")
 
+def render_free_slots():
+    """أقرب موعد متاح لعلاج عند طبيب أو أكثر"""
+    st.markdown("#### ⏱️ أقرب موعد متاح")
+    
+    doctor_names = crud.get_name_map('doctors')
+    treatments = crud.get_all_treatments().set_index('id')
+    
+    if not doctor_names or treatments.empty:
+        st.info("يجب إضافة أطباء وعلاجات أولاً")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        treatment_id = st.selectbox(
+            "العلاج",
+            treatments.index.tolist(),
+            format_func=lambda x: treatments.at[x, 'name'],
+            key="free_slots_treatment"
+        )
+    with col2:
+        doctor_ids = st.multiselect(
+            "الأطباء (الكل إذا لم يتم الاختيار)",
+            list(doctor_names),
+            format_func=lambda x: doctor_names[x],
+            key="free_slots_doctors"
+        )
+    with col3:
+        days = st.number_input("خلال (يوم)", min_value=1, max_value=90, value=30, key="free_slots_days")
+    
+    if st.button("بحث عن موعد", key="free_slots_search"):
+        slots = crud.find_free_slots(treatment_id, doctor_ids=doctor_ids or None, days=int(days))
+        if not slots.empty:
+            st.dataframe(
+                slots.drop(columns=['doctor_id']).rename(columns={
+                    'doctor_name': 'الطبيب',
+                    'appointment_date': 'التاريخ',
+                    'appointment_time': 'من',
+                    'end_time': 'إلى'
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.info("لا توجد مواعيد متاحة في هذه الفترة")
+
 def render_doctor_schedule():
     """جدول مواعيد الأطباء"""
     st.markdown("#### جدول مواعيد الأطباء")
     
-    doctors = crud.get_all_doctors()
-    if not doctors.empty:
+    doctor_names = crud.get_name_map('doctors')
+    if doctor_names:
         col1, col2 = st.columns(2)
         
         with col1:
             selected_doctor = st.selectbox(
                 "اختر الطبيب",
-                doctors['id'].tolist(),
-                format_func=lambda x: doctors[doctors['id'] == x]['name'].iloc[0]
+                list(doctor_names),
+                format_func=lambda x: doctor_names[x]
             )
         
         with col2:
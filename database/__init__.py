@@ -4,7 +4,8 @@ Cura Clinic Database Module
 """
 
 from .models import db, Database
+from .pool import ConnectionPool
 from .crud import crud, CRUDOperations
 
-__all__ = ['db', 'Database', 'crud', 'CRUDOperations']
+__all__ = ['db', 'Database', 'ConnectionPool', 'crud', 'CRUDOperations']
 __version__ = '1.0.0'
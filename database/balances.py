@@ -0,0 +1,197 @@
+"""
+دفتر أرصدة المرضى (patient_balances)
+
+صف واحد لكل مريض فيه إجمالي المستحق (charged) والمدفوع (paid) والرصيد (balance).
+يتم تحديثه بـ triggers على جدولي المواعيد والمدفوعات داخل نفس المعاملة (نفس أسلوب
+الجداول التجميعية اليومية)، لذلك كل دوال CRUD والاستيراد تحدثه تلقائياً، وشاشة
+المستحقات تقرأ صفوف المرضى المدينين من فهرس جزئي بدون أي تجميع.
+
+- المستحق: تكلفة المواعيد غير الملغاة
+- المدفوع: المدفوعات غير الملغاة أو المستردة
+
+المطابقة (إعادة الحساب من البيانات الخام وعرض الفروق، و --fix لتصحيحها):
+
+    python -m database.balances
+    python -m database.balances --fix
+"""
+
+import argparse
+import sys
+
+CANCELLED_APPOINTMENT = 'ملغي'
+VOID_PAYMENT_STATUSES = ('ملغي', 'مسترد')
+
+# الرصيد الأكبر من هذا يعتبر مستحقاً (وهو أيضاً حد الفرق المقبول في المطابقة)
+BALANCE_TOLERANCE = 0.005
+
+BALANCES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS patient_balances (
+        patient_id INTEGER PRIMARY KEY,
+        charged REAL NOT NULL DEFAULT 0,
+        paid REAL NOT NULL DEFAULT 0,
+        balance REAL NOT NULL DEFAULT 0
+    )
+'''
+
+# المرضى المدينون فقط - شاشة المستحقات تقرأ من هذا الفهرس مرتباً بالرصيد
+BALANCES_INDEX = f'''
+    CREATE INDEX IF NOT EXISTS idx_patient_balances_owing
+    ON patient_balances (balance) WHERE balance > {BALANCE_TOLERANCE}
+'''
+
+_VOID_PAYMENTS = ", ".join(f"'{status}'" for status in VOID_PAYMENT_STATUSES)
+
+# ========== قوالب التحديث ==========
+# {row} = NEW أو OLD، {sign} = 1 أو -1
+
+_CHARGE_DELTA = f'''
+    INSERT INTO patient_balances (patient_id, charged, paid, balance)
+    SELECT {{row}}.patient_id,
+           {{sign}} * COALESCE({{row}}.total_cost, 0),
+           0,
+           {{sign}} * COALESCE({{row}}.total_cost, 0)
+    WHERE {{row}}.patient_id IS NOT NULL
+    AND COALESCE({{row}}.status, '') != '{CANCELLED_APPOINTMENT}'
+    ON CONFLICT (patient_id) DO UPDATE SET
+        charged = charged + excluded.charged,
+        balance = balance + excluded.balance;
+'''
+
+_PAYMENT_DELTA = f'''
+    INSERT INTO patient_balances (patient_id, charged, paid, balance)
+    SELECT {{row}}.patient_id,
+           0,
+           {{sign}} * COALESCE({{row}}.amount, 0),
+           -({{sign}} * COALESCE({{row}}.amount, 0))
+    WHERE {{row}}.patient_id IS NOT NULL
+    AND COALESCE({{row}}.status, '') NOT IN ({_VOID_PAYMENTS})
+    ON CONFLICT (patient_id) DO UPDATE SET
+        paid = paid + excluded.paid,
+        balance = balance + excluded.balance;
+'''
+
+
+def _add(template):
+    return template.format(row='NEW', sign=1)
+
+
+def _remove(template):
+    return template.format(row='OLD', sign=-1)
+
+
+# (اسم الـ trigger، الحدث، الجسم)
+TRIGGERS = [
+    ('trg_appointments_balance_insert', 'AFTER INSERT ON appointments', _add(_CHARGE_DELTA)),
+    ('trg_appointments_balance_delete', 'AFTER DELETE ON appointments', _remove(_CHARGE_DELTA)),
+    ('trg_appointments_balance_update',
+     'AFTER UPDATE OF patient_id, status, total_cost ON appointments',
+     _remove(_CHARGE_DELTA) + _add(_CHARGE_DELTA)),
+
+    ('trg_payments_balance_insert', 'AFTER INSERT ON payments', _add(_PAYMENT_DELTA)),
+    ('trg_payments_balance_delete', 'AFTER DELETE ON payments', _remove(_PAYMENT_DELTA)),
+    ('trg_payments_balance_update',
+     'AFTER UPDATE OF patient_id, status, amount ON payments',
+     _remove(_PAYMENT_DELTA) + _add(_PAYMENT_DELTA)),
+]
+
+# الأرصدة محسوبة من الصفوف الخام (للتعبئة والمطابقة)
+EXPECTED_BALANCES = f'''
+    SELECT patient_id, SUM(charged) as charged, SUM(paid) as paid,
+           SUM(charged) - SUM(paid) as balance
+    FROM (
+        SELECT patient_id, COALESCE(total_cost, 0) as charged, 0 as paid
+        FROM appointments
+        WHERE patient_id IS NOT NULL AND COALESCE(status, '') != '{CANCELLED_APPOINTMENT}'
+        UNION ALL
+        SELECT patient_id, 0, COALESCE(amount, 0)
+        FROM payments
+        WHERE patient_id IS NOT NULL AND COALESCE(status, '') NOT IN ({_VOID_PAYMENTS})
+    )
+    GROUP BY patient_id
+'''
+
+_DRIFT = f'''
+    WITH expected AS ({EXPECTED_BALANCES}),
+    ids AS (
+        SELECT patient_id FROM expected
+        UNION
+        SELECT patient_id FROM patient_balances
+    )
+    SELECT
+        ids.patient_id,
+        COALESCE(b.charged, 0) as ledger_charged,
+        COALESCE(e.charged, 0) as expected_charged,
+        COALESCE(b.paid, 0) as ledger_paid,
+        COALESCE(e.paid, 0) as expected_paid,
+        COALESCE(b.balance, 0) as ledger_balance,
+        COALESCE(e.balance, 0) as expected_balance
+    FROM ids
+    LEFT JOIN patient_balances b ON b.patient_id = ids.patient_id
+    LEFT JOIN expected e ON e.patient_id = ids.patient_id
+    WHERE abs(COALESCE(b.charged, 0) - COALESCE(e.charged, 0)) > :tolerance
+    OR abs(COALESCE(b.paid, 0) - COALESCE(e.paid, 0)) > :tolerance
+    OR abs(COALESCE(b.balance, 0) - COALESCE(e.balance, 0)) > :tolerance
+    ORDER BY ids.patient_id
+'''
+
+
+# ========== الإنشاء وإعادة البناء ==========
+def create_balances(cursor):
+    """إنشاء جدول الأرصدة والفهرس والـ triggers (بدون تعبئة)"""
+    cursor.execute(BALANCES_TABLE)
+    cursor.execute(BALANCES_INDEX)
+    for name, event, body in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN\n{body}\nEND")
+
+
+def fill_balances(cursor):
+    """مسح الأرصدة وإعادة حسابها من المواعيد والمدفوعات"""
+    cursor.execute("DELETE FROM patient_balances")
+    cursor.execute(f"INSERT INTO patient_balances (patient_id, charged, paid, balance) {EXPECTED_BALANCES}")
+
+
+def balance_drift(conn, tolerance=BALANCE_TOLERANCE):
+    """المرضى الذين يختلف رصيدهم في الدفتر عن الحساب من البيانات الخام"""
+    cursor = conn.execute(_DRIFT, {'tolerance': tolerance})
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def reconcile_balances(conn, fix=False):
+    """مطابقة الدفتر مع البيانات الخام - يعيد الفروق (وتُصحح بإعادة التعبئة إذا fix)"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        create_balances(cursor)
+        drift = balance_drift(conn)
+        if fix and drift:
+            fill_balances(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == "__main__":
+    from .crud import crud
+    from .models import add_database_arguments, open_from_args
+
+    parser = argparse.ArgumentParser(description="مطابقة دفتر أرصدة المرضى")
+    parser.add_argument('--fix', action='store_true', help="إعادة حساب الدفتر إذا وجدت فروق")
+    add_database_arguments(parser)
+    args = parser.parse_args()
+    open_from_args(args)
+
+    drift = crud.reconcile_balances(fix=args.fix)
+    if drift.empty:
+        print("✅ دفتر الأرصدة مطابق للمواعيد والمدفوعات")
+        sys.exit(0)
+
+    print(f"⚠️ {len(drift)} مريض برصيد غير مطابق:")
+    for row in drift.itertuples():
+        print(f"   مريض {row.patient_id}: الدفتر {row.ledger_balance:,.2f} - الفعلي {row.expected_balance:,.2f}")
+    if args.fix:
+        print("✅ تم تصحيح الدفتر")
+    sys.exit(0 if args.fix else 1)
@@ -0,0 +1,125 @@
+"""
+وحدة عمل (Unit of Work) للكتابة المجمعة
+
+تجمع العمليات في الذاكرة ثم تنفذها كلها عند الخروج من السياق في معاملة واحدة:
+العمليات المتتالية التي لها نفس جملة SQL تُنفذ بـ executemany، وسجل الأنشطة يُكتب
+دفعة واحدة، ثم commit واحد. أي خطأ يلغي كل العمليات.
+
+    with crud.batch() as batch:
+        for row in rows:
+            batch.update_doctor(row['id'], name=row['name'], salary=row['salary'])
+"""
+
+from itertools import groupby
+
+# الجداول المسموح بالكتابة عليها من خلال الدفعة
+BATCH_TABLES = {
+    'doctors', 'patients', 'treatments', 'appointments', 'payments',
+    'inventory', 'suppliers', 'expenses', 'settings',
+}
+
+
+def _plain(value):
+    """تحويل قيم numpy (من DataFrame) إلى قيم Python يقبلها sqlite3"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+class Batch:
+    """قائمة عمليات كتابة تنفذ معاً في معاملة واحدة"""
+
+    def __init__(self, user_name="النظام"):
+        self.user_name = user_name
+        self._operations = []  # [(sql, params, table_name)]
+        self._activity = []    # [(action, table_name, record_id, details, user_name)]
+        self._updated_columns = {}  # table_name -> أعمدة مستخدمة في update()
+
+    def __len__(self):
+        return len(self._operations)
+
+    @property
+    def tables(self):
+        """الجداول التي ستتأثر بالدفعة"""
+        return {table_name for _, _, table_name in self._operations}
+
+    # ========== تسجيل العمليات ==========
+    def execute(self, sql, params, table_name, action=None, record_id=None, details=None):
+        """إضافة جملة SQL للدفعة مع نشاط اختياري في السجل"""
+        if table_name not in BATCH_TABLES:
+            raise ValueError(f"Table not allowed in batch: {table_name}")
+        self._operations.append((sql, tuple(_plain(param) for param in params), table_name))
+        if action:
+            self._activity.append((action, table_name, _plain(record_id), details, self.user_name))
+
+    def update(self, table_name, record_id, values, action=None, details=None):
+        """تحديث أعمدة محددة في صف واحد (بدون تغيير باقي الأعمدة)"""
+        if not values:
+            return
+        columns = sorted(values)
+        for column in columns:
+            if not column.isidentifier():
+                raise ValueError(f"Invalid column name: {column}")
+        self._updated_columns.setdefault(table_name, set()).update(columns)
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        self.execute(
+            f"UPDATE {table_name} SET {assignments} WHERE id = ?",
+            [values[column] for column in columns] + [record_id],
+            table_name, action, record_id, details
+        )
+
+    def soft_delete(self, table_name, record_id, action=None, details=None):
+        """إلغاء تفعيل صف (is_active = 0)"""
+        self.execute(f"UPDATE {table_name} SET is_active = 0 WHERE id = ?", (record_id,),
+                     table_name, action, record_id, details)
+
+    # ========== اختصارات ==========
+    def update_doctor(self, doctor_id, **values):
+        self.update('doctors', doctor_id, values, "تحديث طبيب",
+                    f"تم تحديث بيانات الطبيب: {values.get('name', doctor_id)}")
+
+    def delete_doctor(self, doctor_id):
+        self.soft_delete('doctors', doctor_id, "حذف طبيب", "تم إلغاء تفعيل الطبيب")
+
+    def update_treatment(self, treatment_id, **values):
+        self.update('treatments', treatment_id, values, "تحديث علاج",
+                    f"تم تحديث علاج: {values.get('name', treatment_id)}")
+
+    def delete_treatment(self, treatment_id):
+        self.soft_delete('treatments', treatment_id, "حذف علاج", "تم إلغاء تفعيل العلاج")
+
+    # ========== التنفيذ ==========
+    def _check_columns(self, conn):
+        """التحقق من أن أعمدة update() موجودة فعلاً في جداولها"""
+        for table_name, columns in self._updated_columns.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+            unknown = columns - existing
+            if unknown:
+                raise ValueError(f"Unknown columns in {table_name}: {', '.join(sorted(unknown))}")
+
+    def flush(self, conn):
+        """تنفيذ كل العمليات في معاملة واحدة - يعيد عدد العمليات المنفذة"""
+        if not self._operations:
+            return 0
+
+        self._check_columns(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # العمليات المتتالية بنفس الجملة تنفذ معاً مع الحفاظ على الترتيب
+            for sql, group in groupby(self._operations, key=lambda operation: operation[0]):
+                conn.executemany(sql, [params for _, params, _ in group])
+
+            if self._activity:
+                conn.executemany('''
+                    INSERT INTO activity_log (action, table_name, record_id, details, user_name)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', self._activity)
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        count = len(self._operations)
+        self._operations.clear()
+        self._activity.clear()
+        self._updated_columns.clear()
+        return count
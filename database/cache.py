@@ -0,0 +1,185 @@
+"""
+ذاكرة مؤقتة لنتائج دوال القراءة في طبقة CRUD
+
+- المفتاح: اسم الدالة + المعاملات + تاريخ اليوم (حتى لا تبقى نتائج "اليوم" بعد منتصف الليل)
+- كل نتيجة مرتبطة بالجداول التي تعتمد عليها، وأي كتابة على جدول تحذف نتائجه فقط
+- حد أقصى لعدد النتائج مع حذف الأقدم استخداماً (LRU)
+- عدادات hits / misses / evictions / invalidations
+- الكتابة من عملية أخرى (أدوات سطر الأوامر) تُكتشف بتغير PRAGMA data_version وتمسح الذاكرة بالكامل
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+
+class QueryCache:
+    """ذاكرة LRU مع وسوم (tags) بأسماء الجداول"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, tags, expires_at)
+        self._tag_keys = {}            # tag -> {keys}
+        self._generations = {}         # tag -> رقم يزيد مع كل إبطال
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.external_clears = 0
+        # دالة تعيد PRAGMA data_version (None = بدون كشف الكتابة من عمليات أخرى)
+        self.version_source = None
+        self._data_version = None
+
+    @staticmethod
+    def _copy(value):
+        """نسخة مستقلة حتى لا يعدل المستدعي القيمة المخزنة (DataFrame أو dict)"""
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        if hasattr(value, 'copy'):
+            return value.copy()
+        return value
+
+    def _remove(self, key):
+        """حذف مدخل من الفهرسين (يُستدعى مع القفل)"""
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def _sync_version(self, absorb=False):
+        """مسح الذاكرة إذا تغيرت قاعدة البيانات منذ آخر فحص بدون كتابة من هذه العملية
+
+        absorb=True بعد كتابة من هذه العملية (تم إبطال جداولها بالفعل): تسجيل النسخة الجديدة فقط.
+        """
+        if self.version_source is None:
+            return
+        version = self.version_source()
+        with self._lock:
+            changed = self._data_version is not None and version != self._data_version
+            self._data_version = version
+        if changed and not absorb:
+            self.clear()
+            self.external_clears += 1
+
+    # ========== القراءة والتخزين ==========
+    def get_or_load(self, key, tags, loader, ttl=None):
+        """إرجاع النتيجة المخزنة أو تحميلها بـ loader وتخزينها"""
+        if not self.enabled:
+            return loader()
+
+        self._sync_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None or time.monotonic() < entry[2]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(entry[0])
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            generations = {tag: self._generations.get(tag, 0) for tag in tags}
+
+        value = loader()
+
+        with self._lock:
+            # لا نخزن نتيجة تمت قراءتها قبل كتابة انتهت أثناء التحميل
+            if any(self._generations.get(tag, 0) != generation
+                   for tag, generation in generations.items()):
+                return value
+
+            if key in self._entries:
+                self._remove(key)
+            expires_at = time.monotonic() + ttl if ttl else None
+            self._entries[key] = (self._copy(value), tuple(tags), expires_at)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+        return value
+
+    # ========== الإبطال ==========
+    def invalidate(self, *tags):
+        """حذف كل النتائج المعتمدة على أي من الجداول المذكورة"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._tag_keys.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+        self._sync_version(absorb=True)
+
+    def discard(self, method_name):
+        """حذف كل النتائج المخزنة لدالة معينة"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == method_name]:
+                self._remove(key)
+
+    def clear(self):
+        """مسح الذاكرة بالكامل"""
+        with self._lock:
+            self._entries.clear()
+            self._tag_keys.clear()
+            for tag in self._generations:
+                self._generations[tag] += 1
+
+    def stats(self):
+        """إحصائيات الذاكرة المؤقتة"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'external_clears': self.external_clears,
+            }
+
+
+# ========== المزخرفات (decorators) ==========
+def cached(*tables, ttl=None):
+    """تخزين نتيجة دالة قراءة في self.cache مرتبطة بالجداول المذكورة"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (method.__name__, args, tuple(sorted(kwargs.items())), date.today())
+            try:
+                hash(key)
+            except TypeError:
+                # معاملات غير قابلة للتجزئة: قراءة مباشرة بدون تخزين
+                return method(self, *args, **kwargs)
+            return self.cache.get_or_load(key, tables, lambda: method(self, *args, **kwargs), ttl)
+        return wrapper
+    return decorator
+
+
+def invalidates(*tables):
+    """إبطال نتائج الجداول المذكورة بعد انتهاء دالة الكتابة (بعد commit)
+
+    activity_log يُضاف دائماً لأن كل عمليات الكتابة تسجل نشاطاً.
+    """
+    tags = tables + ('activity_log',)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.cache.invalidate(*tags)
+        return wrapper
+    return decorator
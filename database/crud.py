@@ -1,775 +1,1156 @@
+import json
 import sqlite3
 import pandas as pd
+from contextlib import contextmanager
+from itertools import islice
 from datetime import datetime, date, timedelta
-from .models import db
+from .models import db, PRAGMA_PROFILE
+from .cache import QueryCache, cached, invalidates
+from .batch import Batch
+from .search import build_match_query, rank_expression
+from .phones import normalize_phone
+from .balances import BALANCE_TOLERANCE
+from .scheduling import (AppointmentConflict, DEFAULT_DURATION, find_conflicts, to_clock,
+                         treatment_durations, validate_schedule)
+from .slots import date_window, iter_free_slots, occupancy_bitmaps, parse_working_hours
+
+class QueryBuilder:
+    """بناء شروط WHERE ومعاملاتها تدريجياً
+    
+    القيم الفارغة (None أو "") يتم تجاهلها، لذلك يمكن تمرير الفلاتر الاختيارية مباشرة:
+        QueryBuilder().date_range("a.appointment_date", start, end).equals("a.doctor_id", doctor_id)
+    """
+    
+    def __init__(self):
+        self.conditions = []
+        self.params = []
+    
+    @staticmethod
+    def _value(value):
+        """تحويل التواريخ إلى نص ISO كما هي مخزنة"""
+        if isinstance(value, (date, datetime)):
+            return value.isoformat()
+        return value
+    
+    def where(self, condition, *params):
+        """إضافة شرط خام مع معاملاته"""
+        self.conditions.append(condition)
+        self.params.extend(self._value(param) for param in params)
+        return self
+    
+    def equals(self, column, value):
+        """column = value إذا كانت القيمة غير فارغة"""
+        if value is None or value == "":
+            return self
+        return self.where(f"{column} = ?", value)
+    
+    def date_range(self, column, start_date=None, end_date=None):
+        """start_date <= column <= end_date (كل طرف اختياري)"""
+        if start_date:
+            self.where(f"{column} >= ?", start_date)
+        if end_date:
+            self.where(f"{column} <= ?", end_date)
+        return self
+    
+    def copy(self):
+        """نسخة مستقلة لإضافة شروط دون تعديل الأصل"""
+        builder = QueryBuilder()
+        builder.conditions = list(self.conditions)
+        builder.params = list(self.params)
+        return builder
+    
+    def sql(self):
+        """جملة WHERE (أو نص فارغ بدون شروط)"""
+        return (" WHERE " + " AND ".join(self.conditions)) if self.conditions else ""
 
 class CRUDOperations:
+    # استعلامات أساسية تشترك فيها القوائم الكاملة والمرقمة والتقارير
+    APPOINTMENTS_SELECT = '''
+        SELECT 
+            a.id,
+            a.patient_id,
+            a.doctor_id,
+            a.treatment_id,
+            p.name as patient_name,
+            d.name as doctor_name,
+            t.name as treatment_name,
+            a.appointment_date,
+            a.appointment_time,
+            a.status,
+            a.total_cost,
+            a.notes,
+            a.reminder_sent
+        FROM appointments a
+        LEFT JOIN patients p ON a.patient_id = p.id
+        LEFT JOIN doctors d ON a.doctor_id = d.id
+        LEFT JOIN treatments t ON a.treatment_id = t.id
+    '''
+    
+    PAYMENTS_FROM = "payments pay LEFT JOIN appointments a ON pay.appointment_id = a.id"
+    
+    PAYMENTS_SELECT = '''
+        SELECT 
+            pay.id,
+            pay.appointment_id,
+            pay.patient_id,
+            a.doctor_id,
+            p.name as patient_name,
+            d.name as doctor_name,
+            pay.amount,
+            pay.doctor_share,
+            pay.clinic_share,
+            pay.doctor_percentage,
+            pay.clinic_percentage,
+            pay.payment_method,
+            pay.payment_date,
+            pay.status,
+            pay.notes
+        FROM payments pay
+        LEFT JOIN appointments a ON pay.appointment_id = a.id
+        LEFT JOIN patients p ON pay.patient_id = p.id
+        LEFT JOIN doctors d ON a.doctor_id = d.id
+    '''
+    
+    # مدة صلاحية لقطة لوحة التحكم بالثواني
+    DASHBOARD_TTL = 15
+    # الحد الأقصى لعدد النتائج في الذاكرة المؤقتة
+    CACHE_MAX_ENTRIES = 256
+    
     def __init__(self):
         self.db = db
+        self.cache = QueryCache(max_entries=self.CACHE_MAX_ENTRIES)
+        self.cache.version_source = self.db.data_version
     
     # ========== عمليات الأطباء ==========
+    @invalidates('doctors')
     def create_doctor(self, name, specialization, phone, email, address, hire_date, salary, commission_rate=0.0):
         """إضافة طبيب جديد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO doctors (name, specialization, phone, email, address, hire_date, salary, commission_rate)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (name, specialization, phone, email, address, hire_date, salary, commission_rate))
+            cursor.execute('''
+                INSERT INTO doctors (name, specialization, phone, email, address, hire_date, salary, commission_rate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (name, specialization, phone, email, address, hire_date, salary, commission_rate))
         
-        doctor_id = cursor.lastrowid
+            doctor_id = cursor.lastrowid
         
-        # تسجيل النشاط
-        self.log_activity(conn, "إضافة طبيب", "doctors", doctor_id, f"تم إضافة طبيب: {name}")
+            # تسجيل النشاط
+            self.log_activity(conn, "إضافة طبيب", "doctors", doctor_id, f"تم إضافة طبيب: {name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return doctor_id
     
+    @cached('doctors')
     def get_all_doctors(self, active_only=True):
         """الحصول على جميع الأطباء"""
-        conn = self.db.get_connection()
-        query = "SELECT * FROM doctors"
-        if active_only:
-            query += " WHERE is_active = 1"
-        query += " ORDER BY name"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = "SELECT * FROM doctors"
+            if active_only:
+                query += " WHERE is_active = 1"
+            query += " ORDER BY name"
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @cached('doctors')
     def get_doctor_by_id(self, doctor_id):
         """الحصول على طبيب بواسطة ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
+            result = cursor.fetchone()
         return result
     
+    @invalidates('doctors')
     def update_doctor(self, doctor_id, name, specialization, phone, email, address, salary, commission_rate):
         """تحديث بيانات طبيب"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE doctors 
-            SET name=?, specialization=?, phone=?, email=?, address=?, salary=?, commission_rate=?
-            WHERE id=?
-        ''', (name, specialization, phone, email, address, salary, commission_rate, doctor_id))
+            cursor.execute('''
+                UPDATE doctors 
+                SET name=?, specialization=?, phone=?, email=?, address=?, salary=?, commission_rate=?
+                WHERE id=?
+            ''', (name, specialization, phone, email, address, salary, commission_rate, doctor_id))
         
-        self.log_activity(conn, "تحديث طبيب", "doctors", doctor_id, f"تم تحديث بيانات الطبيب: {name}")
+            self.log_activity(conn, "تحديث طبيب", "doctors", doctor_id, f"تم تحديث بيانات الطبيب: {name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('doctors')
     def delete_doctor(self, doctor_id):
         """حذف طبيب (soft delete)"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE doctors SET is_active = 0 WHERE id = ?", (doctor_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE doctors SET is_active = 0 WHERE id = ?", (doctor_id,))
         
-        self.log_activity(conn, "حذف طبيب", "doctors", doctor_id, f"تم إلغاء تفعيل الطبيب")
+            self.log_activity(conn, "حذف طبيب", "doctors", doctor_id, f"تم إلغاء تفعيل الطبيب")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
     # ========== عمليات المرضى ==========
+    @invalidates('patients')
     def create_patient(self, name, phone, email, address, date_of_birth, gender, medical_history="", 
                       emergency_contact="", blood_type="", allergies="", notes=""):
         """إضافة مريض جديد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO patients (name, phone, email, address, date_of_birth, gender, medical_history, 
-                                emergency_contact, blood_type, allergies, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (name, phone, email, address, date_of_birth, gender, medical_history, 
-              emergency_contact, blood_type, allergies, notes))
+            cursor.execute('''
+                INSERT INTO patients (name, phone, email, address, date_of_birth, gender, medical_history, 
+                                    emergency_contact, blood_type, allergies, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (name, phone, email, address, date_of_birth, gender, medical_history, 
+                  emergency_contact, blood_type, allergies, notes))
         
-        patient_id = cursor.lastrowid
+            patient_id = cursor.lastrowid
         
-        self.log_activity(conn, "إضافة مريض", "patients", patient_id, f"تم إضافة مريض: {name}")
+            self.log_activity(conn, "إضافة مريض", "patients", patient_id, f"تم إضافة مريض: {name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return patient_id
     
+    @cached('patients')
     def get_all_patients(self, active_only=True):
         """الحصول على جميع المرضى"""
-        conn = self.db.get_connection()
-        query = "SELECT * FROM patients"
-        if active_only:
-            query += " WHERE is_active = 1"
-        query += " ORDER BY name"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = "SELECT * FROM patients"
+            if active_only:
+                query += " WHERE is_active = 1"
+            query += " ORDER BY name"
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @cached('patients')
+    def get_patients_page(self, page_size=50, cursor=None, active_only=True):
+        """صفحة من المرضى مرتبة تصاعدياً حسب (الاسم، الرقم)"""
+        filters = QueryBuilder()
+        if active_only:
+            filters.where("is_active = 1")
+        keys = [("name", "name"), ("id", "id")]
+        
+        with self.db.connection() as conn:
+            df, next_cursor = self._keyset_page(conn, "SELECT * FROM patients", filters,
+                                                keys, cursor, page_size, descending=False)
+            total = self._count_estimate(conn, "patients", "patients", filters)
+        
+        return {'data': df, 'next_cursor': next_cursor, 'total_estimate': total}
+    
+    @cached('patients')
     def get_patient_by_id(self, patient_id):
         """الحصول على مريض بواسطة ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM patients WHERE id = ?", (patient_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM patients WHERE id = ?", (patient_id,))
+            result = cursor.fetchone()
         return result
     
+    @cached('patients', 'appointments', 'payments', 'doctors', 'treatments')
+    def get_patient_full_report(self, patient_id):
+        """بيانات التقرير الشامل للمريض: {'patient': dict أو None, 'appointments', 'payments', 'treatments'}"""
+        with self.db.connection() as conn:
+            patient = pd.read_sql_query("SELECT * FROM patients WHERE id = ?", conn, params=(patient_id,))
+            appointments = pd.read_sql_query('''
+                SELECT
+                    a.*,
+                    d.name as doctor_name,
+                    t.name as treatment_name
+                FROM appointments a
+                LEFT JOIN doctors d ON a.doctor_id = d.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE a.patient_id = ?
+                ORDER BY a.appointment_date DESC, a.appointment_time DESC
+            ''', conn, params=(patient_id,))
+            payments = pd.read_sql_query('''
+                SELECT * FROM payments
+                WHERE patient_id = ?
+                ORDER BY payment_date DESC
+            ''', conn, params=(patient_id,))
+        
+        return {
+            'patient': patient.iloc[0].to_dict() if not patient.empty else None,
+            'appointments': appointments,
+            'payments': payments,
+            'treatments': appointments.loc[appointments['treatment_id'].notna(),
+                                           ['treatment_id', 'treatment_name', 'appointment_date']],
+        }
+    
+    @invalidates('patients')
     def update_patient(self, patient_id, name, phone, email, address, date_of_birth, gender, 
                       medical_history, emergency_contact, blood_type="", allergies="", notes=""):
         """تحديث بيانات مريض"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE patients 
-            SET name=?, phone=?, email=?, address=?, date_of_birth=?, gender=?, 
-                medical_history=?, emergency_contact=?, blood_type=?, allergies=?, notes=?
-            WHERE id=?
-        ''', (name, phone, email, address, date_of_birth, gender, medical_history, 
-              emergency_contact, blood_type, allergies, notes, patient_id))
+            cursor.execute('''
+                UPDATE patients 
+                SET name=?, phone=?, email=?, address=?, date_of_birth=?, gender=?, 
+                    medical_history=?, emergency_contact=?, blood_type=?, allergies=?, notes=?
+                WHERE id=?
+            ''', (name, phone, email, address, date_of_birth, gender, medical_history, 
+                  emergency_contact, blood_type, allergies, notes, patient_id))
         
-        self.log_activity(conn, "تحديث مريض", "patients", patient_id, f"تم تحديث بيانات المريض: {name}")
+            self.log_activity(conn, "تحديث مريض", "patients", patient_id, f"تم تحديث بيانات المريض: {name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('patients')
     def delete_patient(self, patient_id):
         """حذف مريض (soft delete)"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE patients SET is_active = 0 WHERE id = ?", (patient_id,))
-        
-        self.log_activity(conn, "حذف مريض", "patients", patient_id, f"تم إلغاء تفعيل المريض")
-        
-        conn.commit()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE patients SET is_active = 0 WHERE id = ?", (patient_id,))
+        
+            self.log_activity(conn, "حذف مريض", "patients", patient_id, f"تم إلغاء تفعيل المريض")
+        
+            conn.commit()
+    
+    @cached('patients')
+    def search_patients(self, search_term, limit=200):
+        """البحث عن مرضى في الاسم والهاتف والبريد والملاحظات والتاريخ المرضي
+        
+        يستخدم فهرس FTS5 (database/search.py) مع تطبيع الحروف العربية والبحث بالبادئة،
+        والنتائج مرتبة حسب درجة المطابقة.
+        """
+        match_query = build_match_query(search_term)
+        with self.db.connection() as conn:
+            if match_query is None:
+                return pd.read_sql_query("SELECT * FROM patients LIMIT 0", conn)
+            query = f'''
+                SELECT p.*
+                FROM patients_fts
+                JOIN patients p ON p.id = patients_fts.rowid
+                WHERE patients_fts MATCH ? AND p.is_active = 1
+                ORDER BY {rank_expression()}
+                LIMIT ?
+            '''
+            df = pd.read_sql_query(query, conn, params=(match_query, limit))
+        return df
     
-    def search_patients(self, search_term):
-        """البحث عن مرضى"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT * FROM patients 
-            WHERE is_active = 1 
-            AND (name LIKE ? OR phone LIKE ? OR email LIKE ?)
-            ORDER BY name
-        '''
-        search_pattern = f"%{search_term}%"
-        df = pd.read_sql_query(query, conn, params=(search_pattern, search_pattern, search_pattern))
-        conn.close()
+    @cached('patients')
+    def find_patient_by_phone(self, phone, include_emergency=False):
+        """المرضى المسجلون برقم هاتف (بأي تنسيق) - بحث مباشر في فهرس phone_digits
+        
+        include_emergency: البحث أيضاً في رقم جهة الاتصال للطوارئ.
+        """
+        digits = normalize_phone(phone)
+        with self.db.connection() as conn:
+            if digits is None:
+                return pd.read_sql_query("SELECT * FROM patients LIMIT 0", conn)
+            query = "SELECT * FROM patients WHERE phone_digits = ? AND is_active = 1"
+            params = [digits]
+            if include_emergency:
+                query += " UNION SELECT * FROM patients WHERE emergency_digits = ? AND is_active = 1"
+                params.append(digits)
+            df = pd.read_sql_query(query + " ORDER BY id", conn, params=params)
         return df
     
     # ========== عمليات العلاجات ==========
+    @invalidates('treatments')
     def create_treatment(self, name, description, base_price, duration_minutes, category, 
                         doctor_percentage=50.0, clinic_percentage=50.0):
         """إضافة علاج جديد مع نسب التقسيم"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO treatments (name, description, base_price, duration_minutes, category, 
-                                  doctor_percentage, clinic_percentage)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (name, description, base_price, duration_minutes, category, doctor_percentage, clinic_percentage))
+            cursor.execute('''
+                INSERT INTO treatments (name, description, base_price, duration_minutes, category, 
+                                      doctor_percentage, clinic_percentage)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (name, description, base_price, duration_minutes, category, doctor_percentage, clinic_percentage))
         
-        treatment_id = cursor.lastrowid
+            treatment_id = cursor.lastrowid
         
-        self.log_activity(conn, "إضافة علاج", "treatments", treatment_id, 
-                         f"تم إضافة علاج: {name} - نسبة الطبيب: {doctor_percentage}%")
+            self.log_activity(conn, "إضافة علاج", "treatments", treatment_id, 
+                             f"تم إضافة علاج: {name} - نسبة الطبيب: {doctor_percentage}%")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return treatment_id
     
+    @cached('treatments')
     def get_all_treatments(self, active_only=True):
         """الحصول على جميع العلاجات"""
-        conn = self.db.get_connection()
-        query = "SELECT * FROM treatments"
-        if active_only:
-            query += " WHERE is_active = 1"
-        query += " ORDER BY name"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = "SELECT * FROM treatments"
+            if active_only:
+                query += " WHERE is_active = 1"
+            query += " ORDER BY name"
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @cached('treatments')
     def get_treatment_by_id(self, treatment_id):
         """الحصول على علاج بواسطة ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM treatments WHERE id = ?", (treatment_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM treatments WHERE id = ?", (treatment_id,))
+            result = cursor.fetchone()
         return result
     
+    @invalidates('treatments')
     def update_treatment(self, treatment_id, name, description, base_price, duration_minutes, 
                         category, doctor_percentage=50.0, clinic_percentage=50.0):
         """تحديث علاج مع نسب التقسيم"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE treatments 
-            SET name=?, description=?, base_price=?, duration_minutes=?, category=?, 
-                doctor_percentage=?, clinic_percentage=?
-            WHERE id=?
-        ''', (name, description, base_price, duration_minutes, category, 
-              doctor_percentage, clinic_percentage, treatment_id))
-        
-        self.log_activity(conn, "تحديث علاج", "treatments", treatment_id, f"تم تحديث علاج: {name}")
+            cursor.execute('''
+                UPDATE treatments 
+                SET name=?, description=?, base_price=?, duration_minutes=?, category=?, 
+                    doctor_percentage=?, clinic_percentage=?
+                WHERE id=?
+            ''', (name, description, base_price, duration_minutes, category, 
+                  doctor_percentage, clinic_percentage, treatment_id))
+        
+            self.log_activity(conn, "تحديث علاج", "treatments", treatment_id, f"تم تحديث علاج: {name}")
+        
+            conn.commit()
+    
+    @invalidates('treatments')
+    def bulk_update_treatment_prices(self, category=None, percentage=None, price_list=None,
+                                     user_name="النظام"):
+        """تحديث أسعار العلاجات دفعة واحدة في معاملة واحدة
+        
+        - percentage: نسبة تغيير لكل العلاجات النشطة في category (أو كل الفئات إذا كانت None)
+        - price_list: [(treatment_id, new_price)] مثل ملف CSV - يُطبق عبر جدول مؤقت
+        يعيد {'diff': DataFrame (id, name, category, old_price, new_price), 'unmatched': [ids]}
+        """
+        if (percentage is None) == (price_list is None):
+            raise ValueError("Pass either percentage or price_list")
+        
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if percentage is not None:
+                    diff, unmatched = self._apply_price_percentage(conn, category, float(percentage))
+                    details = (f"تحديث أسعار {len(diff)} علاج بنسبة {float(percentage):+.1f}%"
+                               f" - الفئة: {category or 'جميع الفئات'}")
+                else:
+                    diff, unmatched = self._apply_price_list(conn, price_list)
+                    details = f"تحديث أسعار {len(diff)} علاج من قائمة أسعار ({len(unmatched)} غير موجود)"
+                
+                self.log_activity(conn, "تحديث أسعار جماعي", "treatments", None, details, user_name)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        return {'diff': diff, 'unmatched': unmatched}
+    
+    @staticmethod
+    def _apply_price_percentage(conn, category, percentage):
+        """UPDATE واحد حسب الفئة مع الاحتفاظ بالأسعار القديمة للمقارنة"""
+        filters = QueryBuilder().where("is_active = 1").equals("category", category)
+        before = pd.read_sql_query(
+            "SELECT id, name, category, base_price as old_price FROM treatments" + filters.sql(),
+            conn, params=filters.params
+        )
+        rows = conn.execute(
+            "UPDATE treatments SET base_price = ROUND(base_price * (1 + ? / 100.0), 2)"
+            + filters.sql() + " RETURNING id, base_price",
+            [percentage] + filters.params
+        ).fetchall()
+        after = pd.DataFrame(rows, columns=['id', 'new_price'])
+        diff = before.merge(after, on='id').sort_values('id', ignore_index=True)
+        return diff, []
+    
+    @staticmethod
+    def _apply_price_list(conn, price_list):
+        """تطبيق قائمة أسعار عبر جدول مؤقت وربطه بجدول العلاجات"""
+        prices = []
+        for treatment_id, new_price in price_list:
+            new_price = float(new_price)
+            if new_price < 0:
+                raise ValueError(f"Negative price for treatment {treatment_id}")
+            prices.append((int(treatment_id), round(new_price, 2)))
+        
+        conn.execute("DROP TABLE IF EXISTS temp.treatment_price_list")
+        conn.execute('''
+            CREATE TEMP TABLE treatment_price_list (
+                treatment_id INTEGER PRIMARY KEY,
+                new_price REAL NOT NULL
+            )
+        ''')
+        try:
+            # آخر سعر لنفس العلاج هو المعتمد
+            conn.executemany("INSERT OR REPLACE INTO temp.treatment_price_list VALUES (?, ?)", prices)
+            
+            diff = pd.read_sql_query('''
+                SELECT t.id, t.name, t.category, t.base_price as old_price, pl.new_price
+                FROM temp.treatment_price_list pl
+                JOIN treatments t ON t.id = pl.treatment_id
+                ORDER BY t.id
+            ''', conn)
+            unmatched = [row[0] for row in conn.execute('''
+                SELECT pl.treatment_id FROM temp.treatment_price_list pl
+                LEFT JOIN treatments t ON t.id = pl.treatment_id
+                WHERE t.id IS NULL
+                ORDER BY pl.treatment_id
+            ''')]
+            
+            conn.execute('''
+                UPDATE treatments SET base_price = pl.new_price
+                FROM temp.treatment_price_list pl
+                WHERE treatments.id = pl.treatment_id
+            ''')
+        finally:
+            conn.execute("DROP TABLE IF EXISTS temp.treatment_price_list")
         
-        conn.commit()
-        conn.close()
+        return diff, unmatched
     
+    @invalidates('treatments')
     def delete_treatment(self, treatment_id):
         """حذف علاج (soft delete)"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE treatments SET is_active = 0 WHERE id = ?", (treatment_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE treatments SET is_active = 0 WHERE id = ?", (treatment_id,))
         
-        self.log_activity(conn, "حذف علاج", "treatments", treatment_id, f"تم إلغاء تفعيل العلاج")
+            self.log_activity(conn, "حذف علاج", "treatments", treatment_id, f"تم إلغاء تفعيل العلاج")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
     # ========== عمليات المواعيد ==========
+    @invalidates('appointments')
     def create_appointment(self, patient_id, doctor_id, treatment_id, appointment_date, 
-                          appointment_time, notes="", total_cost=0.0):
-        """إضافة موعد جديد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO appointments (patient_id, doctor_id, treatment_id, appointment_date, 
-                                    appointment_time, notes, total_cost)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (patient_id, doctor_id, treatment_id, appointment_date, appointment_time, notes, total_cost))
-        
-        appointment_id = cursor.lastrowid
-        
-        self.log_activity(conn, "إضافة موعد", "appointments", appointment_id, 
-                         f"تم حجز موعد في {appointment_date} الساعة {appointment_time}")
-        
-        conn.commit()
-        conn.close()
+                          appointment_time, notes="", total_cost=0.0, allow_conflicts=False):
+        """إضافة موعد جديد (AppointmentConflict إذا كان الطبيب أو المريض محجوزاً إلا مع allow_conflicts)"""
+        with self.db.connection() as conn:
+            # الفحص والإدخال في نفس معاملة الكتابة حتى لا يحجز مستخدمان نفس الوقت معاً
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not allow_conflicts:
+                    conflicts = find_conflicts(conn, doctor_id, patient_id, appointment_date,
+                                               appointment_time, treatment_id)
+                    if conflicts:
+                        raise AppointmentConflict(conflicts)
+                
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO appointments (patient_id, doctor_id, treatment_id, appointment_date, 
+                                            appointment_time, notes, total_cost)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (patient_id, doctor_id, treatment_id, appointment_date, appointment_time, notes, total_cost))
+                
+                appointment_id = cursor.lastrowid
+                
+                self.log_activity(conn, "إضافة موعد", "appointments", appointment_id, 
+                                 f"تم حجز موعد في {appointment_date} الساعة {appointment_time}")
+                
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
         return appointment_id
     
-    def get_all_appointments(self):
-        """الحصول على جميع المواعيد مع تفاصيل المريض والطبيب والعلاج"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                a.id,
-                a.patient_id,
-                a.doctor_id,
-                a.treatment_id,
-                p.name as patient_name,
-                d.name as doctor_name,
-                t.name as treatment_name,
-                a.appointment_date,
-                a.appointment_time,
-                a.status,
-                a.total_cost,
-                a.notes,
-                a.reminder_sent
-            FROM appointments a
-            LEFT JOIN patients p ON a.patient_id = p.id
-            LEFT JOIN doctors d ON a.doctor_id = d.id
-            LEFT JOIN treatments t ON a.treatment_id = t.id
-            ORDER BY a.appointment_date DESC, a.appointment_time DESC
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+    @cached('appointments', 'patients', 'doctors', 'treatments')
+    def check_appointment_conflicts(self, doctor_id, patient_id, appointment_date, appointment_time,
+                                    treatment_id=None, exclude_id=None):
+        """المواعيد المتداخلة مع موعد مقترح (للتنبيه في النموذج قبل الحجز)"""
+        with self.db.connection() as conn:
+            return find_conflicts(conn, doctor_id, patient_id, appointment_date, appointment_time,
+                                  treatment_id, exclude_id)
+    
+    def validate_schedule(self, appointments):
+        """فحص جدول مواعيد مقترح (DataFrame أو قائمة dicts) مقابل قاعدة البيانات ومقابل نفسه"""
+        if isinstance(appointments, pd.DataFrame):
+            appointments = appointments.to_dict('records')
+        with self.db.connection() as conn:
+            conflicts = validate_schedule(conn, appointments)
+        return pd.DataFrame(conflicts, columns=['index', 'kind', 'appointment_id', 'row', 'start', 'end'])
+    
+    @cached('appointments', 'patients', 'doctors', 'treatments')
+    def get_all_appointments(self, start_date=None, end_date=None, doctor_id=None,
+                             patient_id=None, status=None):
+        """الحصول على المواعيد مع تفاصيل المريض والطبيب والعلاج (كل الفلاتر اختيارية)"""
+        filters = self._appointment_filters(start_date, end_date, doctor_id, patient_id, status)
+        query = (self.APPOINTMENTS_SELECT + filters.sql()
+                 + " ORDER BY a.appointment_date DESC, a.appointment_time DESC")
+        with self.db.connection() as conn:
+            df = pd.read_sql_query(query, conn, params=filters.params)
         return df
     
+    @staticmethod
+    def _appointment_filters(start_date=None, end_date=None, doctor_id=None,
+                             patient_id=None, status=None):
+        """شروط المواعيد (الجدول بالاسم المستعار a)"""
+        return (QueryBuilder()
+                .date_range("a.appointment_date", start_date, end_date)
+                .equals("a.doctor_id", doctor_id)
+                .equals("a.patient_id", patient_id)
+                .equals("a.status", status))
+    
+    @cached('appointments', 'patients', 'doctors', 'treatments')
+    def get_appointments_page(self, page_size=50, cursor=None, status=None, doctor_id=None,
+                              patient_id=None, start_date=None, end_date=None):
+        """صفحة من المواعيد مرتبة تنازلياً حسب (التاريخ، الوقت، الرقم)"""
+        filters = self._appointment_filters(start_date, end_date, doctor_id, patient_id, status)
+        keys = [("a.appointment_date", "appointment_date"),
+                ("a.appointment_time", "appointment_time"),
+                ("a.id", "id")]
+        
+        with self.db.connection() as conn:
+            df, next_cursor = self._keyset_page(conn, self.APPOINTMENTS_SELECT, filters, keys,
+                                                cursor, page_size)
+            total = self._count_estimate(conn, "appointments", "appointments a", filters)
+        
+        return {'data': df, 'next_cursor': next_cursor, 'total_estimate': total}
+    
+    @cached('appointments', 'patients', 'doctors', 'treatments')
     def get_appointments_by_date(self, target_date):
         """الحصول على مواعيد يوم محدد"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                a.id,
-                p.name as patient_name,
-                p.phone as patient_phone,
-                d.name as doctor_name,
-                t.name as treatment_name,
-                a.appointment_time,
-                a.status,
-                a.total_cost,
-                a.notes
-            FROM appointments a
-            LEFT JOIN patients p ON a.patient_id = p.id
-            LEFT JOIN doctors d ON a.doctor_id = d.id
-            LEFT JOIN treatments t ON a.treatment_id = t.id
-            WHERE a.appointment_date = ?
-            ORDER BY a.appointment_time
-        '''
-        df = pd.read_sql_query(query, conn, params=(target_date,))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    a.id,
+                    p.name as patient_name,
+                    p.phone as patient_phone,
+                    d.name as doctor_name,
+                    t.name as treatment_name,
+                    a.appointment_time,
+                    a.status,
+                    a.total_cost,
+                    a.notes
+                FROM appointments a
+                LEFT JOIN patients p ON a.patient_id = p.id
+                LEFT JOIN doctors d ON a.doctor_id = d.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE a.appointment_date = ?
+                ORDER BY a.appointment_time
+            '''
+            df = pd.read_sql_query(query, conn, params=(target_date,))
         return df
     
+    @cached('appointments', 'patients', 'doctors', 'treatments')
     def get_appointments_by_doctor(self, doctor_id, start_date=None, end_date=None):
         """الحصول على مواعيد طبيب محدد"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                a.id,
-                a.appointment_date,
-                a.appointment_time,
-                p.name as patient_name,
-                t.name as treatment_name,
-                a.status,
-                a.total_cost
-            FROM appointments a
-            LEFT JOIN patients p ON a.patient_id = p.id
-            LEFT JOIN treatments t ON a.treatment_id = t.id
-            WHERE a.doctor_id = ?
-        '''
-        params = [doctor_id]
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    a.id,
+                    a.appointment_date,
+                    a.appointment_time,
+                    p.name as patient_name,
+                    t.name as treatment_name,
+                    a.status,
+                    a.total_cost
+                FROM appointments a
+                LEFT JOIN patients p ON a.patient_id = p.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE a.doctor_id = ?
+            '''
+            params = [doctor_id]
         
-        if start_date and end_date:
-            query += " AND a.appointment_date BETWEEN ? AND ?"
-            params.extend([start_date, end_date])
+            if start_date and end_date:
+                query += " AND a.appointment_date BETWEEN ? AND ?"
+                params.extend([start_date, end_date])
         
-        query += " ORDER BY a.appointment_date DESC, a.appointment_time DESC"
+            query += " ORDER BY a.appointment_date DESC, a.appointment_time DESC"
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
+            df = pd.read_sql_query(query, conn, params=params)
         return df
     
+    @invalidates('appointments')
     def update_appointment_status(self, appointment_id, status):
         """تحديث حالة الموعد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE appointments SET status = ? WHERE id = ?", (status, appointment_id))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE appointments SET status = ? WHERE id = ?", (status, appointment_id))
         
-        self.log_activity(conn, "تحديث موعد", "appointments", appointment_id, f"تم تغيير الحالة إلى: {status}")
+            self.log_activity(conn, "تحديث موعد", "appointments", appointment_id, f"تم تغيير الحالة إلى: {status}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('appointments')
     def delete_appointment(self, appointment_id):
         """حذف موعد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM appointments WHERE id = ?", (appointment_id,))
         
-        self.log_activity(conn, "حذف موعد", "appointments", appointment_id, f"تم حذف الموعد")
+            self.log_activity(conn, "حذف موعد", "appointments", appointment_id, f"تم حذف الموعد")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @cached('appointments', 'patients', 'doctors', 'treatments')
     def get_upcoming_appointments(self, days=7):
         """الحصول على المواعيد القادمة"""
-        conn = self.db.get_connection()
-        today = date.today().isoformat()
-        future_date = (date.today() + timedelta(days=days)).isoformat()
-        
-        query = '''
-            SELECT 
-                a.id,
-                a.appointment_date,
-                a.appointment_time,
-                p.name as patient_name,
-                p.phone as patient_phone,
-                d.name as doctor_name,
-                t.name as treatment_name,
-                a.status
-            FROM appointments a
-            LEFT JOIN patients p ON a.patient_id = p.id
-            LEFT JOIN doctors d ON a.doctor_id = d.id
-            LEFT JOIN treatments t ON a.treatment_id = t.id
-            WHERE a.appointment_date BETWEEN ? AND ?
-            AND a.status IN ('مجدول', 'مؤكد')
-            ORDER BY a.appointment_date, a.appointment_time
-        '''
-        df = pd.read_sql_query(query, conn, params=(today, future_date))
-        conn.close()
+        with self.db.connection() as conn:
+            today = date.today().isoformat()
+            future_date = (date.today() + timedelta(days=days)).isoformat()
+        
+            query = '''
+                SELECT 
+                    a.id,
+                    a.appointment_date,
+                    a.appointment_time,
+                    p.name as patient_name,
+                    p.phone as patient_phone,
+                    d.name as doctor_name,
+                    t.name as treatment_name,
+                    a.status
+                FROM appointments a
+                LEFT JOIN patients p ON a.patient_id = p.id
+                LEFT JOIN doctors d ON a.doctor_id = d.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE a.appointment_date BETWEEN ? AND ?
+                AND a.status IN ('مجدول', 'مؤكد')
+                ORDER BY a.appointment_date, a.appointment_time
+            '''
+            df = pd.read_sql_query(query, conn, params=(today, future_date))
         return df
     
     # ========== عمليات المدفوعات ==========
+    @invalidates('payments')
     def create_payment(self, appointment_id, patient_id, amount, payment_method, payment_date, notes=""):
         """إضافة دفعة جديدة مع حساب تقسيم الطبيب والعيادة تلقائياً"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        doctor_share = 0.0
-        clinic_share = 0.0
-        doctor_percentage = 0.0
-        clinic_percentage = 0.0
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        # إذا كان هناك موعد، احسب النسب من العلاج
-        if appointment_id:
-            cursor.execute('''
-                SELECT t.doctor_percentage, t.clinic_percentage
-                FROM appointments a
-                LEFT JOIN treatments t ON a.treatment_id = t.id
-                WHERE a.id = ?
-            ''', (appointment_id,))
-            
-            result = cursor.fetchone()
-            
-            if result and result[0] is not None:
-                doctor_percentage = result[0]
-                clinic_percentage = result[1]
+            doctor_share = 0.0
+            clinic_share = 0.0
+            doctor_percentage = 0.0
+            clinic_percentage = 0.0
+        
+            # إذا كان هناك موعد، احسب النسب من العلاج (50/50 إذا لم تحدد نسب)
+            if appointment_id:
+                context = self._billing_context(conn, appointment_id)
+                if context:
+                    doctor_percentage = context['doctor_percentage']
+                    clinic_percentage = context['clinic_percentage']
+                else:
+                    doctor_percentage = 50.0
+                    clinic_percentage = 50.0
                 doctor_share = (amount * doctor_percentage) / 100
                 clinic_share = (amount * clinic_percentage) / 100
             else:
-                doctor_percentage = 50.0
-                clinic_percentage = 50.0
-                doctor_share = amount * 0.5
-                clinic_share = amount * 0.5
-        else:
-            # دفعة بدون موعد، تذهب للعيادة
-            doctor_percentage = 0.0
-            clinic_percentage = 100.0
-            doctor_share = 0.0
-            clinic_share = amount
+                # دفعة بدون موعد، تذهب للعيادة
+                doctor_percentage = 0.0
+                clinic_percentage = 100.0
+                doctor_share = 0.0
+                clinic_share = amount
         
-        cursor.execute('''
-            INSERT INTO payments (
-                appointment_id, patient_id, amount, payment_method, payment_date, notes,
-                doctor_share, clinic_share, doctor_percentage, clinic_percentage
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (appointment_id, patient_id, amount, payment_method, payment_date, notes,
-              doctor_share, clinic_share, doctor_percentage, clinic_percentage))
+            cursor.execute('''
+                INSERT INTO payments (
+                    appointment_id, patient_id, amount, payment_method, payment_date, notes,
+                    doctor_share, clinic_share, doctor_percentage, clinic_percentage
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (appointment_id, patient_id, amount, payment_method, payment_date, notes,
+                  doctor_share, clinic_share, doctor_percentage, clinic_percentage))
         
-        payment_id = cursor.lastrowid
+            payment_id = cursor.lastrowid
         
-        self.log_activity(conn, "إضافة دفعة", "payments", payment_id, 
-                         f"تم إضافة دفعة بمبلغ {amount} - الطبيب: {doctor_share}, العيادة: {clinic_share}")
+            self.log_activity(conn, "إضافة دفعة", "payments", payment_id, 
+                             f"تم إضافة دفعة بمبلغ {amount} - الطبيب: {doctor_share}, العيادة: {clinic_share}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return payment_id
     
-    def get_all_payments(self):
-        """الحصول على جميع المدفوعات مع تفاصيل التقسيم"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                pay.id,
-                pay.appointment_id,
-                p.name as patient_name,
-                pay.amount,
-                pay.doctor_share,
-                pay.clinic_share,
-                pay.doctor_percentage,
-                pay.clinic_percentage,
-                pay.payment_method,
-                pay.payment_date,
-                pay.status,
-                pay.notes
-            FROM payments pay
-            LEFT JOIN patients p ON pay.patient_id = p.id
-            ORDER BY pay.payment_date DESC
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+    @cached('payments', 'appointments', 'patients', 'doctors')
+    def get_all_payments(self, start_date=None, end_date=None, doctor_id=None, patient_id=None,
+                         payment_method=None, status=None):
+        """الحصول على المدفوعات مع تفاصيل التقسيم (كل الفلاتر اختيارية)"""
+        filters = self._payment_filters(start_date, end_date, doctor_id, patient_id,
+                                        payment_method, status)
+        query = self.PAYMENTS_SELECT + filters.sql() + " ORDER BY pay.payment_date DESC"
+        with self.db.connection() as conn:
+            df = pd.read_sql_query(query, conn, params=filters.params)
         return df
     
+    @staticmethod
+    def _payment_filters(start_date=None, end_date=None, doctor_id=None, patient_id=None,
+                         payment_method=None, status=None):
+        """شروط المدفوعات (pay) - الطبيب يؤخذ من الموعد المرتبط (a)"""
+        return (QueryBuilder()
+                .date_range("pay.payment_date", start_date, end_date)
+                .equals("a.doctor_id", doctor_id)
+                .equals("pay.patient_id", patient_id)
+                .equals("pay.payment_method", payment_method)
+                .equals("pay.status", status))
+    
+    @cached('payments', 'appointments', 'patients', 'doctors')
+    def get_payments_page(self, page_size=50, cursor=None, start_date=None, end_date=None,
+                          payment_method=None, patient_id=None, status=None, doctor_id=None):
+        """صفحة من المدفوعات مرتبة تنازلياً حسب (التاريخ، الرقم) مع إجماليات الفلتر"""
+        filters = self._payment_filters(start_date, end_date, doctor_id, patient_id,
+                                        payment_method, status)
+        keys = [("pay.payment_date", "payment_date"), ("pay.id", "id")]
+        
+        with self.db.connection() as conn:
+            df, next_cursor = self._keyset_page(conn, self.PAYMENTS_SELECT, filters, keys,
+                                                cursor, page_size)
+            total = self._count_estimate(conn, "payments", self.PAYMENTS_FROM, filters)
+            totals = conn.execute(
+                f'''
+                SELECT COALESCE(SUM(pay.amount), 0), COALESCE(SUM(pay.doctor_share), 0),
+                       COALESCE(SUM(pay.clinic_share), 0)
+                FROM {self.PAYMENTS_FROM}
+                ''' + filters.sql(), filters.params
+            ).fetchone()
+        
+        return {
+            'data': df,
+            'next_cursor': next_cursor,
+            'total_estimate': total,
+            'totals': {'amount': totals[0], 'doctor_share': totals[1], 'clinic_share': totals[2]}
+        }
+    
+    @invalidates('payments')
     def update_payment_status(self, payment_id, status):
         """تحديث حالة الدفع"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE payments SET status = ? WHERE id = ?", (status, payment_id))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE payments SET status = ? WHERE id = ?", (status, payment_id))
         
-        self.log_activity(conn, "تحديث دفعة", "payments", payment_id, f"تم تغيير الحالة إلى: {status}")
+            self.log_activity(conn, "تحديث دفعة", "payments", payment_id, f"تم تغيير الحالة إلى: {status}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('payments')
     def delete_payment(self, payment_id):
         """حذف دفعة"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM payments WHERE id = ?", (payment_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM payments WHERE id = ?", (payment_id,))
         
-        self.log_activity(conn, "حذف دفعة", "payments", payment_id, f"تم حذف الدفعة")
+            self.log_activity(conn, "حذف دفعة", "payments", payment_id, f"تم حذف الدفعة")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+    
+    @cached('payments', 'appointments', 'patients')
+    def get_receivables(self):
+        """المرضى الذين عليهم مبالغ متبقية من دفتر الأرصدة (الأكبر رصيداً أولاً)"""
+        query = f'''
+            SELECT
+                p.id,
+                p.name,
+                p.phone,
+                b.charged,
+                b.paid,
+                b.balance
+            FROM patient_balances b
+            JOIN patients p ON p.id = b.patient_id
+            WHERE b.balance > {BALANCE_TOLERANCE} AND p.is_active = 1
+            ORDER BY b.balance DESC
+        '''
+        with self.db.connection() as conn:
+            df = pd.read_sql_query(query, conn)
+        return df
     
     # ========== عمليات المخزون ==========
+    @invalidates('inventory')
     def create_inventory_item(self, item_name, category, quantity, unit_price, min_stock_level, 
                              supplier_id=None, expiry_date=None, location="", barcode=""):
         """إضافة عنصر مخزون جديد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO inventory (item_name, category, quantity, unit_price, min_stock_level, 
-                                 supplier_id, expiry_date, location, barcode)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (item_name, category, quantity, unit_price, min_stock_level, 
-              supplier_id, expiry_date, location, barcode))
+            cursor.execute('''
+                INSERT INTO inventory (item_name, category, quantity, unit_price, min_stock_level, 
+                                     supplier_id, expiry_date, location, barcode)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (item_name, category, quantity, unit_price, min_stock_level, 
+                  supplier_id, expiry_date, location, barcode))
         
-        item_id = cursor.lastrowid
+            item_id = cursor.lastrowid
         
-        self.log_activity(conn, "إضافة مخزون", "inventory", item_id, 
-                         f"تم إضافة صنف: {item_name} - الكمية: {quantity}")
+            self.log_activity(conn, "إضافة مخزون", "inventory", item_id, 
+                             f"تم إضافة صنف: {item_name} - الكمية: {quantity}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return item_id
     
+    @cached('inventory', 'suppliers')
     def get_all_inventory(self, active_only=True):
         """الحصول على جميع عناصر المخزون"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                i.*,
-                s.name as supplier_name
-            FROM inventory i
-            LEFT JOIN suppliers s ON i.supplier_id = s.id
-        '''
-        if active_only:
-            query += " WHERE i.is_active = 1"
-        query += " ORDER BY i.item_name"
-        
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    i.*,
+                    s.name as supplier_name
+                FROM inventory i
+                LEFT JOIN suppliers s ON i.supplier_id = s.id
+            '''
+            if active_only:
+                query += " WHERE i.is_active = 1"
+            query += " ORDER BY i.item_name"
+        
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @cached('inventory')
     def get_low_stock_items(self):
         """الحصول على العناصر قليلة المخزون"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT * FROM inventory 
-            WHERE quantity <= min_stock_level 
-            AND is_active = 1
-            ORDER BY quantity
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT * FROM inventory 
+                WHERE quantity <= min_stock_level 
+                AND is_active = 1
+                ORDER BY quantity
+            '''
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @invalidates('inventory')
     def update_inventory_quantity(self, item_id, quantity, operation="set"):
         """تحديث كمية المخزون"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        if operation == "set":
-            cursor.execute("UPDATE inventory SET quantity = ? WHERE id = ?", (quantity, item_id))
-        elif operation == "add":
-            cursor.execute("UPDATE inventory SET quantity = quantity + ? WHERE id = ?", (quantity, item_id))
-        elif operation == "subtract":
-            cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE id = ?", (quantity, item_id))
+            if operation == "set":
+                cursor.execute("UPDATE inventory SET quantity = ? WHERE id = ?", (quantity, item_id))
+            elif operation == "add":
+                cursor.execute("UPDATE inventory SET quantity = quantity + ? WHERE id = ?", (quantity, item_id))
+            elif operation == "subtract":
+                cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE id = ?", (quantity, item_id))
         
-        self.log_activity(conn, "تحديث مخزون", "inventory", item_id, 
-                         f"تم تحديث الكمية - العملية: {operation}, القيمة: {quantity}")
+            self.log_activity(conn, "تحديث مخزون", "inventory", item_id, 
+                             f"تم تحديث الكمية - العملية: {operation}, القيمة: {quantity}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('inventory')
     def update_inventory_item(self, item_id, item_name, category, quantity, unit_price, 
                              min_stock_level, supplier_id, expiry_date, location, barcode):
         """تحديث عنصر مخزون"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE inventory 
-            SET item_name=?, category=?, quantity=?, unit_price=?, min_stock_level=?, 
-                supplier_id=?, expiry_date=?, location=?, barcode=?
-            WHERE id=?
-        ''', (item_name, category, quantity, unit_price, min_stock_level, 
-              supplier_id, expiry_date, location, barcode, item_id))
+            cursor.execute('''
+                UPDATE inventory 
+                SET item_name=?, category=?, quantity=?, unit_price=?, min_stock_level=?, 
+                    supplier_id=?, expiry_date=?, location=?, barcode=?
+                WHERE id=?
+            ''', (item_name, category, quantity, unit_price, min_stock_level, 
+                  supplier_id, expiry_date, location, barcode, item_id))
         
-        self.log_activity(conn, "تحديث مخزون", "inventory", item_id, f"تم تحديث صنف: {item_name}")
+            self.log_activity(conn, "تحديث مخزون", "inventory", item_id, f"تم تحديث صنف: {item_name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('inventory')
     def delete_inventory_item(self, item_id):
         """حذف عنصر مخزون"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE inventory SET is_active = 0 WHERE id = ?", (item_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE inventory SET is_active = 0 WHERE id = ?", (item_id,))
         
-        self.log_activity(conn, "حذف مخزون", "inventory", item_id, f"تم إلغاء تفعيل الصنف")
+            self.log_activity(conn, "حذف مخزون", "inventory", item_id, f"تم إلغاء تفعيل الصنف")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('inventory', 'inventory_usage')
     def add_inventory_usage(self, inventory_id, appointment_id, quantity_used, usage_date, notes=""):
         """تسجيل استخدام مخزون"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO inventory_usage (inventory_id, appointment_id, quantity_used, usage_date, notes)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (inventory_id, appointment_id, quantity_used, usage_date, notes))
+            cursor.execute('''
+                INSERT INTO inventory_usage (inventory_id, appointment_id, quantity_used, usage_date, notes)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (inventory_id, appointment_id, quantity_used, usage_date, notes))
         
-        # تحديث الكمية
-        cursor.execute('''
-            UPDATE inventory SET quantity = quantity - ? WHERE id = ?
-        ''', (quantity_used, inventory_id))
+            # تحديث الكمية
+            cursor.execute('''
+                UPDATE inventory SET quantity = quantity - ? WHERE id = ?
+            ''', (quantity_used, inventory_id))
         
-        usage_id = cursor.lastrowid
+            usage_id = cursor.lastrowid
         
-        self.log_activity(conn, "استخدام مخزون", "inventory_usage", usage_id, 
-                         f"تم استخدام {quantity_used} من الصنف {inventory_id}")
+            self.log_activity(conn, "استخدام مخزون", "inventory_usage", usage_id, 
+                             f"تم استخدام {quantity_used} من الصنف {inventory_id}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return usage_id
     
     # ========== عمليات الموردين ==========
+    @invalidates('suppliers')
     def create_supplier(self, name, contact_person, phone, email, address, payment_terms):
         """إضافة مورد جديد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO suppliers (name, contact_person, phone, email, address, payment_terms)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (name, contact_person, phone, email, address, payment_terms))
+            cursor.execute('''
+                INSERT INTO suppliers (name, contact_person, phone, email, address, payment_terms)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, contact_person, phone, email, address, payment_terms))
         
-        supplier_id = cursor.lastrowid
+            supplier_id = cursor.lastrowid
         
-        self.log_activity(conn, "إضافة مورد", "suppliers", supplier_id, f"تم إضافة مورد: {name}")
+            self.log_activity(conn, "إضافة مورد", "suppliers", supplier_id, f"تم إضافة مورد: {name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return supplier_id
     
+    @cached('suppliers')
     def get_all_suppliers(self, active_only=True):
         """الحصول على جميع الموردين"""
-        conn = self.db.get_connection()
-        query = "SELECT * FROM suppliers"
-        if active_only:
-            query += " WHERE is_active = 1"
-        query += " ORDER BY name"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = "SELECT * FROM suppliers"
+            if active_only:
+                query += " WHERE is_active = 1"
+            query += " ORDER BY name"
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @cached('suppliers')
     def get_supplier_by_id(self, supplier_id):
         """الحصول على مورد بواسطة ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM suppliers WHERE id = ?", (supplier_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM suppliers WHERE id = ?", (supplier_id,))
+            result = cursor.fetchone()
         return result
     
+    @invalidates('suppliers')
     def update_supplier(self, supplier_id, name, contact_person, phone, email, address, payment_terms):
         """تحديث بيانات مورد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE suppliers 
-            SET name=?, contact_person=?, phone=?, email=?, address=?, payment_terms=?
-            WHERE id=?
-        ''', (name, contact_person, phone, email, address, payment_terms, supplier_id))
+            cursor.execute('''
+                UPDATE suppliers 
+                SET name=?, contact_person=?, phone=?, email=?, address=?, payment_terms=?
+                WHERE id=?
+            ''', (name, contact_person, phone, email, address, payment_terms, supplier_id))
         
-        self.log_activity(conn, "تحديث مورد", "suppliers", supplier_id, f"تم تحديث بيانات المورد: {name}")
+            self.log_activity(conn, "تحديث مورد", "suppliers", supplier_id, f"تم تحديث بيانات المورد: {name}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('suppliers')
     def delete_supplier(self, supplier_id):
         """حذف مورد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE suppliers SET is_active = 0 WHERE id = ?", (supplier_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE suppliers SET is_active = 0 WHERE id = ?", (supplier_id,))
         
-        self.log_activity(conn, "حذف مورد", "suppliers", supplier_id, f"تم إلغاء تفعيل المورد")
+            self.log_activity(conn, "حذف مورد", "suppliers", supplier_id, f"تم إلغاء تفعيل المورد")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
     # ========== عمليات المصروفات ==========
+    @invalidates('expenses')
     def create_expense(self, category, description, amount, expense_date, payment_method, 
                       receipt_number="", notes="", approved_by="", is_recurring=False):
         """إضافة مصروف جديد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO expenses (category, description, amount, expense_date, payment_method, 
-                                receipt_number, notes, approved_by, is_recurring)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (category, description, amount, expense_date, payment_method, 
-              receipt_number, notes, approved_by, is_recurring))
+            cursor.execute('''
+                INSERT INTO expenses (category, description, amount, expense_date, payment_method, 
+                                    receipt_number, notes, approved_by, is_recurring)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (category, description, amount, expense_date, payment_method, 
+                  receipt_number, notes, approved_by, is_recurring))
         
-        expense_id = cursor.lastrowid
+            expense_id = cursor.lastrowid
         
-        self.log_activity(conn, "إضافة مصروف", "expenses", expense_id, 
-                         f"تم إضافة مصروف: {description} - المبلغ: {amount}")
+            self.log_activity(conn, "إضافة مصروف", "expenses", expense_id, 
+                             f"تم إضافة مصروف: {description} - المبلغ: {amount}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         return expense_id
     
-    def get_all_expenses(self):
-        """الحصول على جميع المصروفات"""
-        conn = self.db.get_connection()
-        df = pd.read_sql_query("SELECT * FROM expenses ORDER BY expense_date DESC", conn)
-        conn.close()
+    @cached('expenses')
+    def get_all_expenses(self, start_date=None, end_date=None, category=None):
+        """الحصول على المصروفات (كل الفلاتر اختيارية)"""
+        filters = self._expense_filters(start_date, end_date, category)
+        query = "SELECT * FROM expenses" + filters.sql() + " ORDER BY expense_date DESC"
+        with self.db.connection() as conn:
+            df = pd.read_sql_query(query, conn, params=filters.params)
         return df
     
+    @staticmethod
+    def _expense_filters(start_date=None, end_date=None, category=None):
+        """شروط المصروفات"""
+        return (QueryBuilder()
+                .date_range("expense_date", start_date, end_date)
+                .equals("category", category))
+    
+    @cached('expenses')
+    def get_expenses_page(self, page_size=50, cursor=None, category=None,
+                          start_date=None, end_date=None):
+        """صفحة من المصروفات مرتبة تنازلياً حسب (التاريخ، الرقم) مع إجمالي الفلتر"""
+        filters = self._expense_filters(start_date, end_date, category)
+        keys = [("expense_date", "expense_date"), ("id", "id")]
+        
+        with self.db.connection() as conn:
+            df, next_cursor = self._keyset_page(conn, "SELECT * FROM expenses", filters,
+                                                keys, cursor, page_size)
+            total = self._count_estimate(conn, "expenses", "expenses", filters)
+            total_amount = conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM expenses" + filters.sql(), filters.params
+            ).fetchone()[0]
+        
+        return {'data': df, 'next_cursor': next_cursor, 'total_estimate': total,
+                'totals': {'amount': total_amount}}
+    
+    @cached('expenses')
+    def get_expense_categories(self):
+        """فئات المصروفات المستخدمة"""
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT DISTINCT category FROM expenses ORDER BY category").fetchall()
+        return [row[0] for row in rows]
+    
+    @cached('expenses')
     def get_expense_by_id(self, expense_id):
         """الحصول على مصروف بواسطة ID"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,))
+            result = cursor.fetchone()
         return result
     
+    @invalidates('expenses')
     def update_expense(self, expense_id, category, description, amount, expense_date, 
                       payment_method, receipt_number, notes, approved_by, is_recurring):
         """تحديث مصروف"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE expenses 
-            SET category=?, description=?, amount=?, expense_date=?, payment_method=?, 
-                receipt_number=?, notes=?, approved_by=?, is_recurring=?
-            WHERE id=?
-        ''', (category, description, amount, expense_date, payment_method, 
-              receipt_number, notes, approved_by, is_recurring, expense_id))
+            cursor.execute('''
+                UPDATE expenses 
+                SET category=?, description=?, amount=?, expense_date=?, payment_method=?, 
+                    receipt_number=?, notes=?, approved_by=?, is_recurring=?
+                WHERE id=?
+            ''', (category, description, amount, expense_date, payment_method, 
+                  receipt_number, notes, approved_by, is_recurring, expense_id))
         
-        self.log_activity(conn, "تحديث مصروف", "expenses", expense_id, f"تم تحديث المصروف: {description}")
+            self.log_activity(conn, "تحديث مصروف", "expenses", expense_id, f"تم تحديث المصروف: {description}")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
+    @invalidates('expenses')
     def delete_expense(self, expense_id):
         """حذف مصروف"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
         
-        self.log_activity(conn, "حذف مصروف", "expenses", expense_id, f"تم حذف المصروف")
+            self.log_activity(conn, "حذف مصروف", "expenses", expense_id, f"تم حذف المصروف")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
     # ========== تقارير وإحصائيات أساسية ==========
+    @cached('payments', 'expenses')
     def get_financial_summary(self, start_date=None, end_date=None):
-        """الحصول على ملخص مالي"""
-        conn = self.db.get_connection()
-        
-        # إجمالي المدفوعات
-        payments_query = "SELECT COALESCE(SUM(amount), 0) as total_payments FROM payments"
-        if start_date and end_date:
-            payments_query += f" WHERE payment_date BETWEEN '{start_date}' AND '{end_date}'"
-        
-        # إجمالي المصروفات
-        expenses_query = "SELECT COALESCE(SUM(amount), 0) as total_expenses FROM expenses"
+        """الحصول على ملخص مالي (من الجداول التجميعية اليومية)"""
+        revenue_filters = QueryBuilder()
+        expense_filters = QueryBuilder()
         if start_date and end_date:
-            expenses_query += f" WHERE expense_date BETWEEN '{start_date}' AND '{end_date}'"
-        
-        total_payments = pd.read_sql_query(payments_query, conn).iloc[0]['total_payments']
-        total_expenses = pd.read_sql_query(expenses_query, conn).iloc[0]['total_expenses']
-        
-        conn.close()
+            revenue_filters.date_range("day", start_date, end_date)
+            expense_filters.date_range("day", start_date, end_date)
+        
+        with self.db.connection() as conn:
+            total_payments = conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM daily_revenue" + revenue_filters.sql(),
+                revenue_filters.params
+            ).fetchone()[0]
+            total_expenses = conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM daily_expenses" + expense_filters.sql(),
+                expense_filters.params
+            ).fetchone()[0]
         
         return {
             'total_revenue': total_payments,
@@ -777,414 +1158,801 @@ class CRUDOperations:
             'net_profit': total_payments - total_expenses
         }
     
+    @cached('appointments')
     def get_daily_appointments_count(self):
         """عدد المواعيد اليومية"""
-        conn = self.db.get_connection()
-        today = date.today().isoformat()
-        query = "SELECT COUNT(*) as count FROM appointments WHERE appointment_date = ?"
-        result = pd.read_sql_query(query, conn, params=(today,))
-        conn.close()
+        with self.db.connection() as conn:
+            today = date.today().isoformat()
+            query = "SELECT COALESCE(SUM(appointment_count), 0) as count FROM daily_appointments WHERE day = ?"
+            result = pd.read_sql_query(query, conn, params=(today,))
         return result.iloc[0]['count'] if not result.empty else 0
     
     # ========== تقارير متقدمة ==========
     
+    @cached('payments')
     def get_revenue_by_period(self, start_date, end_date, group_by='day'):
         """الإيرادات حسب الفترة الزمنية"""
-        conn = self.db.get_connection()
-        
-        if group_by == 'day':
-            date_format = '%Y-%m-%d'
-        elif group_by == 'month':
-            date_format = '%Y-%m'
-        elif group_by == 'year':
-            date_format = '%Y'
-        else:
-            date_format = '%Y-%m-%d'
-        
-        query = f'''
-            SELECT 
-                strftime('{date_format}', payment_date) as period,
-                SUM(amount) as total_revenue,
-                COUNT(*) as payment_count
-            FROM payments
-            WHERE payment_date BETWEEN ? AND ?
-            GROUP BY period
-            ORDER BY period
-        '''
-        
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+        
+            if group_by == 'day':
+                date_format = '%Y-%m-%d'
+            elif group_by == 'month':
+                date_format = '%Y-%m'
+            elif group_by == 'year':
+                date_format = '%Y'
+            else:
+                date_format = '%Y-%m-%d'
+        
+            query = f'''
+                SELECT 
+                    strftime('{date_format}', day) as period,
+                    SUM(amount) as total_revenue,
+                    SUM(payment_count) as payment_count
+                FROM daily_revenue
+                WHERE day BETWEEN ? AND ?
+                GROUP BY period
+                ORDER BY period
+            '''
+        
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('expenses')
     def get_expenses_by_category(self, start_date, end_date):
         """المصروفات حسب الفئة"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                category,
-                SUM(amount) as total,
-                COUNT(*) as count
-            FROM expenses
-            WHERE expense_date BETWEEN ? AND ?
-            GROUP BY category
-            ORDER BY total DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    category,
+                    SUM(amount) as total,
+                    SUM(expense_count) as count
+                FROM daily_expenses
+                WHERE day BETWEEN ? AND ?
+                GROUP BY category
+                ORDER BY total DESC
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('appointments', 'doctors', 'payments')
     def get_doctor_performance(self, start_date, end_date):
         """أداء الأطباء"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                d.name as doctor_name,
-                d.specialization,
-                COUNT(a.id) as total_appointments,
-                SUM(CASE WHEN a.status = 'مكتمل' THEN 1 ELSE 0 END) as completed_appointments,
-                COALESCE(SUM(a.total_cost), 0) as total_revenue,
-                COALESCE(AVG(a.total_cost), 0) as avg_revenue_per_appointment,
-                d.commission_rate,
-                COALESCE((SUM(a.total_cost) * d.commission_rate / 100), 0) as total_commission
-            FROM doctors d
-            LEFT JOIN appointments a ON d.id = a.doctor_id 
-                AND a.appointment_date BETWEEN ? AND ?
-            WHERE d.is_active = 1
-            GROUP BY d.id, d.name, d.specialization, d.commission_rate
-            ORDER BY total_revenue DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    d.name as doctor_name,
+                    d.specialization,
+                    COUNT(a.id) as total_appointments,
+                    SUM(CASE WHEN a.status = 'مكتمل' THEN 1 ELSE 0 END) as completed_appointments,
+                    COALESCE(SUM(a.total_cost), 0) as total_revenue,
+                    COALESCE(AVG(a.total_cost), 0) as avg_revenue_per_appointment,
+                    d.commission_rate,
+                    COALESCE((SUM(a.total_cost) * d.commission_rate / 100), 0) as total_commission
+                FROM doctors d
+                LEFT JOIN appointments a ON d.id = a.doctor_id 
+                    AND a.appointment_date BETWEEN ? AND ?
+                WHERE d.is_active = 1
+                GROUP BY d.id, d.name, d.specialization, d.commission_rate
+                ORDER BY total_revenue DESC
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('appointments', 'treatments')
     def get_treatment_popularity(self, start_date, end_date):
         """العلاجات الأكثر طلباً"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                t.name as treatment_name,
-                t.category,
-                COUNT(a.id) as booking_count,
-                COALESCE(SUM(a.total_cost), 0) as total_revenue,
-                COALESCE(AVG(a.total_cost), 0) as avg_price
-            FROM treatments t
-            LEFT JOIN appointments a ON t.id = a.treatment_id
-            WHERE a.appointment_date BETWEEN ? AND ?
-            GROUP BY t.id, t.name, t.category
-            HAVING booking_count > 0
-            ORDER BY booking_count DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    t.name as treatment_name,
+                    t.category,
+                    COUNT(a.id) as booking_count,
+                    COALESCE(SUM(a.total_cost), 0) as total_revenue,
+                    COALESCE(AVG(a.total_cost), 0) as avg_price
+                FROM treatments t
+                LEFT JOIN appointments a ON t.id = a.treatment_id
+                WHERE a.appointment_date BETWEEN ? AND ?
+                GROUP BY t.id, t.name, t.category
+                HAVING booking_count > 0
+                ORDER BY booking_count DESC
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('patients')
     def get_patient_statistics(self):
         """إحصائيات المرضى"""
-        conn = self.db.get_connection()
-        
-        # إحصائيات حسب الجنس
-        gender_query = '''
-            SELECT gender, COUNT(*) as count
-            FROM patients
-            WHERE is_active = 1
-            GROUP BY gender
-        '''
-        gender_df = pd.read_sql_query(gender_query, conn)
-        
-        # إحصائيات حسب العمر
-        age_query = '''
-            SELECT 
-                CASE 
-                    WHEN (julianday('now') - julianday(date_of_birth)) / 365 < 18 THEN 'أقل من 18'
-                    WHEN (julianday('now') - julianday(date_of_birth)) / 365 BETWEEN 18 AND 30 THEN '18-30'
-                    WHEN (julianday('now') - julianday(date_of_birth)) / 365 BETWEEN 31 AND 50 THEN '31-50'
-                    ELSE 'أكثر من 50'
-                END as age_group,
-                COUNT(*) as count
-            FROM patients
-            WHERE date_of_birth IS NOT NULL AND is_active = 1
-            GROUP BY age_group
-        '''
-        age_df = pd.read_sql_query(age_query, conn)
+        with self.db.connection() as conn:
+        
+            # إحصائيات حسب الجنس
+            gender_query = '''
+                SELECT gender, COUNT(*) as count
+                FROM patients
+                WHERE is_active = 1
+                GROUP BY gender
+            '''
+            gender_df = pd.read_sql_query(gender_query, conn)
+        
+            # إحصائيات حسب العمر
+            age_query = '''
+                SELECT 
+                    CASE 
+                        WHEN (julianday('now') - julianday(date_of_birth)) / 365 < 18 THEN 'أقل من 18'
+                        WHEN (julianday('now') - julianday(date_of_birth)) / 365 BETWEEN 18 AND 30 THEN '18-30'
+                        WHEN (julianday('now') - julianday(date_of_birth)) / 365 BETWEEN 31 AND 50 THEN '31-50'
+                        ELSE 'أكثر من 50'
+                    END as age_group,
+                    COUNT(*) as count
+                FROM patients
+                WHERE date_of_birth IS NOT NULL AND is_active = 1
+                GROUP BY age_group
+            '''
+            age_df = pd.read_sql_query(age_query, conn)
         
-        conn.close()
         return {'gender': gender_df, 'age': age_df}
     
+    @cached('appointments')
     def get_appointment_status_stats(self, start_date, end_date):
         """إحصائيات حالة المواعيد"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                status,
-                COUNT(*) as count,
-                COALESCE(SUM(total_cost), 0) as total_revenue
-            FROM appointments
-            WHERE appointment_date BETWEEN ? AND ?
-            GROUP BY status
-            ORDER BY count DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    status,
+                    SUM(appointment_count) as count,
+                    COALESCE(SUM(total_cost), 0) as total_revenue
+                FROM daily_appointments
+                WHERE day BETWEEN ? AND ?
+                GROUP BY status
+                ORDER BY count DESC
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('payments')
     def get_payment_methods_stats(self, start_date, end_date):
         """إحصائيات طرق الدفع"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                payment_method,
-                COUNT(*) as count,
-                SUM(amount) as total
-            FROM payments
-            WHERE payment_date BETWEEN ? AND ?
-            GROUP BY payment_method
-            ORDER BY total DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    payment_method,
+                    SUM(payment_count) as count,
+                    SUM(amount) as total
+                FROM daily_revenue
+                WHERE day BETWEEN ? AND ?
+                GROUP BY payment_method
+                ORDER BY total DESC
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('inventory')
     def get_inventory_value(self):
         """قيمة المخزون الإجمالية"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                category,
-                SUM(quantity * unit_price) as total_value,
-                SUM(quantity) as total_quantity,
-                COUNT(*) as item_count
-            FROM inventory
-            WHERE is_active = 1
-            GROUP BY category
-            ORDER BY total_value DESC
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    category,
+                    SUM(quantity * unit_price) as total_value,
+                    SUM(quantity) as total_quantity,
+                    COUNT(*) as item_count
+                FROM inventory
+                WHERE is_active = 1
+                GROUP BY category
+                ORDER BY total_value DESC
+            '''
+            df = pd.read_sql_query(query, conn)
         return df
     
+    @cached('appointments', 'patients')
     def get_top_patients(self, start_date, end_date, limit=10):
         """أكثر المرضى زيارة"""
-        conn = self.db.get_connection()
-        query = f'''
-            SELECT 
-                p.name as patient_name,
-                p.phone,
-                COUNT(a.id) as visit_count,
-                COALESCE(SUM(a.total_cost), 0) as total_spent,
-                MAX(a.appointment_date) as last_visit
-            FROM patients p
-            LEFT JOIN appointments a ON p.id = a.patient_id
-            WHERE a.appointment_date BETWEEN ? AND ?
-            AND p.is_active = 1
-            GROUP BY p.id, p.name, p.phone
-            HAVING visit_count > 0
-            ORDER BY visit_count DESC
-            LIMIT {limit}
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = f'''
+                SELECT 
+                    p.name as patient_name,
+                    p.phone,
+                    COUNT(a.id) as visit_count,
+                    COALESCE(SUM(a.total_cost), 0) as total_spent,
+                    MAX(a.appointment_date) as last_visit
+                FROM patients p
+                LEFT JOIN appointments a ON p.id = a.patient_id
+                WHERE a.appointment_date BETWEEN ? AND ?
+                AND p.is_active = 1
+                GROUP BY p.id, p.name, p.phone
+                HAVING visit_count > 0
+                ORDER BY visit_count DESC
+                LIMIT {limit}
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('payments')
     def get_daily_revenue_comparison(self, days=30):
         """مقارنة الإيرادات اليومية"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                payment_date,
-                SUM(amount) as daily_revenue,
-                COUNT(*) as payment_count
-            FROM payments
-            WHERE payment_date >= date('now', ?)
-            GROUP BY payment_date
-            ORDER BY payment_date
-        '''
-        df = pd.read_sql_query(query, conn, params=(f'-{days} days',))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    day as payment_date,
+                    SUM(amount) as daily_revenue,
+                    SUM(payment_count) as payment_count
+                FROM daily_revenue
+                WHERE day >= date('now', ?)
+                GROUP BY day
+                ORDER BY day
+            '''
+            df = pd.read_sql_query(query, conn, params=(f'-{days} days',))
         return df
     
+    @cached('inventory', 'suppliers')
     def get_expiring_inventory(self, days=60):
         """المخزون قريب الانتهاء"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                i.item_name,
-                i.category,
-                i.quantity,
-                i.expiry_date,
-                s.name as supplier_name,
-                CAST((julianday(i.expiry_date) - julianday('now')) AS INTEGER) as days_to_expire
-            FROM inventory i
-            LEFT JOIN suppliers s ON i.supplier_id = s.id
-            WHERE i.expiry_date IS NOT NULL
-            AND i.is_active = 1
-            AND julianday(i.expiry_date) - julianday('now') <= ?
-            ORDER BY days_to_expire
-        '''
-        df = pd.read_sql_query(query, conn, params=(days,))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    i.item_name,
+                    i.category,
+                    i.quantity,
+                    i.expiry_date,
+                    s.name as supplier_name,
+                    CAST((julianday(i.expiry_date) - julianday('now')) AS INTEGER) as days_to_expire
+                FROM inventory i
+                LEFT JOIN suppliers s ON i.supplier_id = s.id
+                WHERE i.expiry_date IS NOT NULL
+                AND i.is_active = 1
+                AND i.expiry_date <= date('now', ?)
+                ORDER BY days_to_expire
+            '''
+            df = pd.read_sql_query(query, conn, params=(f'+{days} days',))
         return df
     
+    @cached('payments', 'expenses')
     def get_monthly_comparison(self, months=6):
         """مقارنة شهرية للإيرادات والمصروفات"""
-        conn = self.db.get_connection()
-        
-        # الإيرادات الشهرية
-        revenue_query = '''
-            SELECT 
-                strftime('%Y-%m', payment_date) as month,
-                SUM(amount) as revenue
-            FROM payments
-            WHERE payment_date >= date('now', ?)
-            GROUP BY month
-            ORDER BY month
-        '''
-        
-        # المصروفات الشهرية
-        expenses_query = '''
-            SELECT 
-                strftime('%Y-%m', expense_date) as month,
-                SUM(amount) as expenses
-            FROM expenses
-            WHERE expense_date >= date('now', ?)
-            GROUP BY month
-            ORDER BY month
-        '''
-        
-        revenue_df = pd.read_sql_query(revenue_query, conn, params=(f'-{months} months',))
-        expenses_df = pd.read_sql_query(expenses_query, conn, params=(f'-{months} months',))
-        
-        # دمج البيانات
-        result = pd.merge(revenue_df, expenses_df, on='month', how='outer').fillna(0)
-        result['profit'] = result['revenue'] - result['expenses']
+        with self.db.connection() as conn:
+        
+            # الإيرادات الشهرية
+            revenue_query = '''
+                SELECT 
+                    strftime('%Y-%m', day) as month,
+                    SUM(amount) as revenue
+                FROM daily_revenue
+                WHERE day >= date('now', ?)
+                GROUP BY month
+                ORDER BY month
+            '''
+        
+            # المصروفات الشهرية
+            expenses_query = '''
+                SELECT 
+                    strftime('%Y-%m', day) as month,
+                    SUM(amount) as expenses
+                FROM daily_expenses
+                WHERE day >= date('now', ?)
+                GROUP BY month
+                ORDER BY month
+            '''
+        
+            revenue_df = pd.read_sql_query(revenue_query, conn, params=(f'-{months} months',))
+            expenses_df = pd.read_sql_query(expenses_query, conn, params=(f'-{months} months',))
+        
+            # دمج البيانات
+            result = pd.merge(revenue_df, expenses_df, on='month', how='outer').fillna(0)
+            result['profit'] = result['revenue'] - result['expenses']
         
-        conn.close()
         return result
     
+    @cached('appointments', 'patients', 'treatments')
     def get_doctor_schedule(self, doctor_id, target_date):
         """جدول مواعيد طبيب في يوم محدد"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                a.id,
-                a.appointment_time,
-                p.name as patient_name,
-                p.phone as patient_phone,
-                t.name as treatment_name,
-                a.status,
-                a.notes
-            FROM appointments a
-            LEFT JOIN patients p ON a.patient_id = p.id
-            LEFT JOIN treatments t ON a.treatment_id = t.id
-            WHERE a.doctor_id = ? AND a.appointment_date = ?
-            ORDER BY a.appointment_time
-        '''
-        df = pd.read_sql_query(query, conn, params=(doctor_id, target_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    a.id,
+                    a.appointment_time,
+                    p.name as patient_name,
+                    p.phone as patient_phone,
+                    t.name as treatment_name,
+                    a.status,
+                    a.notes
+                FROM appointments a
+                LEFT JOIN patients p ON a.patient_id = p.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE a.doctor_id = ? AND a.appointment_date = ?
+                ORDER BY a.appointment_time
+            '''
+            df = pd.read_sql_query(query, conn, params=(doctor_id, target_date))
         return df
     
+    @cached('appointments', 'treatments')
+    def get_occupancy(self, start_date, end_date):
+        """خرائط إشغال الأطباء {(الطبيب، اليوم): bitmap} لفترة - استعلام واحد للفترة كلها"""
+        with self.db.connection() as conn:
+            return occupancy_bitmaps(conn, start_date, end_date, treatment_durations(conn))
+    
+    def find_free_slots(self, treatment_id=None, duration_minutes=None, doctor_ids=None,
+                        start_date=None, days=30, limit=10, step_minutes=15):
+        """أقرب المواعيد المتاحة لعلاج (أو مدة بالدقائق) عند طبيب أو أكثر خلال days يوماً"""
+        if duration_minutes is None:
+            with self.db.connection() as conn:
+                duration_minutes = treatment_durations(conn).get(treatment_id, DEFAULT_DURATION)
+        
+        doctor_names = self.get_name_map('doctors')
+        if doctor_ids is None:
+            doctor_ids = list(doctor_names)
+        
+        first_day, last_day = date_window(start_date, days)
+        hours = parse_working_hours(self.get_setting('working_hours'))
+        bitmaps = self.get_occupancy(first_day.isoformat(), last_day.isoformat())
+        slots = islice(iter_free_slots(bitmaps, doctor_ids, hours, first_day, days,
+                                       duration_minutes, step_minutes), limit)
+        
+        return pd.DataFrame([
+            {
+                'doctor_id': doctor_id,
+                'doctor_name': doctor_names.get(doctor_id),
+                'appointment_date': day,
+                'appointment_time': to_clock(start),
+                'end_time': to_clock(start + duration_minutes),
+            }
+            for day, doctor_id, start in slots
+        ], columns=['doctor_id', 'doctor_name', 'appointment_date', 'appointment_time', 'end_time'])
+    
+    @cached('appointments', 'doctors', 'treatments', 'payments')
     def get_patient_history(self, patient_id):
         """سجل المريض الطبي"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                a.appointment_date,
-                a.appointment_time,
-                d.name as doctor_name,
-                t.name as treatment_name,
-                a.status,
-                a.total_cost,
-                a.notes
-            FROM appointments a
-            LEFT JOIN doctors d ON a.doctor_id = d.id
-            LEFT JOIN treatments t ON a.treatment_id = t.id
-            WHERE a.patient_id = ?
-            ORDER BY a.appointment_date DESC, a.appointment_time DESC
-        '''
-        df = pd.read_sql_query(query, conn, params=(patient_id,))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    a.appointment_date,
+                    a.appointment_time,
+                    d.name as doctor_name,
+                    t.name as treatment_name,
+                    a.status,
+                    a.total_cost,
+                    a.notes
+                FROM appointments a
+                LEFT JOIN doctors d ON a.doctor_id = d.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE a.patient_id = ?
+                ORDER BY a.appointment_date DESC, a.appointment_time DESC
+            '''
+            df = pd.read_sql_query(query, conn, params=(patient_id,))
         return df
     
+    @cached('payments', 'appointments')
     def get_doctor_earnings(self, doctor_id, start_date, end_date):
         """حساب أرباح طبيب محدد"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                SUM(pay.doctor_share) as total_earnings,
-                COUNT(pay.id) as payment_count,
-                AVG(pay.doctor_percentage) as avg_percentage
-            FROM payments pay
-            LEFT JOIN appointments a ON pay.appointment_id = a.id
-            WHERE a.doctor_id = ?
-            AND pay.payment_date BETWEEN ? AND ?
-        '''
-        df = pd.read_sql_query(query, conn, params=(doctor_id, start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    SUM(pay.doctor_share) as total_earnings,
+                    COUNT(pay.id) as payment_count,
+                    AVG(pay.doctor_percentage) as avg_percentage
+                FROM payments pay
+                LEFT JOIN appointments a ON pay.appointment_id = a.id
+                WHERE a.doctor_id = ?
+                AND pay.payment_date BETWEEN ? AND ?
+            '''
+            df = pd.read_sql_query(query, conn, params=(doctor_id, start_date, end_date))
         return df
     
+    @cached('appointments')
+    def get_doctor_monthly_revenue(self, start_date, end_date):
+        """إيرادات المواعيد لكل (طبيب، شهر) من الجدول التجميعي اليومي"""
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    doctor_id,
+                    substr(day, 1, 7) as month,
+                    SUM(appointment_count) as appointment_count,
+                    SUM(total_cost) as revenue
+                FROM daily_appointments
+                WHERE day BETWEEN ? AND ?
+                GROUP BY doctor_id, month
+                ORDER BY month, doctor_id
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
+        return df
+    
+    @cached('payments', 'appointments', 'doctors', 'treatments')
+    def get_all_doctor_earnings(self, start_date, end_date):
+        """أرباح كل الأطباء النشطين في استعلام واحد مع التفصيل حسب العلاج
+        
+        يعيد {'summary': إجمالي لكل طبيب، 'by_treatment': لكل (طبيب، علاج)}
+        """
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    d.id as doctor_id,
+                    d.name as doctor_name,
+                    d.specialization,
+                    a.treatment_id,
+                    t.name as treatment_name,
+                    COUNT(pay.id) as payment_count,
+                    SUM(pay.doctor_share) as total_earnings,
+                    SUM(pay.amount) as total_revenue,
+                    SUM(pay.doctor_percentage) as percentage_sum
+                FROM payments pay
+                JOIN appointments a ON pay.appointment_id = a.id
+                JOIN doctors d ON a.doctor_id = d.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE pay.payment_date BETWEEN ? AND ?
+                AND d.is_active = 1
+                GROUP BY d.id, a.treatment_id
+                ORDER BY d.name, total_earnings DESC
+            '''
+            by_treatment = pd.read_sql_query(query, conn, params=(start_date, end_date))
+        
+        summary = (
+            by_treatment
+            .groupby(['doctor_id', 'doctor_name', 'specialization'], as_index=False, sort=False)
+            [['payment_count', 'total_earnings', 'total_revenue', 'percentage_sum']]
+            .sum()
+        )
+        # متوسط النسبة على مستوى الدفعات (مثل AVG في get_doctor_earnings)
+        for df in (summary, by_treatment):
+            df['avg_percentage'] = df['percentage_sum'] / df['payment_count']
+            df.drop(columns='percentage_sum', inplace=True)
+        summary = summary.sort_values('total_earnings', ascending=False, ignore_index=True)
+        
+        return {'summary': summary, 'by_treatment': by_treatment}
+    
+    @cached('payments')
     def get_clinic_earnings(self, start_date, end_date):
         """حساب أرباح العيادة"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                SUM(clinic_share) as total_clinic_earnings,
-                SUM(doctor_share) as total_doctor_earnings,
-                SUM(amount) as total_revenue,
-                COUNT(id) as payment_count
-            FROM payments
-            WHERE payment_date BETWEEN ? AND ?
-        '''
-        df = pd.read_sql_query(query, conn, params=(start_date, end_date))
-        conn.close()
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    SUM(clinic_share) as total_clinic_earnings,
+                    SUM(doctor_share) as total_doctor_earnings,
+                    SUM(amount) as total_revenue,
+                    SUM(payment_count) as payment_count
+                FROM daily_revenue
+                WHERE day BETWEEN ? AND ?
+            '''
+            df = pd.read_sql_query(query, conn, params=(start_date, end_date))
         return df
     
+    @cached('payments', 'appointments', 'patients', 'doctors', 'treatments')
     def get_payment_details_by_id(self, payment_id):
         """الحصول على تفاصيل دفعة محددة"""
-        conn = self.db.get_connection()
-        query = '''
-            SELECT 
-                pay.*,
+        with self.db.connection() as conn:
+            query = '''
+                SELECT 
+                    pay.*,
+                    p.name as patient_name,
+                    d.name as doctor_name,
+                    t.name as treatment_name
+                FROM payments pay
+                LEFT JOIN patients p ON pay.patient_id = p.id
+                LEFT JOIN appointments a ON pay.appointment_id = a.id
+                LEFT JOIN doctors d ON a.doctor_id = d.id
+                LEFT JOIN treatments t ON a.treatment_id = t.id
+                WHERE pay.id = ?
+            '''
+            cursor = conn.cursor()
+            cursor.execute(query, (payment_id,))
+            result = cursor.fetchone()
+        return result
+    
+    # ========== البحث بالمعرف للنماذج ==========
+    NAME_MAP_TABLES = ('patients', 'doctors', 'treatments', 'suppliers')
+    
+    def get_name_map(self, table_name, active_only=True):
+        """قاموس {المعرف: الاسم} للقوائم المنسدلة (بحث O(1) بدلاً من فلترة DataFrame)"""
+        if table_name not in self.NAME_MAP_TABLES:
+            raise ValueError(f"Table has no name map: {table_name}")
+        
+        def load():
+            query = f"SELECT id, name FROM {table_name}"
+            if active_only:
+                query += " WHERE is_active = 1"
+            with self.db.connection() as conn:
+                return dict(conn.execute(query + " ORDER BY name, id").fetchall())
+        
+        return self.cache.get_or_load(('get_name_map', table_name, active_only),
+                                      (table_name,), load)
+    
+    @cached('patients')
+    def search_patient_options(self, term, limit=20):
+        """{المعرف: "الاسم - الهاتف"} لأول limit مريض يطابق بداية الاسم أو الهاتف
+        
+        رقم هاتف كامل يُبحث عنه مباشرة في فهرس phone_digits (مع هاتف الطوارئ)،
+        وغير ذلك بحث بالبادئة في فهرس البحث النصي.
+        """
+        digits = normalize_phone(term)
+        if digits and digits.isdigit() and len(digits) >= 11:
+            df = self.find_patient_by_phone(term, include_emergency=True).head(limit)
+            return {int(row.id): f"{row.name} - {row.phone}" for row in df.itertuples()}
+        
+        match_query = build_match_query(term)
+        if match_query is None:
+            return {}
+        query = f'''
+            SELECT p.id, p.name, p.phone
+            FROM patients_fts
+            JOIN patients p ON p.id = patients_fts.rowid
+            WHERE patients_fts MATCH ? AND p.is_active = 1
+            ORDER BY {rank_expression()}
+            LIMIT ?
+        '''
+        with self.db.connection() as conn:
+            rows = conn.execute(query, (match_query, limit)).fetchall()
+        return {patient_id: f"{name} - {phone or ''}" for patient_id, name, phone in rows}
+    
+    @cached('appointments', 'patients', 'treatments')
+    def search_appointment_options(self, term="", limit=20):
+        """{المعرف: وصف الموعد} لأول limit موعد
+        
+        بدون نص: أحدث المواعيد. رقم: الموعد بهذا الرقم. نص: مواعيد المرضى المطابقين (الأحدث أولاً).
+        """
+        select_sql = '''
+            SELECT a.id, p.name, t.name, a.appointment_date
+            FROM appointments a
+            LEFT JOIN patients p ON a.patient_id = p.id
+            LEFT JOIN treatments t ON a.treatment_id = t.id
+        '''
+        order_by = " ORDER BY a.appointment_date DESC, a.appointment_time DESC LIMIT ?"
+        term = (term or "").strip().lstrip('#')
+        
+        with self.db.connection() as conn:
+            rows = []
+            if term.isdigit() and len(term) < 11:
+                rows += conn.execute(select_sql + " WHERE a.id = ?", (int(term),)).fetchall()
+            
+            match_query = build_match_query(term)
+            if not term:
+                rows += conn.execute(select_sql + order_by, (limit,)).fetchall()
+            elif match_query is not None:
+                rows += conn.execute(
+                    select_sql + '''
+                        WHERE a.patient_id IN (
+                            SELECT rowid FROM patients_fts WHERE patients_fts MATCH ?
+                            ORDER BY rank LIMIT ?
+                        )
+                    ''' + order_by,
+                    (match_query, limit, limit)
+                ).fetchall()
+        
+        return {
+            appointment_id: f"موعد #{appointment_id} - {patient_name} - {treatment_name or 'بدون علاج'} ({appointment_date})"
+            for appointment_id, patient_name, treatment_name, appointment_date in rows[:limit]
+        }
+    
+    def _billing_context(self, conn, appointment_id):
+        """بيانات محاسبة موعد في استعلام واحد (أو None إذا لم يوجد)"""
+        cursor = conn.execute('''
+            SELECT
+                a.id as appointment_id,
+                a.patient_id,
                 p.name as patient_name,
+                a.doctor_id,
                 d.name as doctor_name,
-                t.name as treatment_name
-            FROM payments pay
-            LEFT JOIN patients p ON pay.patient_id = p.id
-            LEFT JOIN appointments a ON pay.appointment_id = a.id
+                a.treatment_id,
+                t.name as treatment_name,
+                a.appointment_date,
+                a.status,
+                COALESCE(a.total_cost, 0) as total_cost,
+                t.doctor_percentage,
+                t.clinic_percentage,
+                (SELECT COALESCE(SUM(amount), 0) FROM payments
+                 WHERE appointment_id = a.id) as paid_amount
+            FROM appointments a
+            LEFT JOIN patients p ON a.patient_id = p.id
             LEFT JOIN doctors d ON a.doctor_id = d.id
             LEFT JOIN treatments t ON a.treatment_id = t.id
-            WHERE pay.id = ?
-        '''
-        cursor = conn.cursor()
-        cursor.execute(query, (payment_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
+            WHERE a.id = ?
+        ''', (appointment_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        
+        context = dict(zip([column[0] for column in cursor.description], row))
+        # بدون نسب في العلاج: تقسيم بالتساوي (نفس قاعدة create_payment)
+        if context['doctor_percentage'] is None:
+            context['doctor_percentage'] = 50.0
+            context['clinic_percentage'] = 50.0
+        context['balance'] = context['total_cost'] - context['paid_amount']
+        return context
+    
+    @cached('appointments', 'patients', 'doctors', 'treatments', 'payments')
+    def get_appointment_billing_context(self, appointment_id):
+        """المريض ونسب التقسيم والتكلفة والمدفوع لموعد واحد (dict أو None)"""
+        with self.db.connection() as conn:
+            return self._billing_context(conn, appointment_id)
+    
+    # ========== الترقيم بالمفاتيح (Keyset Pagination) ==========
+    def _keyset_page(self, conn, select_sql, filters, keys, cursor=None,
+                     page_size=50, descending=True):
+        """جلب صفحة واحدة بعد المؤشر cursor
+        
+        filters: QueryBuilder بشروط الفلتر
+        keys: [(عمود SQL، اسم العمود في النتيجة)] - آخرها يجب أن يكون فريداً (id)
+        يعيد (DataFrame، مؤشر الصفحة التالية أو None)
+        """
+        filters = filters.copy()
+        
+        if cursor is not None:
+            columns = ", ".join(column for column, _ in keys)
+            placeholders = ", ".join("?" * len(keys))
+            operator = "<" if descending else ">"
+            filters.where(f"({columns}) {operator} ({placeholders})", *cursor)
+        
+        direction = "DESC" if descending else "ASC"
+        query = (select_sql + filters.sql()
+                 + " ORDER BY " + ", ".join(f"{column} {direction}" for column, _ in keys)
+                 + " LIMIT ?")
+        params = filters.params + [page_size + 1]
+        
+        df = pd.read_sql_query(query, conn, params=params)
+        
+        next_cursor = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            last_row = df.iloc[-1]
+            next_cursor = tuple(
+                last_row[name].item() if hasattr(last_row[name], 'item') else last_row[name]
+                for _, name in keys
+            )
+        return df, next_cursor
+    
+    def _count_estimate(self, conn, table, from_sql, filters):
+        """عدد الصفوف: تقدير سريع بدون فلاتر، وعدد دقيق (مفهرس) مع الفلاتر"""
+        if not filters.conditions:
+            result = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()
+            return int(result[0] or 0)
+        result = conn.execute(
+            f"SELECT COUNT(*) FROM {from_sql}" + filters.sql(), filters.params
+        ).fetchone()
+        return int(result[0])
+    
+    # ========== الكتابة المجمعة ==========
+    @contextmanager
+    def batch(self, user_name="النظام"):
+        """تجميع عمليات كتابة كثيرة في معاملة واحدة (commit واحد)
+        
+        العمليات تنفذ عند الخروج من السياق فقط، وإذا حدث خطأ داخل السياق لا ينفذ شيء.
+        """
+        batch = Batch(user_name)
+        yield batch
+        
+        tables = batch.tables
+        try:
+            with self.db.connection() as conn:
+                batch.flush(conn)
+        finally:
+            if tables:
+                self.cache.invalidate(*tables, 'activity_log')
+    
+    def import_file(self, table_name, source, filename=None, rejects_path=None,
+                    chunk_size=1000, progress=None, user_name="النظام"):
+        """استيراد ملف CSV / Excel إلى جدول على دفعات (انظر database/importer.py)"""
+        from .importer import import_file
+        
+        try:
+            with self.db.connection() as conn:
+                return import_file(conn, table_name, source, filename, rejects_path,
+                                   chunk_size, progress, user_name)
+        finally:
+            self.cache.invalidate(table_name, 'activity_log')
+    
+    # ========== التصدير ==========
+    def _export_query(self, dataset, start_date=None, end_date=None, active_only=True, **filters):
+        """استعلام التصدير وشروطه لكل نوع بيانات"""
+        if dataset == 'appointments':
+            builder = self._appointment_filters(start_date, end_date, **filters)
+            return (self.APPOINTMENTS_SELECT, builder,
+                    "a.appointment_date DESC, a.appointment_time DESC")
+        if dataset == 'payments':
+            builder = self._payment_filters(start_date, end_date, **filters)
+            return self.PAYMENTS_SELECT, builder, "pay.payment_date DESC, pay.id DESC"
+        if dataset == 'expenses':
+            builder = self._expense_filters(start_date, end_date, **filters)
+            return "SELECT * FROM expenses", builder, "expense_date DESC, id DESC"
+        if dataset == 'activity_log':
+            builder = (QueryBuilder()
+                       .date_range("date(created_at)", start_date, end_date)
+                       .equals("table_name", filters.get('table_name'))
+                       .equals("action", filters.get('action')))
+            return "SELECT * FROM activity_log", builder, "created_at DESC, id DESC"
+        if dataset == 'inventory':
+            builder = QueryBuilder().equals("i.category", filters.get('category'))
+            if active_only:
+                builder.where("i.is_active = 1")
+            return ('''
+                SELECT i.*, s.name as supplier_name
+                FROM inventory i
+                LEFT JOIN suppliers s ON i.supplier_id = s.id
+            ''', builder, "i.item_name")
+        if dataset in ('patients', 'doctors', 'treatments'):
+            builder = QueryBuilder().equals("category", filters.get('category'))
+            if active_only:
+                builder.where("is_active = 1")
+            return f"SELECT * FROM {dataset}", builder, "name"
+        raise ValueError(f"Unknown export dataset: {dataset}")
+    
+    def export(self, dataset, fmt='csv', columns=None, chunk_size=5000, **filters):
+        """تصدير بيانات كبيرة إلى ملف على دفعات بدون بناء DataFrame (انظر database/export.py)
+        
+        columns: {اسم العمود: العنوان في الملف} لاختيار الأعمدة وترتيبها.
+        الفلاتر بنفس أسماء معاملات get_all_* (start_date, end_date, doctor_id, category, ...).
+        """
+        from .export import export_cursor
+        
+        select_sql, builder, order_by = self._export_query(dataset, **filters)
+        with self.db.connection() as conn:
+            cursor = conn.execute(select_sql + builder.sql() + " ORDER BY " + order_by, builder.params)
+            try:
+                return export_cursor(cursor, fmt, dataset, columns, chunk_size, sheet_name=dataset)
+            finally:
+                cursor.close()
     
     # ========== الإعدادات ==========
+    @cached('settings')
     def get_setting(self, key):
         """الحصول على إعداد محدد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+            result = cursor.fetchone()
         return result[0] if result else None
     
+    @invalidates('settings')
     def update_setting(self, key, value):
         """تحديث إعداد"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE settings SET value = ?, updated_at = CURRENT_TIMESTAMP 
-            WHERE key = ?
-        ''', (value, key))
-        conn.commit()
-        conn.close()
-    
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE settings SET value = ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE key = ?
+            ''', (value, key))
+            conn.commit()
+    
+    def get_database_pragmas(self):
+        """قيم PRAGMA الفعلية على اتصال المجمع"""
+        with self.db.connection() as conn:
+            return {
+                pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                for _, pragma, _, _, _ in PRAGMA_PROFILE
+            }
+    
+    def get_cache_stats(self):
+        """إحصائيات الذاكرة المؤقتة لنتائج الاستعلامات"""
+        return self.cache.stats()
+    
+    @invalidates('payments', 'expenses', 'appointments')
+    def rebuild_rollups(self):
+        """إعادة بناء الجداول التجميعية اليومية من البيانات الخام"""
+        from .rollups import rebuild_rollups
+        
+        with self.db.connection() as conn:
+            counts = rebuild_rollups(conn)
+            self.log_activity(conn, "إعادة بناء", "daily_rollups", None,
+                              f"تمت إعادة بناء الجداول التجميعية: {counts}")
+            conn.commit()
+        return counts
+    
+    @invalidates('payments', 'appointments')
+    def reconcile_balances(self, fix=False):
+        """مطابقة دفتر أرصدة المرضى مع المواعيد والمدفوعات - يعيد الفروق كـ DataFrame"""
+        from .balances import reconcile_balances
+        
+        with self.db.connection() as conn:
+            drift = reconcile_balances(conn, fix=fix)
+            if fix and drift:
+                self.log_activity(conn, "مطابقة", "patient_balances", None,
+                                  f"تم تصحيح أرصدة {len(drift)} مريض")
+                conn.commit()
+        return pd.DataFrame(drift, columns=[
+            'patient_id', 'ledger_charged', 'expected_charged', 'ledger_paid',
+            'expected_paid', 'ledger_balance', 'expected_balance'
+        ])
+    
+    @cached('settings')
     def get_all_settings(self):
         """الحصول على جميع الإعدادات"""
-        conn = self.db.get_connection()
-        df = pd.read_sql_query("SELECT * FROM settings ORDER BY key", conn)
-        conn.close()
+        with self.db.connection() as conn:
+            df = pd.read_sql_query("SELECT * FROM settings ORDER BY key", conn)
         return df
     
     # ========== سجل الأنشطة ==========
@@ -1196,62 +1964,119 @@ class CRUDOperations:
             VALUES (?, ?, ?, ?, ?)
         ''', (action, table_name, record_id, details, user_name))
     
+    @cached('activity_log')
     def get_activity_log(self, limit=100):
         """الحصول على سجل الأنشطة"""
-        conn = self.db.get_connection()
-        query = f'''
-            SELECT * FROM activity_log 
-            ORDER BY created_at DESC 
-            LIMIT {limit}
-        '''
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        with self.db.connection() as conn:
+            query = f'''
+                SELECT * FROM activity_log 
+                ORDER BY created_at DESC 
+                LIMIT {limit}
+            '''
+            df = pd.read_sql_query(query, conn)
         return df
     
-    def get_dashboard_stats(self):
-        """إحصائيات لوحة التحكم"""
-        conn = self.db.get_connection()
-        
-        stats = {}
+    @cached('activity_log')
+    def get_activity_log_page(self, page_size=100, cursor=None, table_name=None, action=None):
+        """صفحة من سجل الأنشطة مرتبة تنازلياً حسب (التاريخ، الرقم)"""
+        filters = QueryBuilder().equals("table_name", table_name).equals("action", action)
+        keys = [("created_at", "created_at"), ("id", "id")]
         
-        # عدد المرضى النشطين
-        stats['total_patients'] = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM patients WHERE is_active = 1", conn
-        ).iloc[0]['count']
+        with self.db.connection() as conn:
+            df, next_cursor = self._keyset_page(conn, "SELECT * FROM activity_log", filters,
+                                                keys, cursor, page_size)
+            total = self._count_estimate(conn, "activity_log", "activity_log", filters)
         
-        # عدد الأطباء النشطين
-        stats['total_doctors'] = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM doctors WHERE is_active = 1", conn
-        ).iloc[0]['count']
-        
-        # مواعيد اليوم
+        return {'data': df, 'next_cursor': next_cursor, 'total_estimate': total}
+    
+    def get_dashboard_stats(self):
+        """إحصائيات لوحة التحكم (الأرقام فقط من لقطة لوحة التحكم)"""
+        snapshot = self.get_dashboard_snapshot()
+        keys = ('total_patients', 'total_doctors', 'today_appointments',
+                'upcoming_appointments', 'low_stock_items', 'expiring_items')
+        return {key: snapshot[key] for key in keys}
+    
+    def get_dashboard_snapshot(self, refresh=False):
+        """كل أرقام وقوائم لوحة التحكم في استعلام واحد
+        
+        تعيد قيماً بسيطة (أرقام وtuples) وتُخزن مؤقتاً لمدة DASHBOARD_TTL ثانية
+        أو حتى أول كتابة على أحد الجداول. refresh=True لتجاهل النسخة المخزنة.
+        """
+        if refresh:
+            self.cache.discard('_load_dashboard_snapshot')
+        return self._load_dashboard_snapshot()
+    
+    @cached('patients', 'doctors', 'treatments', 'appointments', 'payments', 'expenses', 'inventory',
+            ttl=DASHBOARD_TTL)
+    def _load_dashboard_snapshot(self):
+        """تحميل لقطة لوحة التحكم من قاعدة البيانات"""
         today = date.today().isoformat()
-        stats['today_appointments'] = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM appointments WHERE appointment_date = ?", 
-            conn, params=(today,)
-        ).iloc[0]['count']
-        
-        # المواعيد القادمة (7 أيام)
         future_date = (date.today() + timedelta(days=7)).isoformat()
-        stats['upcoming_appointments'] = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM appointments WHERE appointment_date BETWEEN ? AND ? AND status IN ('مجدول', 'مؤكد')", 
-            conn, params=(today, future_date)
-        ).iloc[0]['count']
-        
-        # عناصر منخفضة المخزون
-        stats['low_stock_items'] = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM inventory WHERE quantity <= min_stock_level AND is_active = 1", 
-            conn
-        ).iloc[0]['count']
-        
-        # أصناف قريبة من الانتهاء (30 يوم)
-        stats['expiring_items'] = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM inventory WHERE julianday(expiry_date) - julianday('now') <= 30 AND expiry_date IS NOT NULL AND is_active = 1", 
-            conn
-        ).iloc[0]['count']
-        
-        conn.close()
-        return stats
+        
+        query = '''
+            SELECT
+                (SELECT COUNT(*) FROM patients WHERE is_active = 1),
+                (SELECT COUNT(*) FROM doctors WHERE is_active = 1),
+                (SELECT COALESCE(SUM(appointment_count), 0) FROM daily_appointments WHERE day = :today),
+                (SELECT COALESCE(SUM(appointment_count), 0) FROM daily_appointments
+                 WHERE day BETWEEN :today AND :future AND status IN ('مجدول', 'مؤكد')),
+                (SELECT COUNT(*) FROM inventory WHERE quantity <= min_stock_level AND is_active = 1),
+                (SELECT COUNT(*) FROM inventory
+                 WHERE expiry_date <= date('now', '+30 days') AND expiry_date IS NOT NULL AND is_active = 1),
+                (SELECT COALESCE(SUM(amount), 0) FROM daily_revenue),
+                (SELECT COALESCE(SUM(amount), 0) FROM daily_expenses),
+                (SELECT json_group_array(json_array(status, count)) FROM (
+                    SELECT status, SUM(appointment_count) AS count
+                    FROM daily_appointments GROUP BY status ORDER BY count DESC)),
+                (SELECT json_group_array(json_array(patient_name, doctor_name, treatment_name,
+                                                    appointment_time, status)) FROM (
+                    SELECT p.name AS patient_name, d.name AS doctor_name, t.name AS treatment_name,
+                           a.appointment_time, a.status
+                    FROM appointments a
+                    LEFT JOIN patients p ON a.patient_id = p.id
+                    LEFT JOIN doctors d ON a.doctor_id = d.id
+                    LEFT JOIN treatments t ON a.treatment_id = t.id
+                    WHERE a.appointment_date = :today
+                    ORDER BY a.appointment_time)),
+                (SELECT json_group_array(json_array(appointment_date, patient_name, doctor_name, status)) FROM (
+                    SELECT a.appointment_date, p.name AS patient_name, d.name AS doctor_name, a.status
+                    FROM appointments a
+                    LEFT JOIN patients p ON a.patient_id = p.id
+                    LEFT JOIN doctors d ON a.doctor_id = d.id
+                    WHERE a.appointment_date BETWEEN :today AND :future
+                    AND a.status IN ('مجدول', 'مؤكد')
+                    ORDER BY a.appointment_date, a.appointment_time
+                    LIMIT 5)),
+                (SELECT json_group_array(json_array(item_name, quantity, min_stock_level)) FROM (
+                    SELECT item_name, quantity, min_stock_level
+                    FROM inventory
+                    WHERE quantity <= min_stock_level AND is_active = 1
+                    ORDER BY quantity
+                    LIMIT 5))
+        '''
+        
+        with self.db.connection() as conn:
+            row = conn.execute(query, {'today': today, 'future': future_date}).fetchone()
+        
+        def rows(value):
+            return tuple(tuple(item) for item in json.loads(value))
+        
+        snapshot = {
+            'total_patients': row[0],
+            'total_doctors': row[1],
+            'today_appointments': row[2],
+            'upcoming_appointments': row[3],
+            'low_stock_items': row[4],
+            'expiring_items': row[5],
+            'total_revenue': row[6],
+            'total_expenses': row[7],
+            'net_profit': row[6] - row[7],
+            'appointment_status': rows(row[8]),
+            'today_schedule': rows(row[9]),
+            'upcoming': rows(row[10]),
+            'low_stock': rows(row[11]),
+        }
+        return snapshot
 
 # إنشاء مثيل من عمليات CRUD
 crud = CRUDOperations()
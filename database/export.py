@@ -0,0 +1,201 @@
+"""
+تصدير البيانات الكبيرة على دفعات (CSV / Excel / Parquet)
+
+الصفوف تُقرأ من مؤشر SQLite بـ fetchmany وتُكتب مباشرة في ملف مؤقت على القرص، لذلك
+لا يتم بناء DataFrame كامل ولا ملف كامل في الذاكرة مهما كان حجم التقرير:
+
+- CSV: csv.writer على الملف
+- Excel: openpyxl في وضع write_only (الصفوف تُكتب ولا تُحفظ في الذاكرة)
+- Parquet: pyarrow (اختياري) مع row group لكل دفعة
+
+النتيجة ExportFile (مسار الملف واسمه ونوعه وعدد الصفوف) يمكن تمريرها إلى st.download_button.
+"""
+
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime
+
+DEFAULT_CHUNK_SIZE = 5000
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "clinic_exports")
+# ملفات التصدير القديمة تُحذف عند التصدير التالي (بالثواني)
+EXPORT_MAX_AGE = 24 * 60 * 60
+
+# الصيغة -> (الامتداد، نوع الملف)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def available_formats():
+    """الصيغ المتاحة (Parquet فقط إذا كانت مكتبة pyarrow مثبتة)"""
+    formats = ['csv', 'xlsx']
+    try:
+        import pyarrow  # noqa: F401
+        formats.append('parquet')
+    except ImportError:
+        pass
+    return formats
+
+
+class ExportFile:
+    """ملف تصدير جاهز للتحميل"""
+
+    def __init__(self, path, file_name, mime, rows):
+        self.path = path
+        self.file_name = file_name
+        self.mime = mime
+        self.rows = rows
+
+    def open(self):
+        """فتح الملف للقراءة (st.download_button يقبل كائن الملف مباشرة)"""
+        return open(self.path, 'rb')
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ========== الكتابة ==========
+def _write_csv(path, headers, chunks, sheet_name=None):
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def _write_xlsx(path, headers, chunks, sheet_name=None):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=(sheet_name or "Sheet1")[:31])
+    sheet.sheet_view.rightToLeft = True
+    sheet.append(headers)
+    rows = 0
+    for chunk in chunks:
+        for row in chunk:
+            sheet.append(row)
+        rows += len(chunk)
+    workbook.save(path)
+    return rows
+
+
+def _write_parquet(path, headers, chunks, sheet_name=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            columns = [list(column) for column in zip(*chunk)]
+            table = pa.table(dict(zip(headers, columns)))
+            if writer is None:
+                # أعمدة فارغة بالكامل في الدفعة الأولى تُكتب كنص
+                schema = pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type)
+                                    else field for field in table.schema])
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+        if writer is None:
+            pq.write_table(pa.table({header: [] for header in headers}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+_WRITERS = {'csv': _write_csv, 'xlsx': _write_xlsx, 'parquet': _write_parquet}
+
+
+# ========== مصادر الصفوف ==========
+def cursor_chunks(cursor, chunk_size=DEFAULT_CHUNK_SIZE):
+    """دفعات من مؤشر قاعدة البيانات"""
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _missing(value):
+    """NaN أو pd.NA أو NaT"""
+    try:
+        return bool(value != value)
+    except TypeError:
+        return True
+
+
+def dataframe_chunks(df, chunk_size=DEFAULT_CHUNK_SIZE):
+    """دفعات من DataFrame موجود (قيم Python بدلاً من numpy)"""
+    for start in range(0, len(df), chunk_size):
+        part = df.iloc[start:start + chunk_size].astype(object)
+        yield [tuple(None if _missing(value) else value for value in row)
+               for row in part.itertuples(index=False, name=None)]
+
+
+def remove_old_exports(max_age=EXPORT_MAX_AGE):
+    """حذف ملفات التصدير الأقدم من max_age ثانية"""
+    now = time.time()
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def write_export(chunks, headers, fmt, name, sheet_name=None):
+    """كتابة الدفعات في ملف مؤقت وإرجاع ExportFile"""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt not in available_formats():
+        raise ImportError("تصدير Parquet يحتاج مكتبة pyarrow")
+
+    extension, mime = EXPORT_FORMATS[fmt]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    remove_old_exports()
+    file_name = f"{name}_{datetime.now():%Y-%m-%d}{extension}"
+    fd, path = tempfile.mkstemp(prefix=f"{name}_", suffix=extension, dir=EXPORT_DIR)
+    os.close(fd)
+
+    try:
+        rows = _WRITERS[fmt](path, list(headers), chunks, sheet_name)
+    except Exception:
+        os.remove(path)
+        raise
+    return ExportFile(path, file_name, mime, rows)
+
+
+def export_cursor(cursor, fmt, name, columns=None, chunk_size=DEFAULT_CHUNK_SIZE, sheet_name=None):
+    """تصدير نتيجة استعلام منفذ
+
+    columns: {اسم العمود: العنوان في الملف} لاختيار الأعمدة وترتيبها (الافتراضي كل الأعمدة).
+    """
+    names = [column[0] for column in cursor.description]
+    chunks = cursor_chunks(cursor, chunk_size)
+    if not columns:
+        return write_export(chunks, names, fmt, name, sheet_name)
+
+    unknown = [column for column in columns if column not in names]
+    if unknown:
+        raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    indexes = [names.index(column) for column in columns]
+    projected = ([tuple(row[i] for i in indexes) for row in chunk] for chunk in chunks)
+    return write_export(projected, columns.values(), fmt, name, sheet_name)
+
+
+def export_dataframe(df, fmt, name, chunk_size=DEFAULT_CHUNK_SIZE, sheet_name=None):
+    """تصدير DataFrame صغير محسوب في الذاكرة بنفس صيغ التصدير"""
+    return write_export(dataframe_chunks(df, chunk_size), df.columns, fmt, name, sheet_name)
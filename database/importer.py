@@ -0,0 +1,477 @@
+"""
+استيراد ملفات CSV / Excel كبيرة (المرضى، المخزون، المصروفات، المواعيد)
+
+- الملف يُقرأ صفاً بصف (csv أو openpyxl في وضع read_only) بدون تحميله كاملاً في الذاكرة
+- كل صف يتم التحقق منه وتحويله، والصفوف المكررة (في الملف أو في قاعدة البيانات) تُستبعد
+- الإدخال على دفعات: كل دفعة في معاملة واحدة مع سطر واحد في سجل الأنشطة
+- المواعيد التي يكون فيها الطبيب أو المريض محجوزاً في نفس الوقت تُرفض
+- الصفوف المرفوضة تُكتب في ملف CSV مع رقم السطر وسبب الرفض
+
+أسماء الأعمدة في الملف هي نفس أسماء أعمدة الجدول (name, phone, ...)، والأعمدة الأخرى تُتجاهل.
+
+    python -m database.importer patients legacy_patients.csv --rejects rejects.csv
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+from datetime import date, datetime, time
+
+from utils.helpers import validate_phone, validate_email
+
+from .balances import CANCELLED_APPOINTMENT
+from .phones import normalize_phone
+from .scheduling import ScheduleValidator, describe
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class RowError(ValueError):
+    """صف غير صالح (الرسالة هي سبب الرفض)"""
+
+
+# ========== تحويل القيم ==========
+def _text(value):
+    """قيمة نصية بدون مسافات زائدة (الأرقام الصحيحة من Excel بدون .0)"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _date(value, column, required=False):
+    """تاريخ بصيغة ISO (YYYY-MM-DD) أو None"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = _text(value)
+    if not text:
+        if required:
+            raise RowError(f"{column} مطلوب")
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise RowError(f"تاريخ غير صالح في {column}: {text}")
+
+
+def _time(value, column):
+    """وقت بصيغة HH:MM"""
+    if isinstance(value, datetime):
+        value = value.time()
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    text = _text(value)
+    for fmt in ("%H:%M", "%H:%M:%S", "%I:%M %p"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%H:%M")
+        except ValueError:
+            pass
+    raise RowError(f"وقت غير صالح في {column}: {text}")
+
+
+def _number(value, column, cast=float, default=None, minimum=None):
+    text = _text(value)
+    if not text:
+        if default is None:
+            raise RowError(f"{column} مطلوب")
+        return default
+    try:
+        number = cast(float(text)) if cast is int else cast(text)
+    except ValueError:
+        raise RowError(f"قيمة رقمية غير صالحة في {column}: {text}")
+    if minimum is not None and number < minimum:
+        raise RowError(f"{column} أقل من {minimum}: {text}")
+    return number
+
+
+def _optional_id(value, column, known_ids):
+    text = _text(value)
+    if not text:
+        return None
+    record_id = _number(text, column, int)
+    if record_id not in known_ids:
+        raise RowError(f"{column} غير موجود: {record_id}")
+    return record_id
+
+
+def _flag(value):
+    return 1 if _text(value).lower() in ("1", "true", "yes", "نعم") else 0
+
+
+def _phone(value):
+    """رقم الهاتف بعد التحقق (Excel يحذف الصفر الأول من الأرقام المخزنة كأرقام)"""
+    phone = _text(value)
+    if not phone:
+        return ""
+    if isinstance(value, (int, float)) and len(phone) == 10 and phone.startswith("1"):
+        phone = "0" + phone
+    # +20 / 0020 والأرقام العربية مقبولة بعد التطبيع (نفس قواعد البحث)
+    if not validate_phone(normalize_phone(phone) or ""):
+        raise RowError(f"رقم هاتف غير صالح: {phone}")
+    return phone
+
+
+def _required(row, column):
+    text = _text(row.get(column))
+    if not text:
+        raise RowError(f"{column} مطلوب")
+    return text
+
+
+# ========== الجداول ==========
+# parse(row, context) -> قيم الأعمدة بنفس ترتيب columns
+# key(values) -> مفتاح منع التكرار (يُطبق أيضاً على الصفوف الموجودة في قاعدة البيانات)
+# check(values, context, line_number) -> فحص أخير للصف الذي سيُقبل (اختياري، يرفع RowError)
+
+def _parse_patient(row, context):
+    email = _text(row.get('email'))
+    if email and not validate_email(email):
+        raise RowError(f"بريد إلكتروني غير صالح: {email}")
+    date_of_birth = _date(row.get('date_of_birth'), 'date_of_birth')
+    if date_of_birth and date_of_birth > date.today().isoformat():
+        raise RowError(f"تاريخ ميلاد في المستقبل: {date_of_birth}")
+    return (
+        _required(row, 'name'), _phone(row.get('phone')), email, _text(row.get('address')),
+        date_of_birth, _text(row.get('gender')), _text(row.get('medical_history')),
+        _text(row.get('emergency_contact')), _text(row.get('blood_type')),
+        _text(row.get('allergies')), _text(row.get('notes')),
+    )
+
+
+def _patient_key(values):
+    name, phone, _, _, date_of_birth = values[:5]
+    if phone:
+        return ('phone', normalize_phone(phone))
+    return ('name', name.casefold(), date_of_birth or "")
+
+
+def _parse_inventory(row, context):
+    return (
+        _required(row, 'item_name'), _text(row.get('category')),
+        _number(row.get('quantity'), 'quantity', int, default=0, minimum=0),
+        _number(row.get('unit_price'), 'unit_price', default=0.0, minimum=0),
+        _number(row.get('min_stock_level'), 'min_stock_level', int, default=10, minimum=0),
+        _optional_id(row.get('supplier_id'), 'supplier_id', context['suppliers']),
+        _date(row.get('expiry_date'), 'expiry_date'),
+        _text(row.get('location')), _text(row.get('barcode')),
+    )
+
+
+def _inventory_key(values):
+    item_name, category = values[:2]
+    barcode = values[8]
+    if barcode:
+        return ('barcode', barcode)
+    return ('name', item_name.casefold(), category or "")
+
+
+def _parse_expense(row, context):
+    return (
+        _required(row, 'category'), _required(row, 'description'),
+        _number(row.get('amount'), 'amount', minimum=0.01),
+        _date(row.get('expense_date'), 'expense_date', required=True),
+        _text(row.get('payment_method')), _text(row.get('receipt_number')),
+        _text(row.get('notes')), _text(row.get('approved_by')), _flag(row.get('is_recurring')),
+    )
+
+
+def _expense_key(values):
+    category, description, amount, expense_date, _, receipt_number = values[:6]
+    return (expense_date, category, description, round(amount, 2), receipt_number or "")
+
+
+def _parse_appointment(row, context):
+    patient_id = _optional_id(_required(row, 'patient_id'), 'patient_id', context['patients'])
+    doctor_id = _optional_id(_required(row, 'doctor_id'), 'doctor_id', context['doctors'])
+    treatment_id = _optional_id(row.get('treatment_id'), 'treatment_id', context['treatments'])
+    default_cost = context['treatments'].get(treatment_id) or 0.0
+    appointment_date = _date(row.get('appointment_date'), 'appointment_date', required=True)
+    appointment_time = _time(row.get('appointment_time'), 'appointment_time')
+    return (
+        patient_id, doctor_id, treatment_id, appointment_date, appointment_time,
+        _text(row.get('status')) or 'مجدول', _text(row.get('notes')),
+        _number(row.get('total_cost'), 'total_cost', default=default_cost, minimum=0),
+    )
+
+
+def _check_appointment(values, context, line_number):
+    """الطبيب أو المريض محجوز (في قاعدة البيانات أو في صف سابق مقبول من نفس الملف)"""
+    patient_id, doctor_id, treatment_id, appointment_date, appointment_time, status = values[:6]
+    if status == CANCELLED_APPOINTMENT:
+        return
+    conflicts = context['schedule'].check(doctor_id, patient_id, appointment_date,
+                                          appointment_time, treatment_id, row=line_number)
+    if conflicts:
+        raise RowError(describe(conflicts[0]))
+
+
+def _appointment_key(values):
+    patient_id, doctor_id, _, appointment_date, appointment_time = values[:5]
+    return (patient_id, doctor_id, appointment_date, appointment_time)
+
+
+def _appointment_context(conn):
+    return {
+        'patients': {row[0] for row in conn.execute("SELECT id FROM patients WHERE is_active = 1")},
+        'doctors': {row[0] for row in conn.execute("SELECT id FROM doctors WHERE is_active = 1")},
+        'treatments': dict(conn.execute("SELECT id, base_price FROM treatments WHERE is_active = 1")),
+        'schedule': ScheduleValidator(conn),
+    }
+
+
+def _inventory_context(conn):
+    return {'suppliers': {row[0] for row in conn.execute("SELECT id FROM suppliers")}}
+
+
+IMPORT_TABLES = {
+    'patients': {
+        'label': 'المرضى',
+        'columns': ('name', 'phone', 'email', 'address', 'date_of_birth', 'gender',
+                    'medical_history', 'emergency_contact', 'blood_type', 'allergies', 'notes'),
+        'required': ('name',),
+        'parse': _parse_patient,
+        'key': _patient_key,
+        'check': None,
+        'context': None,
+        'existing': "SELECT name, phone, email, address, date_of_birth FROM patients WHERE is_active = 1",
+    },
+    'inventory': {
+        'label': 'المخزون',
+        'columns': ('item_name', 'category', 'quantity', 'unit_price', 'min_stock_level',
+                    'supplier_id', 'expiry_date', 'location', 'barcode'),
+        'required': ('item_name',),
+        'parse': _parse_inventory,
+        'key': _inventory_key,
+        'check': None,
+        'context': _inventory_context,
+        'existing': '''SELECT item_name, category, quantity, unit_price, min_stock_level,
+                              supplier_id, expiry_date, location, barcode
+                       FROM inventory WHERE is_active = 1''',
+    },
+    'expenses': {
+        'label': 'المصروفات',
+        'columns': ('category', 'description', 'amount', 'expense_date', 'payment_method',
+                    'receipt_number', 'notes', 'approved_by', 'is_recurring'),
+        'required': ('category', 'description', 'amount', 'expense_date'),
+        'parse': _parse_expense,
+        'key': _expense_key,
+        'check': None,
+        'context': None,
+        'existing': '''SELECT category, description, amount, expense_date, payment_method,
+                              receipt_number FROM expenses''',
+    },
+    'appointments': {
+        'label': 'المواعيد',
+        'columns': ('patient_id', 'doctor_id', 'treatment_id', 'appointment_date',
+                    'appointment_time', 'status', 'notes', 'total_cost'),
+        'required': ('patient_id', 'doctor_id', 'appointment_date', 'appointment_time'),
+        'parse': _parse_appointment,
+        'key': _appointment_key,
+        'check': _check_appointment,
+        'context': _appointment_context,
+        'existing': '''SELECT patient_id, doctor_id, treatment_id, appointment_date,
+                              substr(appointment_time, 1, 5) FROM appointments''',
+    },
+}
+
+
+# ========== قراءة الملف ==========
+class SourceFile:
+    """قراءة ملف CSV أو Excel صفاً بصف
+
+    source: مسار ملف أو كائن ملف (مثل ملف مرفوع من Streamlit) ويُحدد النوع من الامتداد.
+    """
+
+    def __init__(self, source, filename=None, sheet_name=None):
+        self.source = source
+        self.filename = filename or getattr(source, 'name', None) or str(source)
+        self.sheet_name = sheet_name
+        self.columns = []
+        self._handle = None
+        self._workbook = None
+        self._total = None
+
+    @property
+    def is_excel(self):
+        return os.path.splitext(self.filename)[1].lower() in ('.xlsx', '.xlsm')
+
+    def __enter__(self):
+        if self.is_excel:
+            from openpyxl import load_workbook
+
+            self._workbook = load_workbook(self.source, read_only=True, data_only=True)
+            sheet = self._workbook[self.sheet_name] if self.sheet_name else self._workbook.active
+            self._rows = sheet.iter_rows(values_only=True)
+            header = next(self._rows, ())
+            if sheet.max_row:
+                self._total = max(sheet.max_row - 1, 0)
+        else:
+            if isinstance(self.source, (str, os.PathLike)):
+                self._handle = open(self.source, 'rb')
+            else:
+                self._handle = self.source
+                self._handle.seek(0)
+            self._text = io.TextIOWrapper(self._handle, encoding='utf-8-sig', newline='')
+            self._rows = csv.reader(self._text)
+            header = next(self._rows, [])
+        self.columns = [_text(column).lower() for column in header]
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._workbook is not None:
+            self._workbook.close()
+        else:
+            # فصل الغلاف النصي حتى لا يغلق ملف المستدعي
+            self._text.detach()
+            if isinstance(self.source, (str, os.PathLike)):
+                self._handle.close()
+
+    def rows(self):
+        """(رقم السطر في الملف، القيم الأصلية، dict بأسماء الأعمدة) مع تخطي الأسطر الفارغة"""
+        for line_number, values in enumerate(self._rows, start=2):
+            values = list(values)
+            if not any(_text(value) for value in values):
+                continue
+            yield line_number, values, dict(zip(self.columns, values))
+
+    def fraction(self, rows_read):
+        """نسبة التقدم التقريبية (حجم الملف المقروء في CSV، عدد الصفوف في Excel)"""
+        if self._workbook is not None:
+            return min(rows_read / self._total, 1.0) if self._total else None
+        try:
+            size = os.fstat(self._handle.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            # ملف في الذاكرة (BytesIO أو ملف مرفوع)
+            size = len(self._handle.getbuffer()) if hasattr(self._handle, 'getbuffer') else None
+        if not size:
+            return None
+        return min(self._handle.tell() / size, 1.0)
+
+
+# ========== الاستيراد ==========
+def _insert_chunk(conn, table_name, columns, chunk, label, user_name):
+    """إدخال دفعة في معاملة واحدة مع سطر واحد في سجل الأنشطة"""
+    placeholders = ", ".join("?" for _ in columns)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.executemany(
+            f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})", chunk
+        )
+        conn.execute('''
+            INSERT INTO activity_log (action, table_name, record_id, details, user_name)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ("استيراد", table_name, None, f"تم استيراد {len(chunk)} من {label}", user_name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor.rowcount
+
+
+def import_file(conn, table_name, source, filename=None, rejects_path=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, progress=None, user_name="النظام"):
+    """استيراد ملف إلى جدول على دفعات - يعيد إحصائيات الاستيراد
+
+    progress(stats) تُستدعى بعد كل دفعة، و stats['fraction'] نسبة التقدم إن أمكن حسابها.
+    """
+    spec = IMPORT_TABLES.get(table_name)
+    if spec is None:
+        raise ValueError(f"Table not supported for import: {table_name}")
+
+    stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'chunks': 0, 'fraction': 0.0}
+
+    with SourceFile(source, filename) as reader:
+        missing = [column for column in spec['required'] if column not in reader.columns]
+        if missing:
+            raise ValueError(f"أعمدة مطلوبة غير موجودة في الملف: {', '.join(missing)}")
+
+        context = spec['context'](conn) if spec['context'] else None
+        seen = {spec['key'](row) for row in conn.execute(spec['existing'])}
+
+        rejects_file = open(rejects_path, 'w', newline='', encoding='utf-8-sig') if rejects_path else None
+        rejects = csv.writer(rejects_file) if rejects_file else None
+        if rejects:
+            rejects.writerow(['line', 'reason'] + reader.columns)
+
+        def reject(line_number, reason, values):
+            if rejects:
+                rejects.writerow([line_number, reason] + [_text(value) for value in values])
+
+        def flush(chunk):
+            stats['inserted'] += _insert_chunk(conn, table_name, spec['columns'], chunk,
+                                               spec['label'], user_name)
+            stats['chunks'] += 1
+            stats['fraction'] = reader.fraction(stats['read'])
+            if progress:
+                progress(dict(stats))
+
+        try:
+            chunk = []
+            for line_number, values, row in reader.rows():
+                stats['read'] += 1
+                try:
+                    parsed = spec['parse'](row, context)
+                except RowError as e:
+                    stats['rejected'] += 1
+                    reject(line_number, str(e), values)
+                    continue
+
+                key = spec['key'](parsed)
+                if key in seen:
+                    stats['duplicates'] += 1
+                    reject(line_number, "سجل مكرر", values)
+                    continue
+
+                if spec['check']:
+                    try:
+                        spec['check'](parsed, context, line_number)
+                    except RowError as e:
+                        stats['rejected'] += 1
+                        reject(line_number, str(e), values)
+                        continue
+
+                seen.add(key)
+                chunk.append(parsed)
+                if len(chunk) >= chunk_size:
+                    flush(chunk)
+                    chunk = []
+
+            if chunk:
+                flush(chunk)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+    stats['fraction'] = 1.0
+    return stats
+
+
+if __name__ == "__main__":
+    from .crud import crud
+    from .models import add_database_arguments, open_from_args
+
+    parser = argparse.ArgumentParser(description="استيراد ملف CSV / Excel إلى قاعدة البيانات")
+    parser.add_argument('table', choices=sorted(IMPORT_TABLES))
+    parser.add_argument('path')
+    parser.add_argument('--rejects', help="ملف CSV للصفوف المرفوضة")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    add_database_arguments(parser)
+    args = parser.parse_args()
+    open_from_args(args)
+
+    def report(stats):
+        print(f"... {stats['read']} صف مقروء، {stats['inserted']} تم إدخاله", flush=True)
+
+    result = crud.import_file(args.table, args.path, rejects_path=args.rejects,
+                              chunk_size=args.chunk_size, progress=report)
+    print(f"✅ تم إدخال {result['inserted']} من {result['read']} صف")
+    if result['duplicates'] or result['rejected']:
+        print(f"⚠️ مكرر: {result['duplicates']} - مرفوض: {result['rejected']}")
+    sys.exit(0)
@@ -0,0 +1,180 @@
+"""
+ترقيات مخطط قاعدة البيانات المرقمة
+
+كل ترقية لها رقم إصدار متسلسل وتُنفذ مرة واحدة داخل معاملة مستقلة، ويُحفظ آخر
+إصدار مطبق في PRAGMA user_version. إذا كانت القاعدة محدثة لا يتم أي تعديل عليها.
+
+لإضافة ترقية جديدة: أضف دالة تستقبل cursor ثم أضفها في نهاية MIGRATIONS برقم أكبر.
+لا تعدل ترقية سبق نشرها.
+"""
+
+
+# الأعمدة التي أضيفت بعد الإصدار الأول من الجداول
+LEGACY_COLUMNS = [
+    ("treatments", "doctor_percentage", "REAL DEFAULT 50.0"),
+    ("treatments", "clinic_percentage", "REAL DEFAULT 50.0"),
+    ("payments", "doctor_share", "REAL DEFAULT 0.0"),
+    ("payments", "clinic_share", "REAL DEFAULT 0.0"),
+    ("payments", "doctor_percentage", "REAL DEFAULT 0.0"),
+    ("payments", "clinic_percentage", "REAL DEFAULT 0.0"),
+    ("patients", "blood_type", "TEXT"),
+    ("patients", "allergies", "TEXT"),
+    ("patients", "notes", "TEXT"),
+    ("patients", "is_active", "BOOLEAN DEFAULT 1"),
+    ("doctors", "is_active", "BOOLEAN DEFAULT 1"),
+    ("inventory", "location", "TEXT"),
+    ("inventory", "barcode", "TEXT"),
+    ("inventory", "is_active", "BOOLEAN DEFAULT 1"),
+    ("suppliers", "is_active", "BOOLEAN DEFAULT 1"),
+    ("appointments", "reminder_sent", "BOOLEAN DEFAULT 0"),
+    ("expenses", "approved_by", "TEXT"),
+    ("expenses", "is_recurring", "BOOLEAN DEFAULT 0"),
+]
+
+# الفهارس الثانوية للاستعلامات المتكررة: (اسم الفهرس، تعريف الفهرس)
+INDEXES = [
+    ("idx_appointments_date", "appointments (appointment_date, appointment_time)"),
+    ("idx_appointments_doctor_date", "appointments (doctor_id, appointment_date, appointment_time)"),
+    ("idx_appointments_patient_date", "appointments (patient_id, appointment_date)"),
+    ("idx_appointments_treatment", "appointments (treatment_id)"),
+    ("idx_payments_date", "payments (payment_date)"),
+    ("idx_payments_appointment", "payments (appointment_id)"),
+    ("idx_payments_patient", "payments (patient_id)"),
+    ("idx_expenses_date", "expenses (expense_date)"),
+    ("idx_expenses_category_date", "expenses (category, expense_date)"),
+    ("idx_inventory_expiry_active", "inventory (expiry_date) WHERE is_active = 1"),
+    ("idx_inventory_usage_inventory", "inventory_usage (inventory_id)"),
+    ("idx_inventory_usage_appointment", "inventory_usage (appointment_id)"),
+    ("idx_activity_log_created", "activity_log (created_at)"),
+    ("idx_patients_active_name", "patients (name) WHERE is_active = 1"),
+    ("idx_doctors_active_name", "doctors (name) WHERE is_active = 1"),
+    ("idx_treatments_active_name", "treatments (name) WHERE is_active = 1"),
+    ("idx_treatments_category", "treatments (category)"),
+]
+
+
+def _table_columns(cursor, table_name):
+    """أسماء أعمدة جدول"""
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")}
+
+
+# ========== الترقيات ==========
+def add_legacy_columns(cursor):
+    """إضافة الأعمدة الناقصة في القواعد القديمة"""
+    columns = {}
+    for table_name, column_name, definition in LEGACY_COLUMNS:
+        if table_name not in columns:
+            columns[table_name] = _table_columns(cursor, table_name)
+        if column_name not in columns[table_name]:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}")
+            columns[table_name].add(column_name)
+            print(f"✅ تم إضافة {column_name} إلى {table_name}")
+
+
+def create_indexes(cursor):
+    """إنشاء الفهارس الثانوية"""
+    for index_name, definition in INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+
+
+def seed_pragma_settings(cursor):
+    """إضافة إعدادات أداء قاعدة البيانات"""
+    from .models import PRAGMA_PROFILE
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO settings (key, value, description)
+        VALUES (?, ?, ?)
+    ''', [(key, default, description) for key, _, default, _, description in PRAGMA_PROFILE])
+
+
+def create_daily_rollups(cursor):
+    """الجداول التجميعية اليومية وتعبئتها من البيانات الحالية"""
+    from .rollups import create_rollups, fill_rollups
+
+    create_rollups(cursor)
+    fill_rollups(cursor)
+
+
+def create_patient_search(cursor):
+    """فهرس البحث النصي للمرضى وتعبئته"""
+    from .search import create_search_index, fill_search_index
+
+    create_search_index(cursor)
+    fill_search_index(cursor)
+
+
+def add_patient_phone_digits(cursor):
+    """أرقام هواتف المرضى المطبّعة مع فهارسها"""
+    from .phones import add_phone_columns
+
+    add_phone_columns(cursor)
+
+
+def create_patient_balances(cursor):
+    """دفتر أرصدة المرضى وتعبئته من المواعيد والمدفوعات"""
+    from .balances import create_balances, fill_balances
+
+    create_balances(cursor)
+    fill_balances(cursor)
+
+
+def renormalize_patient_search(cursor):
+    """إعادة إنشاء triggers فهرس البحث وتعبئته بعد توحيد تطبيع الهاتف مع phones.py"""
+    from .search import create_search_index, fill_search_index
+
+    create_search_index(cursor)
+    fill_search_index(cursor)
+
+
+# (الإصدار، الوصف، الدالة) - بالترتيب
+MIGRATIONS = [
+    (1, "أعمدة الجداول القديمة", add_legacy_columns),
+    (2, "الفهارس الثانوية", create_indexes),
+    (3, "إعدادات أداء قاعدة البيانات", seed_pragma_settings),
+    (4, "الجداول التجميعية اليومية", create_daily_rollups),
+    (5, "فهرس البحث النصي للمرضى", create_patient_search),
+    (6, "أرقام الهواتف المطبّعة للمرضى", add_patient_phone_digits),
+    (7, "دفتر أرصدة المرضى", create_patient_balances),
+    (8, "تطبيع الهواتف في فهرس البحث", renormalize_patient_search),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# ========== التشغيل ==========
+def get_schema_version(conn):
+    """إصدار المخطط الحالي"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn, migrations=MIGRATIONS):
+    """تطبيق الترقيات الناقصة، كل ترقية في معاملة مستقلة
+
+    يعيد قائمة الإصدارات التي تم تطبيقها (فارغة إذا كانت القاعدة محدثة).
+    """
+    # المسار السريع: قراءة فقط بدون أي كتابة
+    if get_schema_version(conn) >= migrations[-1][0]:
+        return []
+
+    applied = []
+    for version, description, step in migrations:
+        if version <= get_schema_version(conn):
+            continue
+
+        # BEGIN IMMEDIATE يمنع عمليتين من تطبيق نفس الترقية في آن واحد
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append(version)
+        print(f"✅ تم تطبيق الترقية {version}: {description}")
+
+    return applied
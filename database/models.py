@@ -1,17 +1,87 @@
 import sqlite3
+import threading
 from datetime import datetime, date, timedelta
 import os
 
+from .pool import ConnectionPool
+from .migrations import run_migrations
+
+# ملف أداء SQLite: (مفتاح الإعداد، اسم PRAGMA، القيمة الافتراضية، القيم المسموحة أو النوع، الوصف)
+PRAGMA_PROFILE = [
+    ("db_journal_mode", "journal_mode", "WAL", ("WAL", "DELETE", "TRUNCATE", "PERSIST"), "وضع سجل المعاملات"),
+    ("db_synchronous", "synchronous", "NORMAL", ("OFF", "NORMAL", "FULL", "EXTRA"), "مستوى المزامنة مع القرص"),
+    ("db_mmap_size", "mmap_size", "268435456", int, "حجم الذاكرة المعيّنة بالبايت"),
+    ("db_cache_size", "cache_size", "-65536", int, "حجم ذاكرة الصفحات (سالب = كيلوبايت)"),
+    ("db_temp_store", "temp_store", "MEMORY", ("DEFAULT", "FILE", "MEMORY"), "مكان الجداول المؤقتة"),
+    ("db_busy_timeout", "busy_timeout", "5000", int, "مهلة انتظار القفل بالملي ثانية"),
+]
+
+DEFAULT_DB_PATH = "clinic.db"
+
 class Database:
     _instance = None
     
-    def __new__(cls, db_path="clinic.db"):
+    # إعدادات مجمع الاتصالات
+    POOL_MAX_SIZE = 8
+    POOL_IDLE_TIMEOUT = 300
+    
+    def __new__(cls, db_path=DEFAULT_DB_PATH):
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls)
             cls._instance.db_path = db_path
             cls._instance._initialized = False
+            cls._instance._pool = None
+            cls._instance._pragma_profile = None
+            cls._instance._pool_lock = threading.Lock()
+            cls._instance._watch_conn = None
+            cls._instance._watch_lock = threading.Lock()
+            cls._instance._bootstrap_lock = threading.Lock()
+            cls._instance._bootstrapped = False
+            cls._instance.bootstrap_enabled = True
+            cls._instance.read_only = False
+            cls._instance.profile_overrides = {}
         return cls._instance
     
+    @classmethod
+    def open(cls, db_path=DEFAULT_DB_PATH, profile=None, bootstrap=True, read_only=False):
+        """إعداد قاعدة البيانات بدون أي عمليات عليها
+
+        - profile: قيم PRAGMA تتجاوز الإعدادات المحفوظة، مثل {'synchronous': 'FULL'}
+        - bootstrap=False: عدم إنشاء الجداول أو تطبيق الترقيات (للأدوات والاختبارات)
+        - read_only=True: فتح الملف للقراءة فقط بدون تهيئة
+
+        يتم إنشاء الجداول وتطبيق الترقيات مرة واحدة عند أول استخدام فعلي.
+        """
+        instance = cls(db_path)
+        
+        if instance.db_path != db_path or instance.read_only != read_only:
+            instance.close_connections()
+            instance.db_path = db_path
+            instance._initialized = False
+            instance._bootstrapped = False
+        
+        instance.read_only = read_only
+        instance.bootstrap_enabled = bootstrap and not read_only
+        instance.profile_overrides = {}
+        for pragma, value in (profile or {}).items():
+            allowed = next((rule for _, name, _, rule, _ in PRAGMA_PROFILE if name == pragma), None)
+            if allowed is None:
+                raise ValueError(f"Unknown PRAGMA in profile: {pragma}")
+            instance.profile_overrides[pragma] = instance._validate_pragma(value, allowed)
+        instance._pragma_profile = None
+        return instance
+    
+    def ensure_ready(self):
+        """إنشاء الجداول وتطبيق الترقيات مرة واحدة لكل عملية"""
+        if self._bootstrapped or not self.bootstrap_enabled:
+            return
+        with self._bootstrap_lock:
+            if self._bootstrapped:
+                return
+            self.initialize()
+            self.upgrade_schema()
+            self._bootstrapped = True
+    
     def initialize(self):
         """إنشاء قاعدة البيانات والجداول إذا لم تكن موجودة"""
         if not self._initialized:
@@ -374,7 +444,7 @@ class Database:
                     ("reminder_days", "1", "عدد أيام التذكير قبل الموعد"),
                     ("low_stock_alert", "1", "تفعيل تنبيهات المخزون المنخفض"),
                     ("backup_enabled", "1", "تفعيل النسخ الاحتياطي التلقائي")
-                ]
+                ] + [(key, default, description) for key, _, default, _, description in PRAGMA_PROFILE]
                 cursor.executemany('''
                     INSERT INTO settings (key, value, description) 
                     VALUES (?, ?, ?)
@@ -387,47 +457,129 @@ class Database:
     def upgrade_schema(self):
         """ترقية قاعدة البيانات بدون حذف البيانات"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # قائمة التعديلات للتحقق منها
-                alterations = [
-                    ("treatments", "doctor_percentage", "ALTER TABLE treatments ADD COLUMN doctor_percentage REAL DEFAULT 50.0"),
-                    ("treatments", "clinic_percentage", "ALTER TABLE treatments ADD COLUMN clinic_percentage REAL DEFAULT 50.0"),
-                    ("payments", "doctor_share", "ALTER TABLE payments ADD COLUMN doctor_share REAL DEFAULT 0.0"),
-                    ("payments", "clinic_share", "ALTER TABLE payments ADD COLUMN clinic_share REAL DEFAULT 0.0"),
-                    ("payments", "doctor_percentage", "ALTER TABLE payments ADD COLUMN doctor_percentage REAL DEFAULT 0.0"),
-                    ("payments", "clinic_percentage", "ALTER TABLE payments ADD COLUMN clinic_percentage REAL DEFAULT 0.0"),
-                    ("patients", "blood_type", "ALTER TABLE patients ADD COLUMN blood_type TEXT"),
-                    ("patients", "allergies", "ALTER TABLE patients ADD COLUMN allergies TEXT"),
-                    ("patients", "notes", "ALTER TABLE patients ADD COLUMN notes TEXT"),
-                    ("patients", "is_active", "ALTER TABLE patients ADD COLUMN is_active BOOLEAN DEFAULT 1"),
-                    ("doctors", "is_active", "ALTER TABLE doctors ADD COLUMN is_active BOOLEAN DEFAULT 1"),
-                    ("inventory", "location", "ALTER TABLE inventory ADD COLUMN location TEXT"),
-                    ("inventory", "barcode", "ALTER TABLE inventory ADD COLUMN barcode TEXT"),
-                    ("inventory", "is_active", "ALTER TABLE inventory ADD COLUMN is_active BOOLEAN DEFAULT 1"),
-                    ("suppliers", "is_active", "ALTER TABLE suppliers ADD COLUMN is_active BOOLEAN DEFAULT 1"),
-                    ("appointments", "reminder_sent", "ALTER TABLE appointments ADD COLUMN reminder_sent BOOLEAN DEFAULT 0"),
-                    ("expenses", "approved_by", "ALTER TABLE expenses ADD COLUMN approved_by TEXT"),
-                    ("expenses", "is_recurring", "ALTER TABLE expenses ADD COLUMN is_recurring BOOLEAN DEFAULT 0"),
-                ]
-                
-                for table_name, column_name, sql in alterations:
-                    try:
-                        cursor.execute(sql)
-                        print(f"✅ تم إضافة {column_name} إلى {table_name}")
-                    except sqlite3.OperationalError:
-                        pass  # العمود موجود مسبقاً
-                
-                conn.commit()
-                print("✅ تمت ترقية قاعدة البيانات بنجاح!")
+            conn = sqlite3.connect(self.db_path)
+            try:
+                if run_migrations(conn):
+                    print("✅ تمت ترقية قاعدة البيانات بنجاح!")
+            finally:
+                conn.close()
                 
         except sqlite3.Error as e:
             print(f"❌ خطأ في ترقية قاعدة البيانات: {e}")
     
+    def _connect_args(self):
+        """مسار الاتصال (URI للقراءة فقط)"""
+        if self.read_only:
+            return f"file:{self.db_path}?mode=ro", True
+        return self.db_path, False
+    
     def get_connection(self):
         """الحصول على اتصال بقاعدة البيانات"""
-        return sqlite3.connect(self.db_path)
+        self.ensure_ready()
+        target, uri = self._connect_args()
+        conn = sqlite3.connect(target, uri=uri)
+        self.apply_pragmas(conn)
+        return conn
+    
+    # ========== إعدادات الأداء (PRAGMA) ==========
+    @staticmethod
+    def _validate_pragma(value, allowed):
+        """التحقق من قيمة PRAGMA (لا يمكن تمريرها كمعامل في SQL)"""
+        if allowed is int:
+            return int(value)
+        value = str(value).upper()
+        if value not in allowed:
+            raise ValueError(f"Invalid PRAGMA value: {value}")
+        return value
+    
+    def load_pragma_profile(self, conn):
+        """قراءة ملف الأداء من جدول الإعدادات مع القيم الافتراضية"""
+        stored = {}
+        try:
+            keys = [key for key, *_ in PRAGMA_PROFILE]
+            rows = conn.execute(
+                f"SELECT key, value FROM settings WHERE key IN ({', '.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+            stored = dict(rows)
+        except sqlite3.OperationalError:
+            pass  # جدول الإعدادات غير موجود بعد
+        
+        profile = {}
+        for key, pragma, default, allowed, _ in PRAGMA_PROFILE:
+            try:
+                profile[pragma] = self._validate_pragma(stored.get(key, default), allowed)
+            except (TypeError, ValueError):
+                print(f"⚠️ قيمة غير صالحة للإعداد {key}، سيتم استخدام القيمة الافتراضية")
+                profile[pragma] = self._validate_pragma(default, allowed)
+        profile.update(self.profile_overrides)
+        if self.read_only:
+            # لا يمكن تغيير وضع السجل على اتصال للقراءة فقط
+            profile.pop('journal_mode', None)
+        return profile
+    
+    def apply_pragmas(self, conn):
+        """تطبيق ملف الأداء على اتصال جديد"""
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self._pragma_profile is None:
+            self._pragma_profile = self.load_pragma_profile(conn)
+        for pragma, value in self._pragma_profile.items():
+            try:
+                conn.execute(f"PRAGMA {pragma} = {value}")
+            except sqlite3.OperationalError as e:
+                # مثلاً تغيير journal_mode أثناء وجود اتصالات أخرى
+                print(f"⚠️ تعذر تطبيق PRAGMA {pragma}: {e}")
+    
+    def reload_pragma_profile(self):
+        """إعادة تحميل ملف الأداء بعد تعديل الإعدادات"""
+        self._pragma_profile = None
+        self.close_connections()
+    
+    @property
+    def pool(self):
+        """مجمع الاتصالات (يُنشأ عند أول استخدام)"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    target, uri = self._connect_args()
+                    self._pool = ConnectionPool(
+                        target,
+                        max_size=self.POOL_MAX_SIZE,
+                        idle_timeout=self.POOL_IDLE_TIMEOUT,
+                        on_connect=self.apply_pragmas,
+                        uri=uri
+                    )
+        return self._pool
+    
+    def connection(self):
+        """استعارة اتصال من المجمع: with db.connection() as conn"""
+        self.ensure_ready()
+        return self.pool.connection()
+    
+    def data_version(self):
+        """PRAGMA data_version من اتصال مراقبة ثابت
+        
+        القيمة تتغير بعد أي commit من اتصال آخر (من المجمع أو من عملية أخرى مثل أدوات سطر الأوامر).
+        """
+        with self._watch_lock:
+            if self._watch_conn is None:
+                # أول اتصال من المجمع يطبق إعدادات الأداء (مثل WAL) قبل بدء المراقبة
+                with self.connection():
+                    pass
+                target, uri = self._connect_args()
+                self._watch_conn = sqlite3.connect(target, uri=uri, check_same_thread=False)
+            return self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def close_connections(self):
+        """إغلاق جميع اتصالات المجمع (يُعاد إنشاؤه عند الاستخدام التالي)"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close_all()
+        with self._watch_lock:
+            watch_conn, self._watch_conn = self._watch_conn, None
+        if watch_conn is not None:
+            watch_conn.close()
     
     def backup_database(self, backup_path=None):
         """إنشاء نسخة احتياطية من قاعدة البيانات"""
@@ -436,15 +588,37 @@ class Database:
             backup_path = f"clinic_backup_{timestamp}.db"
         
         try:
-            import shutil
-            shutil.copy2(self.db_path, backup_path)
+            # استخدام واجهة النسخ في SQLite لتضمين محتوى ملف WAL
+            with self.connection() as source:
+                target = sqlite3.connect(backup_path)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
             print(f"✅ تم إنشاء نسخة احتياطية: {backup_path}")
             return backup_path
         except Exception as e:
             print(f"❌ خطأ في إنشاء النسخة الاحتياطية: {e}")
             return None
 
-# تهيئة قاعدة البيانات
+# ========== أدوات سطر الأوامر ==========
+def add_database_arguments(parser, read_only=False):
+    """خيارات قاعدة البيانات المشتركة: --db و --no-bootstrap (و --read-only للأدوات التي لا تكتب)"""
+    parser.add_argument('--db', dest='db_path', default=DEFAULT_DB_PATH, help="ملف قاعدة البيانات")
+    parser.add_argument('--no-bootstrap', action='store_true',
+                        help="عدم إنشاء الجداول أو تطبيق الترقيات (لقاعدة موجودة)")
+    parser.add_argument('--pragma', action='append', default=[], metavar='NAME=VALUE',
+                        help="تجاوز إعداد أداء لهذا التشغيل فقط، مثل synchronous=OFF")
+    if read_only:
+        parser.add_argument('--read-only', action='store_true', help="فتح الملف للقراءة فقط")
+
+
+def open_from_args(args):
+    """Database.open من خيارات add_database_arguments (التهيئة عند أول استخدام)"""
+    profile = dict(item.split('=', 1) for item in args.pragma)
+    return Database.open(args.db_path, profile=profile, bootstrap=not args.no_bootstrap,
+                         read_only=getattr(args, 'read_only', False))
+
+
+# قاعدة البيانات الافتراضية - التهيئة تتم عند أول استخدام
 db = Database()
-db.initialize()
-db.upgrade_schema()
@@ -0,0 +1,62 @@
+"""
+تطبيع أرقام الهواتف للبحث السريع
+
+أعمدة phone_digits و emergency_digits في جدول المرضى أعمدة محسوبة (generated) من
+phone و emergency_contact بنفس القواعد هنا، وعليها فهارس، لذلك البحث برقم الهاتف
+هو قراءة واحدة من الفهرس مهما كان تنسيق الرقم المخزن أو المكتوب:
+
+- حذف المسافات والشرطات والأقواس و + و . و /
+- تحويل الأرقام العربية (٠١٢...) إلى أرقام لاتينية
+- 0020xxxxxxxxxx و 20xxxxxxxxxx (كود مصر) -> 0xxxxxxxxxx
+- الرقم الفارغ يصبح NULL (لا يدخل في الفهرس)
+"""
+
+PHONE_SEPARATORS = [' ', '-', '+', '(', ')', '.', '/']
+ARABIC_DIGITS = [(chr(0x0660 + digit), str(digit)) for digit in range(10)]
+
+# (العمود المحسوب، العمود الأصلي)
+PHONE_COLUMNS = [
+    ('phone_digits', 'phone'),
+    ('emergency_digits', 'emergency_contact'),
+]
+
+_TRANSLATION = str.maketrans({**{separator: '' for separator in PHONE_SEPARATORS},
+                              **dict(ARABIC_DIGITS)})
+
+
+def normalize_phone(phone):
+    """الرقم بعد التطبيع (أو None إذا كان فارغاً)"""
+    digits = (phone or "").translate(_TRANSLATION)
+    if digits.startswith('0020'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('20') and len(digits) == 12:
+        digits = '0' + digits[2:]
+    return digits or None
+
+
+def phone_digits_sql(column):
+    """تعبير SQL مطابق لـ normalize_phone"""
+    digits = column
+    for old, new in [(separator, '') for separator in PHONE_SEPARATORS] + ARABIC_DIGITS:
+        digits = f"replace({digits}, '{old}', '{new}')"
+    return f'''NULLIF(CASE
+        WHEN {digits} LIKE '0020%' THEN '0' || substr({digits}, 5)
+        WHEN {digits} LIKE '20%' AND length({digits}) = 12 THEN '0' || substr({digits}, 3)
+        ELSE {digits}
+    END, '')'''
+
+
+def add_phone_columns(cursor):
+    """إضافة الأعمدة المحسوبة والفهارس (القيم تحسب تلقائياً للصفوف الموجودة عند بناء الفهرس)"""
+    # table_xinfo لأن table_info لا يعرض الأعمدة المحسوبة
+    existing_columns = {row[1] for row in cursor.execute("PRAGMA table_xinfo(patients)")}
+    for column, source in PHONE_COLUMNS:
+        if column not in existing_columns:
+            cursor.execute(f'''
+                ALTER TABLE patients ADD COLUMN {column} TEXT
+                GENERATED ALWAYS AS ({phone_digits_sql(source)}) VIRTUAL
+            ''')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_patients_{column}
+            ON patients ({column}) WHERE {column} IS NOT NULL
+        ''')
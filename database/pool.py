@@ -0,0 +1,189 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """مجمع اتصالات SQLite طويلة العمر
+
+    - كل خيط (thread) يعيد استخدام نفس الاتصال للاستدعاءات المتداخلة
+    - عند انتهاء الاستعارة يعود الاتصال إلى قائمة الاتصالات الخاملة
+    - الحد الأقصى لعدد الاتصالات المفتوحة ثابت (max_size)
+    - يتم فحص الاتصال الخامل قبل إعادة استخدامه وإغلاق الاتصالات الخاملة لفترة طويلة
+    """
+
+    def __init__(self, db_path, max_size=8, idle_timeout=300, acquire_timeout=30,
+                 health_check_after=30, on_connect=None, uri=False):
+        self.db_path = db_path
+        self.uri = uri
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.on_connect = on_connect
+
+        self._lock = threading.Condition()
+        self._idle = []  # [(conn, last_used)]
+        self._open_count = 0
+        self._local = threading.local()
+        self._closed = False
+
+    # ========== إنشاء وفحص الاتصالات ==========
+    def _create_connection(self):
+        """فتح اتصال جديد وتطبيق إعدادات الاتصال"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, uri=self.uri)
+        if self.on_connect:
+            try:
+                self.on_connect(conn)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        """التحقق من أن الاتصال ما زال صالحاً"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        """إغلاق اتصال وإخراجه من العدّاد"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open_count -= 1
+            self._lock.notify()
+
+    def _evict_idle(self, now):
+        """إغلاق الاتصالات الخاملة لفترة أطول من idle_timeout (يُستدعى مع القفل)"""
+        expired = [conn for conn, last_used in self._idle if now - last_used > self.idle_timeout]
+        if expired:
+            self._idle = [(conn, last_used) for conn, last_used in self._idle
+                          if now - last_used <= self.idle_timeout]
+            self._open_count -= len(expired)
+            self._lock.notify_all()
+        return expired
+
+    # ========== الاستعارة والإرجاع ==========
+    def acquire(self):
+        """استعارة اتصال (نفس الاتصال إذا كان الخيط يملك اتصالاً بالفعل)"""
+        owned = getattr(self._local, 'conn', None)
+        if owned is not None:
+            self._local.depth += 1
+            return owned
+
+        conn = None
+        while conn is None:
+            now = time.monotonic()
+            deadline = now + self.acquire_timeout
+            candidate, last_used = None, None
+
+            with self._lock:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                expired = self._evict_idle(now)
+                while not self._idle and self._open_count >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise sqlite3.OperationalError(
+                            f"Connection pool exhausted ({self.max_size} connections in use)"
+                        )
+                    self._lock.wait(remaining)
+                if self._idle:
+                    candidate, last_used = self._idle.pop()
+                else:
+                    self._open_count += 1
+
+            for stale in expired:
+                try:
+                    stale.close()
+                except sqlite3.Error:
+                    pass
+
+            if candidate is None:
+                try:
+                    conn = self._create_connection()
+                except Exception:
+                    with self._lock:
+                        self._open_count -= 1
+                        self._lock.notify()
+                    raise
+            elif now - last_used > self.health_check_after and not self._is_healthy(candidate):
+                self._discard(candidate)
+            else:
+                conn = candidate
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn):
+        """إرجاع الاتصال إلى المجمع عند انتهاء آخر استعارة في الخيط"""
+        if getattr(self._local, 'conn', None) is not conn:
+            raise sqlite3.ProgrammingError("Connection was not acquired by this thread")
+
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+
+        self._local.conn = None
+
+        # لا نعيد اتصالاً فيه معاملة مفتوحة
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            if self._closed:
+                self._open_count -= 1
+                conn.close()
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """مدير سياق لاستعارة اتصال وإرجاعه تلقائياً"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            # التراجع فقط في الاستعارة الخارجية حتى لا نلغي عمل المستدعي
+            if self._local.depth == 1 and conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    # ========== الإدارة ==========
+    def close_all(self):
+        """إغلاق جميع الاتصالات الخاملة وإيقاف المجمع"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._lock.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self):
+        """إحصائيات المجمع"""
+        with self._lock:
+            return {
+                'open': self._open_count,
+                'idle': len(self._idle),
+                'in_use': self._open_count - len(self._idle),
+                'max_size': self.max_size,
+            }
@@ -0,0 +1,133 @@
+"""
+فحص خطط تنفيذ الاستعلامات المتكررة (EXPLAIN QUERY PLAN)
+
+يشغّل استعلامات CRUD المعروفة ويلتقط جمل SQL الفعلية ثم يتحقق من أن أياً منها
+لا يقوم بمسح كامل لجدول كبير. الاستخدام:
+
+    python -m database.query_plans
+    python -m database.query_plans --db clinic.db --read-only
+"""
+
+import argparse
+import re
+import sys
+from datetime import date, timedelta
+
+# الجداول التي تكبر مع الوقت ولا يُسمح بمسحها بالكامل
+LARGE_TABLES = {'appointments', 'payments', 'expenses', 'activity_log', 'inventory_usage', 'patients'}
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?$')
+_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+
+
+def _hot_queries():
+    """استدعاءات CRUD التي يجب أن تستخدم الفهارس"""
+    today = date.today()
+    start = (today - timedelta(days=30)).isoformat()
+    end = today.isoformat()
+    return [
+        ("get_appointments_by_date", lambda c: c.get_appointments_by_date(end)),
+        ("get_appointments_by_doctor", lambda c: c.get_appointments_by_doctor(1, start, end)),
+        ("get_upcoming_appointments", lambda c: c.get_upcoming_appointments(days=7)),
+        ("get_doctor_schedule", lambda c: c.get_doctor_schedule(1, end)),
+        ("get_patient_history", lambda c: c.get_patient_history(1)),
+        ("get_financial_summary", lambda c: c.get_financial_summary(start, end)),
+        ("get_daily_appointments_count", lambda c: c.get_daily_appointments_count()),
+        ("get_revenue_by_period", lambda c: c.get_revenue_by_period(start, end, 'month')),
+        ("get_expenses_by_category", lambda c: c.get_expenses_by_category(start, end)),
+        ("get_appointment_status_stats", lambda c: c.get_appointment_status_stats(start, end)),
+        ("get_payment_methods_stats", lambda c: c.get_payment_methods_stats(start, end)),
+        ("get_top_patients", lambda c: c.get_top_patients(start, end)),
+        ("get_daily_revenue_comparison", lambda c: c.get_daily_revenue_comparison(days=30)),
+        ("get_monthly_comparison", lambda c: c.get_monthly_comparison(months=6)),
+        ("get_doctor_performance", lambda c: c.get_doctor_performance(start, end)),
+        ("get_doctor_earnings", lambda c: c.get_doctor_earnings(1, start, end)),
+        ("get_clinic_earnings", lambda c: c.get_clinic_earnings(start, end)),
+        ("get_all_doctor_earnings", lambda c: c.get_all_doctor_earnings(start, end)),
+        ("get_expiring_inventory", lambda c: c.get_expiring_inventory(days=60)),
+        ("get_activity_log", lambda c: c.get_activity_log(limit=100)),
+        ("get_all_appointments(window)", lambda c: c.get_all_appointments(start_date=start, end_date=end)),
+        ("get_all_appointments(doctor)", lambda c: c.get_all_appointments(start, end, doctor_id=1)),
+        ("get_all_payments(window)", lambda c: c.get_all_payments(start_date=start, end_date=end)),
+        ("get_all_expenses(window)", lambda c: c.get_all_expenses(start_date=start, end_date=end)),
+        ("search_patients", lambda c: c.search_patients("احمد")),
+        ("find_patient_by_phone", lambda c: c.find_patient_by_phone("01012345678", include_emergency=True)),
+        ("get_appointment_billing_context", lambda c: c.get_appointment_billing_context(1)),
+        ("get_receivables", lambda c: c.get_receivables()),
+        ("check_appointment_conflicts", lambda c: c.check_appointment_conflicts(1, 1, start, "10:00", 1)),
+        ("search_patient_options", lambda c: c.search_patient_options("احم")),
+        ("search_appointment_options(recent)", lambda c: c.search_appointment_options()),
+        ("search_appointment_options", lambda c: c.search_appointment_options("احم")),
+        ("find_free_slots", lambda c: c.find_free_slots(1, days=30, limit=5)),
+    ]
+
+
+def _table_aliases(sql):
+    """ربط الأسماء المستعارة في الاستعلام بأسماء الجداول"""
+    aliases = {}
+    for table, alias in _ALIAS.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.upper() not in ('ON', 'WHERE', 'LEFT', 'JOIN', 'GROUP', 'ORDER', 'INNER'):
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+def find_full_scans(crud):
+    """إرجاع قائمة (اسم الاستعلام، الجدول، تفاصيل الخطة) لكل مسح كامل لجدول كبير"""
+    problems = []
+
+    # النتائج المخزنة مؤقتاً لا تنفذ SQL، لذلك نعطل الذاكرة المؤقتة أثناء الفحص
+    cache_enabled = crud.cache.enabled
+    crud.cache.enabled = False
+
+    with crud.db.connection() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        captured = []
+        try:
+            for name, call in _hot_queries():
+                first = len(statements)
+                call(crud)
+                captured.append((name, statements[first:]))
+        finally:
+            conn.set_trace_callback(None)
+            crud.cache.enabled = cache_enabled
+
+        for name, sqls in captured:
+            for sql in sqls:
+                if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                aliases = _table_aliases(sql)
+                for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall():
+                    match = _FULL_SCAN.match(row[3])
+                    if not match:
+                        continue
+                    table = aliases.get(match.group(1).lower(), match.group(1).lower())
+                    if table in LARGE_TABLES:
+                        problems.append((name, table, row[3]))
+
+    return problems
+
+
+def check_query_plans(crud):
+    """رفع خطأ إذا كان أي استعلام معروف يقوم بمسح كامل لجدول كبير"""
+    problems = find_full_scans(crud)
+    if problems:
+        details = "\n".join(f"  {name}: {detail} ({table})" for name, table, detail in problems)
+        raise AssertionError(f"Full table scans in hot queries:\n{details}")
+
+
+if __name__ == "__main__":
+    from .crud import crud as _crud
+    from .models import add_database_arguments, open_from_args
+
+    parser = argparse.ArgumentParser(description="فحص خطط تنفيذ الاستعلامات المتكررة")
+    add_database_arguments(parser, read_only=True)
+    open_from_args(parser.parse_args())
+
+    found = find_full_scans(_crud)
+    for query_name, table_name, plan_detail in found:
+        print(f"❌ {query_name}: {plan_detail} ({table_name})")
+    if not found:
+        print("✅ جميع الاستعلامات المتكررة تستخدم الفهارس")
+    sys.exit(1 if found else 0)
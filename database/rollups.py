@@ -0,0 +1,244 @@
+"""
+الجداول التجميعية اليومية (Daily Rollups)
+
+تقارير الإيرادات والمصروفات والمواعيد تقرأ من جداول مجمعة على مستوى اليوم بدلاً من
+تجميع الصفوف الخام في كل مرة. يتم تحديث الجداول تلقائياً عند كل إضافة أو تعديل أو حذف
+عن طريق triggers داخل نفس المعاملة، لذلك لا تحتاج دوال CRUD لأي تعديل.
+
+إعادة البناء الكاملة (بعد استيراد مباشر أو تعديل يدوي في قاعدة البيانات):
+
+    python -m database.rollups
+"""
+
+import argparse
+import sys
+
+
+# الطبيب والطريقة والفئة تخزن كقيم غير فارغة حتى يعمل المفتاح الأساسي مع ON CONFLICT
+ROLLUP_TABLES = [
+    ('daily_revenue', '''
+        CREATE TABLE IF NOT EXISTS daily_revenue (
+            day TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            payment_count INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            doctor_share REAL NOT NULL DEFAULT 0,
+            clinic_share REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, payment_method, doctor_id)
+        ) WITHOUT ROWID
+    '''),
+    ('daily_expenses', '''
+        CREATE TABLE IF NOT EXISTS daily_expenses (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category)
+        ) WITHOUT ROWID
+    '''),
+    ('daily_appointments', '''
+        CREATE TABLE IF NOT EXISTS daily_appointments (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            appointment_count INTEGER NOT NULL DEFAULT 0,
+            total_cost REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status, doctor_id)
+        ) WITHOUT ROWID
+    '''),
+]
+
+# ========== قوالب التحديث ==========
+# {row} = NEW أو OLD، {sign} = 1 أو -1
+
+_PAYMENT_DELTA = '''
+    INSERT INTO daily_revenue (day, payment_method, doctor_id, payment_count,
+                               amount, doctor_share, clinic_share)
+    SELECT {row}.payment_date,
+           COALESCE({row}.payment_method, ''),
+           COALESCE((SELECT doctor_id FROM appointments WHERE id = {row}.appointment_id), 0),
+           {sign},
+           {sign} * COALESCE({row}.amount, 0),
+           {sign} * COALESCE({row}.doctor_share, 0),
+           {sign} * COALESCE({row}.clinic_share, 0)
+    WHERE true
+    ON CONFLICT (day, payment_method, doctor_id) DO UPDATE SET
+        payment_count = payment_count + excluded.payment_count,
+        amount = amount + excluded.amount,
+        doctor_share = doctor_share + excluded.doctor_share,
+        clinic_share = clinic_share + excluded.clinic_share;
+'''
+
+_EXPENSE_DELTA = '''
+    INSERT INTO daily_expenses (day, category, expense_count, amount)
+    VALUES ({row}.expense_date, COALESCE({row}.category, ''), {sign},
+            {sign} * COALESCE({row}.amount, 0))
+    ON CONFLICT (day, category) DO UPDATE SET
+        expense_count = expense_count + excluded.expense_count,
+        amount = amount + excluded.amount;
+'''
+
+_APPOINTMENT_DELTA = '''
+    INSERT INTO daily_appointments (day, status, doctor_id, appointment_count, total_cost)
+    VALUES ({row}.appointment_date, COALESCE({row}.status, ''), COALESCE({row}.doctor_id, 0),
+            {sign}, {sign} * COALESCE({row}.total_cost, 0))
+    ON CONFLICT (day, status, doctor_id) DO UPDATE SET
+        appointment_count = appointment_count + excluded.appointment_count,
+        total_cost = total_cost + excluded.total_cost;
+'''
+
+# نقل إيرادات موعد من طبيب لآخر عند تغيير doctor_id في الموعد
+_MOVE_APPOINTMENT_REVENUE = '''
+    INSERT INTO daily_revenue (day, payment_method, doctor_id, payment_count,
+                               amount, doctor_share, clinic_share)
+    SELECT payment_date, COALESCE(payment_method, ''), COALESCE({row}.doctor_id, 0),
+           {sign} * COUNT(*),
+           {sign} * COALESCE(SUM(amount), 0),
+           {sign} * COALESCE(SUM(doctor_share), 0),
+           {sign} * COALESCE(SUM(clinic_share), 0)
+    FROM payments
+    WHERE appointment_id = NEW.id
+    GROUP BY payment_date, COALESCE(payment_method, '')
+    ON CONFLICT (day, payment_method, doctor_id) DO UPDATE SET
+        payment_count = payment_count + excluded.payment_count,
+        amount = amount + excluded.amount,
+        doctor_share = doctor_share + excluded.doctor_share,
+        clinic_share = clinic_share + excluded.clinic_share;
+'''
+
+# حذف الصفوف التي أصبح عددها صفراً (مقيد باليوم حتى يستخدم المفتاح الأساسي)
+_REVENUE_CLEANUP = "DELETE FROM daily_revenue WHERE day = {row}.payment_date AND payment_count = 0;"
+_EXPENSE_CLEANUP = "DELETE FROM daily_expenses WHERE day = {row}.expense_date AND expense_count = 0;"
+_APPOINTMENT_CLEANUP = ("DELETE FROM daily_appointments "
+                        "WHERE day = {row}.appointment_date AND appointment_count = 0;")
+_MOVED_REVENUE_CLEANUP = '''
+    DELETE FROM daily_revenue
+    WHERE day IN (SELECT payment_date FROM payments WHERE appointment_id = NEW.id)
+    AND payment_count = 0;
+'''
+
+
+def _trigger_body(*statements):
+    return "\n".join(statements)
+
+
+def _add(template):
+    return template.format(row='NEW', sign=1)
+
+
+def _remove(template):
+    return template.format(row='OLD', sign=-1)
+
+
+def _old(template):
+    return template.format(row='OLD')
+
+
+# (اسم الـ trigger، الحدث، الجسم)
+TRIGGERS = [
+    ('trg_payments_rollup_insert', 'AFTER INSERT ON payments',
+     _trigger_body(_add(_PAYMENT_DELTA))),
+    ('trg_payments_rollup_delete', 'AFTER DELETE ON payments',
+     _trigger_body(_remove(_PAYMENT_DELTA), _old(_REVENUE_CLEANUP))),
+    ('trg_payments_rollup_update',
+     'AFTER UPDATE OF payment_date, payment_method, appointment_id, amount, '
+     'doctor_share, clinic_share ON payments',
+     _trigger_body(_remove(_PAYMENT_DELTA), _add(_PAYMENT_DELTA), _old(_REVENUE_CLEANUP))),
+
+    ('trg_expenses_rollup_insert', 'AFTER INSERT ON expenses',
+     _trigger_body(_add(_EXPENSE_DELTA))),
+    ('trg_expenses_rollup_delete', 'AFTER DELETE ON expenses',
+     _trigger_body(_remove(_EXPENSE_DELTA), _old(_EXPENSE_CLEANUP))),
+    ('trg_expenses_rollup_update', 'AFTER UPDATE OF expense_date, category, amount ON expenses',
+     _trigger_body(_remove(_EXPENSE_DELTA), _add(_EXPENSE_DELTA), _old(_EXPENSE_CLEANUP))),
+
+    ('trg_appointments_rollup_insert', 'AFTER INSERT ON appointments',
+     _trigger_body(_add(_APPOINTMENT_DELTA))),
+    ('trg_appointments_rollup_delete', 'AFTER DELETE ON appointments',
+     _trigger_body(_remove(_APPOINTMENT_DELTA), _old(_APPOINTMENT_CLEANUP))),
+    ('trg_appointments_rollup_update',
+     'AFTER UPDATE OF appointment_date, status, doctor_id, total_cost ON appointments',
+     _trigger_body(_remove(_APPOINTMENT_DELTA), _add(_APPOINTMENT_DELTA),
+                   _old(_APPOINTMENT_CLEANUP))),
+    ('trg_appointments_rollup_doctor',
+     'AFTER UPDATE OF doctor_id ON appointments '
+     'WHEN COALESCE(OLD.doctor_id, 0) != COALESCE(NEW.doctor_id, 0)',
+     _trigger_body(_remove(_MOVE_APPOINTMENT_REVENUE), _add(_MOVE_APPOINTMENT_REVENUE),
+                   _MOVED_REVENUE_CLEANUP)),
+]
+
+# إعادة البناء من الصفوف الخام
+_REBUILD = [
+    ('daily_revenue', '''
+        INSERT INTO daily_revenue (day, payment_method, doctor_id, payment_count,
+                                   amount, doctor_share, clinic_share)
+        SELECT pay.payment_date, COALESCE(pay.payment_method, ''), COALESCE(a.doctor_id, 0),
+               COUNT(*), COALESCE(SUM(pay.amount), 0),
+               COALESCE(SUM(pay.doctor_share), 0), COALESCE(SUM(pay.clinic_share), 0)
+        FROM payments pay
+        LEFT JOIN appointments a ON pay.appointment_id = a.id
+        GROUP BY 1, 2, 3
+    '''),
+    ('daily_expenses', '''
+        INSERT INTO daily_expenses (day, category, expense_count, amount)
+        SELECT expense_date, COALESCE(category, ''), COUNT(*), COALESCE(SUM(amount), 0)
+        FROM expenses
+        GROUP BY 1, 2
+    '''),
+    ('daily_appointments', '''
+        INSERT INTO daily_appointments (day, status, doctor_id, appointment_count, total_cost)
+        SELECT appointment_date, COALESCE(status, ''), COALESCE(doctor_id, 0),
+               COUNT(*), COALESCE(SUM(total_cost), 0)
+        FROM appointments
+        GROUP BY 1, 2, 3
+    '''),
+]
+
+
+# ========== الإنشاء وإعادة البناء ==========
+def create_rollups(cursor):
+    """إنشاء الجداول التجميعية والـ triggers (بدون تعبئة)"""
+    for _, ddl in ROLLUP_TABLES:
+        cursor.execute(ddl)
+    for name, event, body in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN\n{body}\nEND")
+
+
+def fill_rollups(cursor):
+    """مسح الجداول التجميعية وإعادة حسابها من البيانات الخام"""
+    for table_name, insert_sql in _REBUILD:
+        cursor.execute(f"DELETE FROM {table_name}")
+        cursor.execute(insert_sql)
+
+
+def rebuild_rollups(conn):
+    """إعادة بناء كاملة داخل معاملة واحدة - يعيد عدد الصفوف في كل جدول"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        create_rollups(cursor)
+        fill_rollups(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {
+        table_name: conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        for table_name, _ in ROLLUP_TABLES
+    }
+
+
+if __name__ == "__main__":
+    from .crud import crud
+    from .models import add_database_arguments, open_from_args
+
+    parser = argparse.ArgumentParser(description="إعادة بناء الجداول التجميعية اليومية")
+    add_database_arguments(parser)
+    open_from_args(parser.parse_args())
+
+    counts = crud.rebuild_rollups()
+    for table_name, count in counts.items():
+        print(f"✅ {table_name}: {count} صف")
+    sys.exit(0)
@@ -0,0 +1,211 @@
+"""
+كشف تعارض المواعيد (الطبيب أو المريض محجوز في نفس الوقت)
+
+الموعد يشغل الفترة [الوقت، الوقت + مدة العلاج) - والعلاج بدون مدة يأخذ DEFAULT_DURATION.
+المواعيد الملغاة لا تتعارض مع شيء.
+
+البحث عن التعارض لا يقرأ كل مواعيد اليوم: أي موعد متداخل يجب أن يبدأ قبل نهاية الموعد
+الجديد وبعد (بدايته - أطول مدة علاج)، لذلك الاستعلام نطاق على فهرس
+(doctor_id, appointment_date, appointment_time) أو (patient_id, appointment_date).
+
+- find_conflicts: فحص موعد واحد قبل الإدخال (يستخدمه create_appointment)
+- ScheduleValidator: فحص جدول كامل (استيراد) مقابل قاعدة البيانات ومقابل صفوفه نفسها،
+  مع فهرس فترات مرتب في الذاكرة لكل (طبيب/مريض، يوم) يُحمل من قاعدة البيانات مرة واحدة
+"""
+
+from bisect import bisect_left, bisect_right
+
+from .balances import CANCELLED_APPOINTMENT
+
+DEFAULT_DURATION = 30
+
+# (نوع التعارض، عمود المالك في جدول المواعيد، الوصف)
+CONFLICT_KINDS = [
+    ('doctor', 'doctor_id', "الطبيب محجوز"),
+    ('patient', 'patient_id', "المريض محجوز"),
+]
+
+_CONFLICTS_SQL = '''
+    SELECT
+        a.id,
+        a.appointment_time,
+        COALESCE(NULLIF(t.duration_minutes, 0), ?) as duration,
+        p.name as patient_name,
+        d.name as doctor_name
+    FROM appointments a
+    LEFT JOIN treatments t ON t.id = a.treatment_id
+    LEFT JOIN patients p ON p.id = a.patient_id
+    LEFT JOIN doctors d ON d.id = a.doctor_id
+    WHERE a.{owner} = ? AND a.appointment_date = ?
+    AND a.appointment_time >= ? AND a.appointment_time < ?
+    AND COALESCE(a.status, '') != ?
+'''
+
+
+class AppointmentConflict(ValueError):
+    """الموعد يتعارض مع مواعيد أخرى (conflicts قائمة التعارضات)"""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__("تعارض في المواعيد: " + "، ".join(describe(c) for c in conflicts))
+
+
+# ========== الأوقات ==========
+def to_minutes(value):
+    """HH:MM أو HH:MM:SS -> دقائق من بداية اليوم"""
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def to_clock(minutes):
+    """دقائق -> HH:MM (بدون قص بعد منتصف الليل حتى تبقى المقارنة النصية صحيحة)"""
+    minutes = max(0, int(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def treatment_durations(conn):
+    """{معرف العلاج: المدة بالدقائق}"""
+    return {
+        treatment_id: duration or DEFAULT_DURATION
+        for treatment_id, duration in conn.execute("SELECT id, duration_minutes FROM treatments")
+    }
+
+
+def max_duration(durations):
+    return max([DEFAULT_DURATION, *durations.values()])
+
+
+def describe(conflict):
+    """وصف مختصر للتعارض"""
+    label = dict((kind, text) for kind, _, text in CONFLICT_KINDS)[conflict['kind']]
+    if conflict.get('appointment_id'):
+        other = f"موعد #{conflict['appointment_id']}"
+    elif conflict.get('row') is not None:
+        other = f"السطر {conflict['row']}"
+    else:
+        other = "صف سابق في نفس الملف"
+    return f"{label} ({other} {conflict['start']}-{conflict['end']})"
+
+
+# ========== فحص موعد واحد ==========
+def find_conflicts(conn, doctor_id, patient_id, appointment_date, appointment_time,
+                   treatment_id=None, exclude_id=None, durations=None):
+    """المواعيد المتداخلة مع موعد جديد للطبيب أو المريض"""
+    durations = durations if durations is not None else treatment_durations(conn)
+    start = to_minutes(appointment_time)
+    end = start + durations.get(treatment_id, DEFAULT_DURATION)
+    earliest = to_clock(start - max_duration(durations) + 1)
+
+    conflicts = []
+    for kind, owner, _ in CONFLICT_KINDS:
+        owner_id = doctor_id if kind == 'doctor' else patient_id
+        if owner_id is None:
+            continue
+        rows = conn.execute(
+            _CONFLICTS_SQL.format(owner=owner),
+            (DEFAULT_DURATION, owner_id, appointment_date, earliest, to_clock(end),
+             CANCELLED_APPOINTMENT)
+        ).fetchall()
+        for appointment_id, other_time, duration, patient_name, doctor_name in rows:
+            other_start = to_minutes(other_time)
+            if appointment_id == exclude_id or other_start + duration <= start:
+                continue
+            conflicts.append({
+                'kind': kind,
+                'appointment_id': appointment_id,
+                'row': None,
+                'start': to_clock(other_start),
+                'end': to_clock(other_start + duration),
+                'patient_name': patient_name,
+                'doctor_name': doctor_name,
+            })
+    return conflicts
+
+
+# ========== فحص جدول كامل ==========
+class ScheduleValidator:
+    """فهرس فترات في الذاكرة لفحص مواعيد كثيرة مقابل قاعدة البيانات ومقابل بعضها
+
+    check() يعيد التعارضات، والموعد بدون تعارض يضاف للفهرس حتى تُفحص الصفوف التالية مقابله.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.durations = treatment_durations(conn)
+        self.max_duration = max_duration(self.durations)
+        # (النوع، المالك، اليوم) -> (بدايات مرتبة، [(البداية، النهاية، الموعد، السطر)])
+        self._days = {}
+
+    def _day(self, kind, owner, owner_id, appointment_date):
+        key = (kind, owner_id, appointment_date)
+        if key not in self._days:
+            rows = self.conn.execute(
+                _CONFLICTS_SQL.format(owner=owner),
+                (DEFAULT_DURATION, owner_id, appointment_date, "00:00", "99:99", CANCELLED_APPOINTMENT)
+            ).fetchall()
+            intervals = sorted(((to_minutes(row[1]), to_minutes(row[1]) + row[2], row[0], None)
+                                for row in rows), key=lambda interval: interval[0])
+            self._days[key] = ([interval[0] for interval in intervals], intervals)
+        return self._days[key]
+
+    def conflicts(self, doctor_id, patient_id, appointment_date, appointment_time, treatment_id=None):
+        start = to_minutes(appointment_time)
+        end = start + self.durations.get(treatment_id, DEFAULT_DURATION)
+
+        conflicts = []
+        for kind, owner, _ in CONFLICT_KINDS:
+            owner_id = doctor_id if kind == 'doctor' else patient_id
+            if owner_id is None:
+                continue
+            starts, intervals = self._day(kind, owner, owner_id, appointment_date)
+            # المتداخل يبدأ قبل end وبعد start - أطول مدة
+            first = bisect_left(starts, start - self.max_duration + 1)
+            last = bisect_left(starts, end)
+            for other_start, other_end, appointment_id, row in intervals[first:last]:
+                if other_end > start:
+                    conflicts.append({
+                        'kind': kind,
+                        'appointment_id': appointment_id,
+                        'row': row,
+                        'start': to_clock(other_start),
+                        'end': to_clock(other_end),
+                    })
+        return conflicts
+
+    def add(self, doctor_id, patient_id, appointment_date, appointment_time, treatment_id=None, row=None):
+        start = to_minutes(appointment_time)
+        interval = (start, start + self.durations.get(treatment_id, DEFAULT_DURATION), None, row)
+        for kind, owner, _ in CONFLICT_KINDS:
+            owner_id = doctor_id if kind == 'doctor' else patient_id
+            if owner_id is None:
+                continue
+            starts, intervals = self._day(kind, owner, owner_id, appointment_date)
+            position = bisect_right(starts, start)
+            intervals.insert(position, interval)
+            starts.insert(position, start)
+
+    def check(self, doctor_id, patient_id, appointment_date, appointment_time, treatment_id=None, row=None):
+        """التعارضات (والموعد يضاف للفهرس إذا لم يكن فيه تعارض)"""
+        conflicts = self.conflicts(doctor_id, patient_id, appointment_date, appointment_time, treatment_id)
+        if not conflicts:
+            self.add(doctor_id, patient_id, appointment_date, appointment_time, treatment_id, row)
+        return conflicts
+
+
+def validate_schedule(conn, appointments):
+    """فحص قائمة مواعيد (dicts بأعمدة جدول المواعيد) - يعيد التعارضات مع رقم الصف
+
+    الصفوف تُفحص بالترتيب: الصف المتعارض لا يدخل الفهرس، فلا يُبلغ عن تعارض الصفوف التالية معه.
+    """
+    validator = ScheduleValidator(conn)
+    results = []
+    for index, appointment in enumerate(appointments):
+        if appointment.get('status') == CANCELLED_APPOINTMENT:
+            continue
+        for conflict in validator.check(
+            appointment.get('doctor_id'), appointment.get('patient_id'),
+            appointment['appointment_date'], appointment['appointment_time'],
+            appointment.get('treatment_id'), row=index
+        ):
+            results.append({'index': index, **conflict})
+    return results
@@ -0,0 +1,159 @@
+"""
+فهرس البحث النصي للمرضى (FTS5)
+
+جدول patients_fts يحتوي نسخة "مطبّعة" من الاسم والهاتف والبريد والملاحظات والتاريخ المرضي،
+ويتم تحديثه تلقائياً بـ triggers عند الإضافة والتعديل والحذف.
+
+التطبيع العربي (نفس القواعد في SQL للفهرس وفي Python لنص البحث):
+- أ إ آ ٱ -> ا ، ى -> ي ، ة -> ه ، ؤ -> و ، ئ -> ي
+- حذف التشكيل والتطويل
+- الهاتف يُخزن مطبّعاً بقواعد phones.py (أرقام لاتينية فقط، +20 / 0020 -> 0) حتى يطابق البحث بأي تنسيق
+
+البحث بالبادئة (كل كلمة تطابق بداية كلمة في الفهرس) والنتائج مرتبة بـ bm25.
+
+إعادة البناء الكاملة:
+
+    python -m database.search
+"""
+
+import argparse
+import re
+import sys
+
+from .phones import normalize_phone, phone_digits_sql
+
+# (الحرف، البديل) - الترتيب غير مهم لأن البدائل لا تتداخل
+ARABIC_FOLDING = [
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'),
+    ('ى', 'ي'), ('ة', 'ه'), ('ؤ', 'و'), ('ئ', 'ي'),
+    ('ـ', ''),
+] + [(chr(code), '') for code in range(0x064B, 0x0653)] + [('ٰ', '')]
+
+# أعمدة الفهرس: (العمود، الوزن في الترتيب)
+SEARCH_COLUMNS = [
+    ('name', 10.0),
+    ('phone', 5.0),
+    ('email', 3.0),
+    ('notes', 1.0),
+    ('medical_history', 1.0),
+]
+
+SEARCH_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+        name, phone, email, notes, medical_history,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )
+'''
+
+
+# ========== التطبيع ==========
+def _sql_replace(expression, replacements):
+    for old, new in replacements:
+        expression = f"replace({expression}, '{old}', '{new}')"
+    return expression
+
+
+def _sql_normalized(row, column):
+    """تعبير SQL يطبّع عموداً من NEW أو OLD أو من الجدول مباشرة"""
+    value = f"COALESCE({row}{column}, '')"
+    if column == 'phone':
+        return f"COALESCE({phone_digits_sql(row + column)}, '')"
+    if column == 'email':
+        return f"lower({value})"
+    return _sql_replace(value, ARABIC_FOLDING)
+
+
+_FOLDING_TABLE = str.maketrans({old: new for old, new in ARABIC_FOLDING})
+
+
+def normalize_arabic(text):
+    """تطبيع نص عربي بنفس قواعد الفهرس"""
+    return (text or "").translate(_FOLDING_TABLE).lower()
+
+
+def build_match_query(search_term):
+    """تحويل نص البحث إلى استعلام FTS5 بالبادئة (أو None إذا لم يكن فيه كلمات)
+
+    الرقم المكتوب بفواصل (010 123 4567) يُعامل ككلمة واحدة، والأرقام تُطبّع بـ normalize_phone
+    (أرقام عربية، +20 / 0020) بنفس قواعد الهاتف المفهرس.
+    """
+    text = normalize_arabic(search_term).strip()
+    phone = normalize_phone(text)
+    if phone and phone.isdigit():
+        tokens = [phone]
+    else:
+        tokens = [normalize_phone(token) if token.isdigit() else token
+                  for token in re.findall(r"\w+", text)]
+    if not tokens:
+        return None
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in tokens)
+
+
+def rank_expression():
+    """bm25 مع أوزان الأعمدة"""
+    weights = ", ".join(str(weight) for _, weight in SEARCH_COLUMNS)
+    return f"bm25(patients_fts, {weights})"
+
+
+# ========== triggers ==========
+_COLUMNS = ", ".join(column for column, _ in SEARCH_COLUMNS)
+
+
+def _insert_row(row):
+    values = ", ".join(_sql_normalized(row, column) for column, _ in SEARCH_COLUMNS)
+    return f"INSERT INTO patients_fts (rowid, {_COLUMNS}) VALUES ({row}id, {values});"
+
+
+_DELETE_ROW = "DELETE FROM patients_fts WHERE rowid = OLD.id;"
+
+TRIGGERS = [
+    ('trg_patients_fts_insert', 'AFTER INSERT ON patients', _insert_row('NEW.')),
+    ('trg_patients_fts_delete', 'AFTER DELETE ON patients', _DELETE_ROW),
+    ('trg_patients_fts_update', f'AFTER UPDATE OF {_COLUMNS} ON patients',
+     _DELETE_ROW + "\n" + _insert_row('NEW.')),
+]
+
+
+# ========== الإنشاء وإعادة البناء ==========
+def create_search_index(cursor):
+    """إنشاء جدول الفهرس والـ triggers (بدون تعبئة)"""
+    cursor.execute(SEARCH_TABLE)
+    for name, event, body in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN\n{body}\nEND")
+
+
+def fill_search_index(cursor):
+    """مسح الفهرس وإعادة تعبئته من جدول المرضى"""
+    values = ", ".join(_sql_normalized("", column) for column, _ in SEARCH_COLUMNS)
+    cursor.execute("DELETE FROM patients_fts")
+    cursor.execute(f"INSERT INTO patients_fts (rowid, {_COLUMNS}) SELECT id, {values} FROM patients")
+    cursor.execute("INSERT INTO patients_fts (patients_fts) VALUES ('optimize')")
+
+
+def rebuild_search_index(conn):
+    """إعادة بناء كاملة داخل معاملة واحدة - يعيد عدد الصفوف المفهرسة"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.cursor()
+        create_search_index(cursor)
+        fill_search_index(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM patients_fts").fetchone()[0]
+
+
+if __name__ == "__main__":
+    from .models import add_database_arguments, open_from_args
+
+    parser = argparse.ArgumentParser(description="إعادة بناء فهرس البحث النصي للمرضى")
+    add_database_arguments(parser)
+    db = open_from_args(parser.parse_args())
+
+    with db.connection() as conn:
+        count = rebuild_search_index(conn)
+    print(f"✅ patients_fts: {count} مريض")
+    sys.exit(0)
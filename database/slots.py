@@ -0,0 +1,139 @@
+"""
+البحث عن أقرب المواعيد المتاحة للأطباء
+
+- ساعات العمل من إعداد working_hours (نص مثل "السبت - الخميس: 9 صباحاً - 9 مساءً")
+- مواعيد الفترة كلها تُقرأ في استعلام واحد، وتتحول لكل (طبيب، يوم) إلى قائمة فترات مرتبة
+  ثم إلى bitmap إشغال (بت لكل SLOT_BLOCK دقائق) - هذه الخريطة هي ما يُخزن مؤقتاً
+- فحص أي موعد مقترح عملية AND واحدة على الـ bitmap بدون أي استعلام إضافي
+"""
+
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from .balances import CANCELLED_APPOINTMENT
+from .phones import ARABIC_DIGITS
+from .scheduling import DEFAULT_DURATION, to_minutes
+
+SLOT_BLOCK = 5
+
+WorkingHours = namedtuple('WorkingHours', ['days', 'start', 'end'])
+
+# السبت - الخميس، 9 صباحاً - 9 مساءً
+DEFAULT_WORKING_HOURS = WorkingHours(frozenset({5, 6, 0, 1, 2, 3}), 9 * 60, 21 * 60)
+
+# اسم اليوم -> date.weekday()
+WEEKDAYS = {
+    'السبت': 5, 'الأحد': 6, 'الاحد': 6, 'الاثنين': 0, 'الإثنين': 0,
+    'الثلاثاء': 1, 'الأربعاء': 2, 'الاربعاء': 2, 'الخميس': 3, 'الجمعة': 4,
+}
+# ترتيب الأسبوع من السبت (لمدى "السبت - الخميس")
+_WEEK_ORDER = [5, 6, 0, 1, 2, 3, 4]
+
+_DAY_PATTERN = re.compile("|".join(sorted(WEEKDAYS, key=len, reverse=True)))
+_TIME_PATTERN = re.compile(r"(\d{1,2})(?:[:.](\d{2}))?\s*(صباح\w*|ص\b|مساء\w*|م\b|ظهر\w*|am|pm)?",
+                           re.IGNORECASE)
+_DIGITS = str.maketrans(dict(ARABIC_DIGITS))
+
+
+# ========== ساعات العمل ==========
+def _day_range(first, last):
+    start, end = _WEEK_ORDER.index(first), _WEEK_ORDER.index(last)
+    if end < start:
+        end += 7
+    return {_WEEK_ORDER[i % 7] for i in range(start, end + 1)}
+
+
+def _clock_minutes(hours, minutes, period):
+    hours, minutes = int(hours), int(minutes or 0)
+    period = (period or "").lower()
+    if period.startswith(('مساء', 'م', 'pm')) and hours < 12:
+        hours += 12
+    elif period.startswith('ظهر') and hours < 6:
+        hours += 12
+    elif period.startswith(('صباح', 'ص', 'am')) and hours == 12:
+        hours = 0
+    return hours * 60 + minutes
+
+
+def parse_working_hours(text):
+    """تحويل نص ساعات العمل إلى WorkingHours (أو DEFAULT_WORKING_HOURS إذا تعذر فهمه)"""
+    text = (text or "").translate(_DIGITS)
+
+    names = _DAY_PATTERN.findall(text)
+    if len(names) == 2 and re.search(f"{names[0]}\\s*(-|–|إلى|الى)\\s*{names[1]}", text):
+        days = _day_range(WEEKDAYS[names[0]], WEEKDAYS[names[1]])
+    elif names:
+        days = {WEEKDAYS[name] for name in names}
+    else:
+        days = set(DEFAULT_WORKING_HOURS.days)
+
+    times = [_clock_minutes(*match) for match in _TIME_PATTERN.findall(_DAY_PATTERN.sub(" ", text))]
+    if len(times) < 2:
+        return DEFAULT_WORKING_HOURS._replace(days=frozenset(days))
+    start, end = times[0], times[1]
+    if end <= start:
+        end += 12 * 60
+    return WorkingHours(frozenset(days), start, min(end, 24 * 60))
+
+
+# ========== خرائط الإشغال ==========
+def _blocks(start, end):
+    """البلوكات التي تغطي الفترة [start, end) كقناع بتات"""
+    first = start // SLOT_BLOCK
+    last = -(-end // SLOT_BLOCK)
+    return ((1 << (last - first)) - 1) << first
+
+
+def occupancy_bitmaps(conn, start_date, end_date, durations):
+    """{(الطبيب، اليوم): bitmap} لكل الأيام التي فيها مواعيد في الفترة - استعلام واحد"""
+    rows = conn.execute('''
+        SELECT doctor_id, appointment_date, appointment_time, treatment_id
+        FROM appointments
+        WHERE appointment_date BETWEEN ? AND ?
+        AND COALESCE(status, '') != ?
+        ORDER BY doctor_id, appointment_date, appointment_time
+    ''', (start_date, end_date, CANCELLED_APPOINTMENT)).fetchall()
+
+    bitmaps = {}
+    for doctor_id, appointment_date, appointment_time, treatment_id in rows:
+        start = to_minutes(appointment_time)
+        end = start + durations.get(treatment_id, DEFAULT_DURATION)
+        key = (doctor_id, appointment_date)
+        bitmaps[key] = bitmaps.get(key, 0) | _blocks(start, end)
+    return bitmaps
+
+
+def is_free(bitmap, start, duration):
+    return not bitmap & _blocks(start, start + duration)
+
+
+# ========== البحث ==========
+def iter_free_slots(bitmaps, doctor_ids, hours, start_date, days, duration, step=15, now=None):
+    """المواعيد المتاحة بالترتيب (اليوم، الوقت، الطبيب): (اليوم، الطبيب، البداية بالدقائق)
+
+    الأيام والأوقات التي مضت (قبل now) لا تُعرض.
+    """
+    now = now or datetime.now()
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        if day < now.date() or day.weekday() not in hours.days:
+            continue
+        first = hours.start
+        if day == now.date():
+            elapsed = now.hour * 60 + now.minute - hours.start
+            first = hours.start + max(0, -(-elapsed // step)) * step
+        day_key = day.isoformat()
+        for start in range(first, hours.end - duration + 1, step):
+            for doctor_id in doctor_ids:
+                if is_free(bitmaps.get((doctor_id, day_key), 0), start, duration):
+                    yield day_key, doctor_id, start
+
+
+def date_window(start_date=None, days=30):
+    """(أول يوم، آخر يوم) لفترة من days يوماً تبدأ من start_date - لا تبدأ قبل اليوم"""
+    start_date = start_date or date.today()
+    if isinstance(start_date, str):
+        start_date = date.fromisoformat(start_date)
+    start_date = max(start_date, date.today())
+    return start_date, start_date + timedelta(days=days - 1)
@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 from datetime import date, datetime
 from database.crud import crud
+from database.export import export_dataframe
+from payroll import apply_commissions, monthly_payroll
 from utils.helpers import (
     validate_phone_number, validate_email, format_currency,
     show_success_message, show_error_message, format_date_arabic
@@ -93,7 +95,7 @@ def show_doctors_list():
         
         with col3:
             if st.button("📊 تصدير إلى Excel"):
-                export_doctors_data(doctors_df)
+                export_doctors_data()
         
         # تفاصيل الطبيب
         st.divider()
@@ -194,13 +196,6 @@ def doctors_performance():
     st.subheader("📊 أداء الأطباء")
     
     try:
-        # الحصول على بيانات المواعيد مع تفاصيل الأطباء
-        appointments_df = crud.get_all_appointments()
-        
-        if appointments_df.empty:
-            st.info("لا توجد بيانات مواعيد لعرض الأداء")
-            return
-        
         # فلترة حسب التاريخ
         col1, col2 = st.columns(2)
         with col1:
@@ -208,40 +203,30 @@ def doctors_performance():
         with col2:
             end_date = st.date_input("إلى تاريخ", value=date.today())
         
-        # فلترة البيانات
-        appointments_df['appointment_date'] = pd.to_datetime(appointments_df['appointment_date']).dt.date
-        filtered_appointments = appointments_df[
-            (appointments_df['appointment_date'] >= start_date) & 
-            (appointments_df['appointment_date'] <= end_date)
-        ]
+        # مواعيد الفترة فقط مع تفاصيل الأطباء
+        filtered_appointments = crud.get_all_appointments(start_date=start_date, end_date=end_date)
         
         if filtered_appointments.empty:
             st.info("لا توجد مواعيد في هذه الفترة")
             return
         
         # حساب إحصائيات الأداء لكل طبيب
-        performance_stats = filtered_appointments.groupby('doctor_name').agg({
-            'id': 'count',  # عدد المواعيد
-            'total_cost': ['sum', 'mean']  # إجمالي ومتوسط التكلفة
-        }).round(2)
-        
-        performance_stats.columns = ['عدد المواعيد', 'إجمالي الإيرادات', 'متوسط قيمة الموعد']
-        performance_stats = performance_stats.reset_index()
-        performance_stats.columns = ['اسم الطبيب', 'عدد المواعيد', 'إجمالي الإيرادات', 'متوسط قيمة الموعد']
-        
-        # حساب العمولات
-        doctors_df = crud.get_all_doctors()
-        doctor_commissions = {}
-        
-        for _, doctor in doctors_df.iterrows():
-            doctor_revenue = performance_stats[
-                performance_stats['اسم الطبيب'] == doctor['name']
-            ]['إجمالي الإيرادات'].sum() if not performance_stats.empty else 0
-            
-            commission = doctor_revenue * (doctor['commission_rate'] / 100)
-            doctor_commissions[doctor['name']] = commission
-        
-        performance_stats['العمولة المستحقة'] = performance_stats['اسم الطبيب'].map(doctor_commissions)
+        performance_stats = filtered_appointments.groupby(['doctor_id', 'doctor_name']).agg(
+            appointment_count=('id', 'count'),  # عدد المواعيد
+            revenue=('total_cost', 'sum'),  # إجمالي التكلفة
+            average=('total_cost', 'mean')  # متوسط التكلفة
+        ).round(2).reset_index()
+        
+        # حساب العمولات حسب doctor_id
+        performance_stats = apply_commissions(performance_stats, crud.get_all_doctors())
+        
+        performance_stats = pd.DataFrame({
+            'اسم الطبيب': performance_stats['doctor_name'],
+            'عدد المواعيد': performance_stats['appointment_count'],
+            'إجمالي الإيرادات': performance_stats['revenue'],
+            'متوسط قيمة الموعد': performance_stats['average'],
+            'العمولة المستحقة': performance_stats['commission']
+        })
         
         # عرض الجدول
         st.dataframe(
@@ -346,47 +331,18 @@ def doctors_salaries():
                 index=datetime.now().year - 2020
             )
         
-        # حساب الرواتب مع العمولات
-        appointments_df = crud.get_all_appointments()
+        # حساب الرواتب مع العمولات لكل الأطباء دفعة واحدة
+        payroll = monthly_payroll(selected_year, selected_month)
         
-        salary_data = []
-        
-        for _, doctor in doctors_df.iterrows():
-            # الراتب الأساسي
-            base_salary = doctor['salary']
-            
-            # حساب العمولة من المواعيد في الشهر المحدد
-            if not appointments_df.empty:
-                doctor_appointments = appointments_df[
-                    appointments_df['doctor_name'] == doctor['name']
-                ]
-                
-                # فلترة حسب الشهر والسنة
-                doctor_appointments['appointment_date'] = pd.to_datetime(doctor_appointments['appointment_date'])
-                monthly_appointments = doctor_appointments[
-                    (doctor_appointments['appointment_date'].dt.month == selected_month) &
-                    (doctor_appointments['appointment_date'].dt.year == selected_year)
-                ]
-                
-                monthly_revenue = monthly_appointments['total_cost'].sum()
-                commission = monthly_revenue * (doctor['commission_rate'] / 100)
-            else:
-                monthly_revenue = 0
-                commission = 0
-            
-            total_salary = base_salary + commission
-            
-            salary_data.append({
-                'اسم الطبيب': doctor['name'],
-                'التخصص': doctor['specialization'],
-                'الراتب الأساسي': base_salary,
-                'إيرادات الشهر': monthly_revenue,
-                'نسبة العمولة': doctor['commission_rate'],
-                'العمولة': commission,
-                'إجمالي الراتب': total_salary
-            })
-        
-        salary_df = pd.DataFrame(salary_data)
+        salary_df = pd.DataFrame({
+            'اسم الطبيب': payroll['doctor_name'],
+            'التخصص': payroll['specialization'],
+            'الراتب الأساسي': payroll['base_salary'],
+            'إيرادات الشهر': payroll['revenue'],
+            'نسبة العمولة': payroll['commission_rate'],
+            'العمولة': payroll['commission'],
+            'إجمالي الراتب': payroll['total_salary']
+        })
         
         # عرض الجدول
         st.dataframe(
@@ -489,31 +445,25 @@ def show_doctor_details(doctors_df):
             """)
 
 def save_doctors_changes(edited_df, original_df):
-    """حفظ تعديلات الأطباء"""
+    """حفظ تعديلات الأطباء (كل التعديلات في معاملة واحدة)"""
     try:
-        for idx, row in edited_df.iterrows():
-            original_row = original_df[original_df['id'] == row['id']].iloc[0]
-            
-            # التحقق من وجود تغييرات
-            if (row['name'] != original_row['name'] or 
-                row['specialization'] != original_row['specialization'] or
-                row['phone'] != original_row['phone'] or
-                row['email'] != original_row['email'] or
-                row['salary'] != original_row['salary'] or
-                row['commission_rate'] != original_row['commission_rate']):
-                
-                crud.update_doctor(
-                    doctor_id=row['id'],
-                    name=row['name'],
-                    specialization=row['specialization'],
-                    phone=row['phone'],
-                    email=row['email'],
-                    address=original_row['address'],
-                    salary=row['salary'],
-                    commission_rate=row['commission_rate']
-                )
+        columns = ['name', 'specialization', 'phone', 'email', 'salary', 'commission_rate']
+        originals = original_df.set_index('id')
+        changed = 0
         
-        show_success_message("تم حفظ التعديلات بنجاح")
+        with crud.batch() as batch:
+            for _, row in edited_df.iterrows():
+                original_row = originals.loc[row['id']]
+                
+                # التحقق من وجود تغييرات
+                if any(row[column] != original_row[column] for column in columns):
+                    batch.update_doctor(
+                        int(row['id']),
+                        **{column: row[column] for column in columns}
+                    )
+                    changed += 1
+        
+        show_success_message(f"تم حفظ التعديلات بنجاح ({changed} طبيب)")
         st.rerun()
         
     except Exception as e:
@@ -522,8 +472,9 @@ def save_doctors_changes(edited_df, original_df):
 def delete_selected_doctors(doctor_ids):
     """حذف الأطباء المحددين"""
     try:
-        for doctor_id in doctor_ids:
-            crud.delete_doctor(doctor_id)
+        with crud.batch() as batch:
+            for doctor_id in doctor_ids:
+                batch.delete_doctor(int(doctor_id))
         
         show_success_message(f"تم حذف {len(doctor_ids)} طبيب بنجاح")
         st.rerun()
@@ -531,11 +482,9 @@ def delete_selected_doctors(doctor_ids):
     except Exception as e:
         show_error_message(f"خطأ في حذف الأطباء: {str(e)}")
 
-def export_doctors_data(doctors_df):
+def export_doctors_data():
     """تصدير بيانات الأطباء"""
     try:
-        from utils.helpers import export_to_excel
-        
         export_columns = {
             'id': 'المعرف',
             'name': 'الاسم',
@@ -549,15 +498,15 @@ def export_doctors_data(doctors_df):
             'created_at': 'تاريخ التسجيل'
         }
         
-        export_df = doctors_df[list(export_columns.keys())].rename(columns=export_columns)
-        excel_data = export_to_excel(export_df, "doctors_report")
+        export_file = crud.export('doctors', 'xlsx', columns=export_columns)
         
-        st.download_button(
-            label="📥 تحميل Excel",
-            data=excel_data,
-            file_name=f"doctors_report_{date.today()}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        with export_file.open() as excel_data:
+            st.download_button(
+                label="📥 تحميل Excel",
+                data=excel_data,
+                file_name=export_file.file_name,
+                mime=export_file.mime
+            )
         
     except Exception as e:
         show_error_message(f"خطأ في التصدير: {str(e)}")
@@ -565,16 +514,15 @@ def export_doctors_data(doctors_df):
 def export_salary_report(salary_df, month, year):
     """تصدير كشف الرواتب"""
     try:
-        from utils.helpers import export_to_excel
-        
-        excel_data = export_to_excel(salary_df, f"salary_report_{month}_{year}")
-        
-        st.download_button(
-            label="📥 تحميل كشف الرواتب",
-            data=excel_data,
-            file_name=f"salary_report_{month}_{year}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        export_file = export_dataframe(salary_df, 'xlsx', f"salary_report_{month}_{year}")
+        
+        with export_file.open() as excel_data:
+            st.download_button(
+                label="📥 تحميل كشف الرواتب",
+                data=excel_data,
+                file_name=f"salary_report_{month}_{year}.xlsx",
+                mime=export_file.mime
+            )
         
     except Exception as e:
         show_error_message(f"خطأ في تصدير كشف الرواتب: {str(e)}")
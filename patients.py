@@ -1,8 +1,12 @@
+import os
 import streamlit as st
 import pandas as pd
 from datetime import date
 from database.crud import crud
 from report_generator import PatientReportGenerator
+from statements import COHORTS, generate_statements
+from database.export import EXPORT_DIR
+from database.models import db
 
 def render():
     """صفحة إدارة المرضى مع ميزة التقرير الشامل"""
@@ -26,17 +30,15 @@ def render():
     
     with tab4:
         render_patient_report()
+        render_batch_statements()
 
 def render_all_patients():
     """عرض جميع المرضى"""
-    patients = crud.get_all_patients()
+    # البحث يستخدم فهرس البحث مباشرة بدون تحميل كل المرضى
+    search = st.text_input("🔍 بحث عن مريض", placeholder="اسم، هاتف، بريد إلكتروني...")
+    patients = crud.search_patients(search) if search else crud.get_all_patients()
+    
     if not patients.empty:
-        # بحث
-        search = st.text_input("🔍 بحث عن مريض", placeholder="اسم، هاتف، بريد إلكتروني...")
-        
-        if search:
-            patients = crud.search_patients(search)
-        
         st.dataframe(
             patients[['id', 'name', 'phone', 'email', 'gender', 'date_of_birth', 'blood_type']],
             use_container_width=True,
@@ -55,6 +57,10 @@ def render_add_patient():
     with col1:
         name = st.text_input("الاسم الكامل*")
         phone = st.text_input("رقم الهاتف*")
+        if phone:
+            existing = crud.find_patient_by_phone(phone)
+            if not existing.empty:
+                st.warning(f"⚠️ هذا الرقم مسجل بالفعل للمريض: {'، '.join(existing['name'])}")
         email = st.text_input("البريد الإلكتروني")
         date_of_birth = st.date_input("تاريخ الميلاد", max_value=date.today())
         gender = st.selectbox("النوع*", ["ذكر", "أنثى"])
@@ -236,3 +242,37 @@ def render_patient_report():
                 if not report_data['appointments'].empty:
                     last_visit = report_data['appointments']['appointment_date'].max()
                     st.metric("آخر زيارة", last_visit)
+
+def render_batch_statements():
+    """كشوف حساب لمجموعة من المرضى في ملف zip واحد"""
+    st.markdown("---")
+    with st.expander("📦 كشوف حساب جماعية"):
+        cohort = st.selectbox(
+            "المرضى",
+            list(COHORTS),
+            format_func=lambda c: COHORTS[c][0],
+            key="statements_cohort"
+        )
+        st.caption("إعادة التوليد في نفس اليوم تكمل الكشوف الناقصة فقط")
+        
+        if st.button("توليد الكشوف", key="generate_statements"):
+            out_dir = os.path.join(EXPORT_DIR, f"statements_{cohort}_{date.today():%Y_%m_%d}")
+            progress_bar = st.progress(0.0)
+            try:
+                with db.connection() as conn:
+                    stats = generate_statements(
+                        conn, out_dir, cohort, zip_path=out_dir + ".zip",
+                        progress=lambda s: progress_bar.progress(s['fraction'])
+                    )
+                progress_bar.progress(1.0)
+                st.success(f"✅ {stats['total']} كشف (جديد: {stats['rendered']})")
+                
+                with open(stats['zip_path'], 'rb') as f:
+                    st.download_button(
+                        label="⬇️ تحميل الكشوف",
+                        data=f,
+                        file_name=f"كشوف_حساب_{date.today()}.zip",
+                        mime="application/zip"
+                    )
+            except Exception as e:
+                st.error(f"حدث خطأ: {str(e)}")
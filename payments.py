@@ -3,12 +3,14 @@ import pandas as pd
 from datetime import date, timedelta
 import plotly.express as px
 from database.crud import crud
+from database.export import available_formats
+from pickers import patient_picker, appointment_picker
 
 def render():
     """صفحة إدارة المدفوعات"""
     st.markdown("### 💰 إدارة المدفوعات")
     
-    tab1, tab2, tab3 = st.tabs(["📋 جميع المدفوعات", "➕ دفعة جديدة", "📊 أرباح الأطباء"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 جميع المدفوعات", "➕ دفعة جديدة", "📊 أرباح الأطباء", "📒 المستحقات"])
     
     with tab1:
         render_all_payments()
@@ -18,6 +20,9 @@ def render():
     
     with tab3:
         render_doctor_earnings()
+    
+    with tab4:
+        render_receivables()
 
 def render_all_payments():
     """عرض جميع المدفوعات"""
@@ -54,91 +59,100 @@ def render_all_payments():
             st.metric("🏥 حصة العيادة", f"{clinic_total:,.2f} ج.م")
     else:
         st.info("لا توجد مدفوعات")
+    
+    render_payments_export()
+
+def render_payments_export():
+    """تصدير المدفوعات لفترة (يُكتب على دفعات مباشرة من قاعدة البيانات)"""
+    with st.expander("📥 تصدير المدفوعات"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            start_date = st.date_input("من تاريخ", value=date(date.today().year, 1, 1), key="payments_export_start")
+        with col2:
+            end_date = st.date_input("إلى تاريخ", value=date.today(), key="payments_export_end")
+        with col3:
+            fmt = st.selectbox("الصيغة", available_formats(), key="payments_export_format")
+        
+        if st.button("📤 تجهيز الملف", key="payments_export"):
+            try:
+                export_file = crud.export('payments', fmt, start_date=start_date, end_date=end_date)
+                with export_file.open() as data:
+                    st.download_button(
+                        label=f"📥 تحميل ({export_file.rows} دفعة)",
+                        data=data,
+                        file_name=export_file.file_name,
+                        mime=export_file.mime
+                    )
+            except Exception as e:
+                st.error(f"خطأ في التصدير: {str(e)}")
 
 def render_add_payment():
     """نموذج إضافة دفعة جديدة"""
     st.markdown("#### إضافة دفعة جديدة")
     
-    patients = crud.get_all_patients()
-    appointments = crud.get_all_appointments()
+    # اختيار الموعد أولاً (اختياري) - البحث برقم الموعد أو اسم المريض
+    appointment_id = appointment_picker(key="payment_appointment")
     
-    if not patients.empty:
-        appointment_id = st.selectbox(
-            "الموعد (اختياري)",
-            [None] + appointments['id'].tolist() if not appointments.empty else [None],
-            format_func=lambda x: "دفعة بدون موعد" if x is None else 
-                f"موعد #{x} - {appointments[appointments['id']==x]['patient_name'].iloc[0]} - {appointments[appointments['id']==x]['treatment_name'].iloc[0]}"
-        )
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if appointment_id:
-                appointment_data = appointments[appointments['id'] == appointment_id].iloc[0]
-                patient_name = appointment_data['patient_name']
-                amount = st.number_input("المبلغ (ج.م)*", value=float(appointment_data['total_cost']), min_value=0.0, step=10.0)
-                
-                st.info(f"المريض: {patient_name}")
-                
-                treatments = crud.get_all_treatments()
-                if not treatments.empty:
-                    treatment_name = appointment_data['treatment_name']
-                    treatment_info = treatments[treatments['name'] == treatment_name]
-                    
-                    if not treatment_info.empty:
-                        doctor_pct = treatment_info['doctor_percentage'].iloc[0]
-                        clinic_pct = treatment_info['clinic_percentage'].iloc[0]
-                    else:
-                        doctor_pct = 50.0
-                        clinic_pct = 50.0
-                else:
-                    doctor_pct = 50.0
-                    clinic_pct = 50.0
-                
-                st.markdown("---")
-                st.markdown("##### 💰 توزيع المبلغ التلقائي:")
-                
-                col_a, col_b = st.columns(2)
-                with col_a:
-                    doctor_share = (amount * doctor_pct) / 100
-                    st.success(f"👨‍⚕️ الطبيب ({doctor_pct}%): **{doctor_share:,.2f} ج.م**")
-                with col_b:
-                    clinic_share = (amount * clinic_pct) / 100
-                    st.info(f"🏥 العيادة ({clinic_pct}%): **{clinic_share:,.2f} ج.م**")
-                
-                patient_id = patients[patients['name'] == patient_name]['id'].iloc[0]
-            else:
-                patient_id = st.selectbox(
-                    "المريض*",
-                    patients['id'].tolist(),
-                    format_func=lambda x: patients[patients['id'] == x]['name'].iloc[0]
-                )
-                amount = st.number_input("المبلغ (ج.م)*", min_value=0.0, step=10.0)
-                
-                st.warning("⚠️ دفعة بدون موعد - ستذهب 100% للعيادة")
+    billing = crud.get_appointment_billing_context(appointment_id) if appointment_id else None
+    if appointment_id and billing is None:
+        # الموعد حُذف بعد فتح النموذج
+        st.error("❌ الموعد المحدد غير موجود")
+        return
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # إذا تم اختيار موعد، املأ البيانات تلقائياً من سياق المحاسبة
+        if appointment_id:
+            patient_id = billing['patient_id']
+            amount = st.number_input("المبلغ (ج.م)*", value=float(billing['total_cost']), min_value=0.0, step=10.0)
             
-            payment_date = st.date_input("تاريخ الدفع", value=date.today())
-        
-        with col2:
-            payment_method = st.selectbox("طريقة الدفع", ["نقدي", "بطاقة ائتمان", "تحويل بنكي", "شيك"])
-            notes = st.text_area("ملاحظات")
+            st.info(f"المريض: {billing['patient_name']}")
+            if billing['paid_amount']:
+                st.caption(f"المدفوع سابقاً: {billing['paid_amount']:,.2f} ج.م من {billing['total_cost']:,.2f} ج.م")
+            
+            doctor_pct = billing['doctor_percentage']
+            clinic_pct = billing['clinic_percentage']
+            
+            # عرض التقسيم المتوقع
+            st.markdown("---")
+            st.markdown("##### 💰 توزيع المبلغ التلقائي:")
+            
+            col_a, col_b = st.columns(2)
+            with col_a:
+                doctor_share = (amount * doctor_pct) / 100
+                st.success(f"👨‍⚕️ الطبيب ({doctor_pct}%): **{doctor_share:,.2f} ج.م**")
+            with col_b:
+                clinic_share = (amount * clinic_pct) / 100
+                st.info(f"🏥 العيادة ({clinic_pct}%): **{clinic_share:,.2f} ج.م**")
+        else:
+            patient_id = patient_picker(key="payment_patient")
+            amount = st.number_input("المبلغ (ج.م)*", min_value=0.0, step=10.0)
+            
+            st.warning("⚠️ دفعة بدون موعد - ستذهب 100% للعيادة")
         
-        if st.button("تسجيل الدفعة", type="primary", use_container_width=True):
-            if amount > 0:
-                try:
-                    crud.create_payment(
-                        appointment_id, patient_id, amount,
-                        payment_method, payment_date.isoformat(), notes
-                    )
-                    st.success("✅ تم تسجيل الدفعة بنجاح!")
-                    st.balloons()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"حدث خطأ: {str(e)}")
-            else:
-                st.warning("الرجاء إدخال مبلغ صحيح")
-    else:
-        st.warning("يجب إضافة مرضى أولاً")
+        payment_date = st.date_input("تاريخ الدفع", value=date.today())
+    
+    with col2:
+        payment_method = st.selectbox("طريقة الدفع", ["نقدي", "بطاقة ائتمان", "تحويل بنكي", "شيك"])
+        notes = st.text_area("ملاحظات")
+    
+    if st.button("تسجيل الدفعة", type="primary", use_container_width=True):
+        if patient_id is None:
+            st.warning("الرجاء اختيار المريض")
+        elif amount > 0:
+            try:
+                crud.create_payment(
+                    appointment_id, patient_id, amount,
+                    payment_method, payment_date.isoformat(), notes
+                )
+                st.success("✅ تم تسجيل الدفعة بنجاح!")
+                st.balloons()
+                st.rerun()
+            except Exception as e:
+                st.error(f"حدث خطأ: {str(e)}")
+        else:
+            st.warning("الرجاء إدخال مبلغ صحيح")
 
 def render_doctor_earnings():
     """عرض أرباح الأطباء"""
@@ -150,39 +164,78 @@ def render_doctor_earnings():
     with col2:
         end_date = st.date_input("إلى تاريخ", value=date.today(), key="doc_earnings_end")
     
-    doctors = crud.get_all_doctors()
+    earnings = crud.get_all_doctor_earnings(start_date.isoformat(), end_date.isoformat())
+    summary = earnings['summary']
     
-    if not doctors.empty:
-        earnings_data = []
+    if not summary.empty:
+        earnings_df = pd.DataFrame({
+            'الطبيب': summary['doctor_name'],
+            'التخصص': summary['specialization'],
+            'عدد المدفوعات': summary['payment_count'].astype(int),
+            'إجمالي الأرباح': summary['total_earnings'].fillna(0).astype(float),
+            'متوسط النسبة': summary['avg_percentage'].fillna(0).astype(float)
+        })
+        st.dataframe(earnings_df, use_container_width=True, hide_index=True)
         
-        for _, doctor in doctors.iterrows():
-            earnings = crud.get_doctor_earnings(
-                doctor['id'], 
-                start_date.isoformat(), 
-                end_date.isoformat()
-            )
-            
-            if not earnings.empty and earnings.iloc[0]['total_earnings'] is not None:
-                earnings_data.append({
-                    'الطبيب': doctor['name'],
-                    'التخصص': doctor['specialization'],
-                    'عدد المدفوعات': int(earnings.iloc[0]['payment_count'] or 0),
-                    'إجمالي الأرباح': float(earnings.iloc[0]['total_earnings'] or 0),
-                    'متوسط النسبة': float(earnings.iloc[0]['avg_percentage'] or 0)
-                })
+        # رسم بياني
+        fig = px.bar(
+            earnings_df,
+            x='الطبيب',
+            y='إجمالي الأرباح',
+            color='التخصص',
+            title='أرباح الأطباء'
+        )
+        st.plotly_chart(fig, use_container_width=True)
         
-        if earnings_data:
-            earnings_df = pd.DataFrame(earnings_data)
-            st.dataframe(earnings_df, use_container_width=True, hide_index=True)
-            
-            # رسم بياني
-            fig = px.bar(
-                earnings_df,
-                x='الطبيب',
-                y='إجمالي الأرباح',
-                color='التخصص',
-                title='أرباح الأطباء'
+        # التفصيل حسب العلاج
+        with st.expander("📋 الأرباح حسب العلاج"):
+            breakdown = earnings['by_treatment']
+            st.dataframe(
+                pd.DataFrame({
+                    'الطبيب': breakdown['doctor_name'],
+                    'العلاج': breakdown['treatment_name'].fillna('-'),
+                    'عدد المدفوعات': breakdown['payment_count'].astype(int),
+                    'إجمالي الإيرادات': breakdown['total_revenue'].fillna(0).astype(float),
+                    'أرباح الطبيب': breakdown['total_earnings'].fillna(0).astype(float),
+                    'متوسط النسبة': breakdown['avg_percentage'].fillna(0).astype(float)
+                }),
+                use_container_width=True,
+                hide_index=True
             )
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("لا توجد بيانات للفترة المحددة")
+    else:
+        st.info("لا توجد بيانات للفترة المحددة")
+
+def render_receivables():
+    """المرضى الذين عليهم مبالغ متبقية (من دفتر الأرصدة)"""
+    st.markdown("#### 📒 المستحقات على المرضى")
+    
+    receivables = crud.get_receivables()
+    if receivables.empty:
+        st.success("✅ لا توجد مبالغ متبقية على المرضى")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("👥 عدد المرضى", f"{len(receivables):,}")
+    with col2:
+        st.metric("💰 إجمالي المستحقات", f"{receivables['balance'].sum():,.2f} ج.م")
+    
+    display_df = receivables.rename(columns={
+        'id': 'الرقم',
+        'name': 'المريض',
+        'phone': 'الهاتف',
+        'charged': 'إجمالي التكاليف',
+        'paid': 'المدفوع',
+        'balance': 'المتبقي'
+    })
+    st.dataframe(display_df, use_container_width=True, hide_index=True)
+    
+    with st.expander("🔍 مطابقة الأرصدة"):
+        st.caption("إعادة حساب الأرصدة من المواعيد والمدفوعات ومقارنتها بالدفتر")
+        if st.button("مطابقة", key="reconcile_balances"):
+            drift = crud.reconcile_balances(fix=True)
+            if drift.empty:
+                st.success("✅ الدفتر مطابق")
+            else:
+                st.warning(f"⚠️ تم تصحيح أرصدة {len(drift)} مريض")
+                st.dataframe(drift, use_container_width=True, hide_index=True)
@@ -0,0 +1,136 @@
+"""
+محرك حساب رواتب وعمولات الأطباء
+
+يحسب الراتب الأساسي والعمولة والإجمالي لكل الأطباء دفعة واحدة (groupby على doctor_id)
+من إيرادات المواعيد الشهرية المجمعة، بدلاً من فلترة كل المواعيد لكل طبيب.
+نتائج الأشهر المغلقة (قبل الشهر الحالي) تُخزن في الذاكرة المؤقتة حتى تتغير
+المواعيد أو بيانات الأطباء.
+"""
+
+from datetime import date
+
+import pandas as pd
+
+from database.crud import crud
+
+PAYROLL_COLUMNS = [
+    'doctor_id', 'doctor_name', 'specialization', 'month', 'appointment_count',
+    'revenue', 'base_salary', 'commission_rate', 'commission', 'total_salary'
+]
+
+
+def month_key(year, month):
+    """مفتاح الشهر بصيغة YYYY-MM كما في قاعدة البيانات"""
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+def month_bounds(year, month):
+    """أول وآخر يوم في الشهر"""
+    start = date(int(year), int(month), 1)
+    next_month = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, date.fromordinal(next_month.toordinal() - 1)
+
+
+def is_closed_month(year, month, today=None):
+    """الشهر مغلق إذا انتهى بالكامل قبل الشهر الحالي"""
+    today = today or date.today()
+    return (int(year), int(month)) < (today.year, today.month)
+
+
+def apply_commissions(revenue_df, doctors_df, revenue_column='revenue'):
+    """إضافة نسبة العمولة وقيمتها لكل صف حسب doctor_id (بدون حلقات)"""
+    rates = doctors_df[['id', 'commission_rate']].rename(columns={'id': 'doctor_id'})
+    result = revenue_df.drop(columns='commission_rate', errors='ignore').merge(
+        rates, on='doctor_id', how='left'
+    )
+    result['commission_rate'] = result['commission_rate'].fillna(0.0)
+    result['commission'] = result[revenue_column].fillna(0.0) * result['commission_rate'] / 100
+    return result
+
+
+def compute_payroll(doctors_df, revenue_df, months):
+    """كشف الرواتب لكل (طبيب، شهر)
+
+    doctors_df: id, name, specialization, salary, commission_rate
+    revenue_df: doctor_id, month, appointment_count, revenue
+    months: قائمة مفاتيح الأشهر YYYY-MM
+    """
+    if doctors_df.empty or not months:
+        return pd.DataFrame(columns=PAYROLL_COLUMNS)
+
+    # كل طبيب في كل شهر (حتى بدون مواعيد يستحق الراتب الأساسي)
+    grid = (
+        doctors_df[['id', 'name', 'specialization', 'salary']]
+        .rename(columns={'id': 'doctor_id', 'name': 'doctor_name', 'salary': 'base_salary'})
+        .merge(pd.DataFrame({'month': months}), how='cross')
+    )
+
+    payroll = grid.merge(
+        revenue_df[['doctor_id', 'month', 'appointment_count', 'revenue']],
+        on=['doctor_id', 'month'], how='left'
+    )
+    payroll['appointment_count'] = payroll['appointment_count'].fillna(0).astype(int)
+    payroll['revenue'] = payroll['revenue'].fillna(0.0)
+    payroll['base_salary'] = payroll['base_salary'].fillna(0.0)
+
+    payroll = apply_commissions(payroll, doctors_df)
+    payroll['total_salary'] = payroll['base_salary'] + payroll['commission']
+
+    return payroll[PAYROLL_COLUMNS].sort_values(['month', 'doctor_name'], ignore_index=True)
+
+
+def _load_month(year, month):
+    """حساب كشف شهر واحد من قاعدة البيانات"""
+    start, end = month_bounds(year, month)
+    doctors_df = crud.get_all_doctors()
+    revenue_df = crud.get_doctor_monthly_revenue(start.isoformat(), end.isoformat())
+    return compute_payroll(doctors_df, revenue_df, [month_key(year, month)])
+
+
+def monthly_payroll(year, month):
+    """كشف رواتب شهر - الأشهر المغلقة تُخزن مؤقتاً"""
+    if not is_closed_month(year, month):
+        return _load_month(year, month)
+    return crud.cache.get_or_load(
+        ('monthly_payroll', int(year), int(month)),
+        ('appointments', 'doctors'),
+        lambda: _load_month(year, month),
+    )
+
+
+def payroll_range(start_year, start_month, end_year, end_month):
+    """كشف رواتب مجموعة أشهر متتالية (صف لكل طبيب في كل شهر)"""
+    months = []
+    year, month = int(start_year), int(start_month)
+    while (year, month) <= (int(end_year), int(end_month)):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    if not months:
+        return pd.DataFrame(columns=PAYROLL_COLUMNS)
+
+    closed = [m for m in months if is_closed_month(*m)]
+    open_months = [m for m in months if not is_closed_month(*m)]
+
+    frames = [monthly_payroll(*m) for m in closed]
+    if open_months:
+        # الأشهر المفتوحة في استعلام واحد
+        start, _ = month_bounds(*open_months[0])
+        _, end = month_bounds(*open_months[-1])
+        frames.append(compute_payroll(
+            crud.get_all_doctors(),
+            crud.get_doctor_monthly_revenue(start.isoformat(), end.isoformat()),
+            [month_key(*m) for m in open_months]
+        ))
+
+    return pd.concat(frames, ignore_index=True).sort_values(['month', 'doctor_name'], ignore_index=True)
+
+
+def payroll_totals(payroll_df):
+    """إجمالي كل طبيب على كامل الفترة"""
+    return (
+        payroll_df
+        .groupby(['doctor_id', 'doctor_name', 'specialization'], as_index=False)
+        [['appointment_count', 'revenue', 'base_salary', 'commission', 'total_salary']]
+        .sum()
+    )
@@ -0,0 +1,58 @@
+import streamlit as st
+from database.crud import crud
+
+# عدد النتائج المعروضة لكل بحث وعدد العناصر الأخيرة المحفوظة في الجلسة
+PICKER_LIMIT = 20
+RECENT_LIMIT = 10
+
+
+def _recent(kind):
+    """العناصر المختارة مؤخراً في هذه الجلسة {المعرف: الوصف} (الأحدث أولاً)"""
+    return st.session_state.setdefault(f"recent_{kind}", {})
+
+
+def _remember(kind, item_id, label):
+    recent = _recent(kind)
+    recent.pop(item_id, None)
+    st.session_state[f"recent_{kind}"] = dict(list({item_id: label, **recent}.items())[:RECENT_LIMIT])
+
+
+def _picker(kind, label, search, key, placeholder, none_label=None):
+    """حقل بحث + قائمة بأول PICKER_LIMIT نتيجة فقط
+
+    بدون نص بحث تُعرض العناصر الأخيرة للمستخدم (ونتائج search("") إن وجدت).
+    """
+    term = st.text_input(f"🔎 بحث {label}", key=f"{key}_search", placeholder=placeholder).strip()
+
+    if term:
+        options = search(term, PICKER_LIMIT)
+        if not options:
+            st.caption("لا توجد نتائج مطابقة")
+    else:
+        options = {**_recent(kind), **search("", PICKER_LIMIT)}
+
+    if none_label is not None:
+        options = {None: none_label, **options}
+    if not options:
+        st.caption("اكتب للبحث")
+        return None
+
+    selected = st.selectbox(label, list(options), format_func=options.get, key=key)
+    if selected is not None:
+        _remember(kind, selected, options[selected])
+    return selected
+
+
+def _patient_options(term, limit):
+    return crud.search_patient_options(term, limit) if term else {}
+
+
+def patient_picker(label="المريض*", key="patient_picker"):
+    """اختيار مريض بالبحث في الاسم أو الهاتف - يعيد المعرف أو None"""
+    return _picker('patients', label, _patient_options, key, "اكتب بداية الاسم أو رقم الهاتف")
+
+
+def appointment_picker(label="الموعد (اختياري)", key="appointment_picker", none_label="دفعة بدون موعد"):
+    """اختيار موعد برقمه أو باسم/هاتف المريض (بدون بحث: أحدث المواعيد)"""
+    return _picker('appointments', label, crud.search_appointment_options, key,
+                   "رقم الموعد أو اسم المريض أو هاتفه", none_label)
@@ -1,181 +1,191 @@
 from datetime import datetime
+from itertools import islice
+from string import Template
 import pandas as pd
 
+from database.balances import CANCELLED_APPOINTMENT, VOID_PAYMENT_STATUSES
+
+# عدد الصفوف في كل جزء يخرج من iter_html_report
+ROWS_PER_CHUNK = 200
+
+
+def _money(value):
+    return f"{value:,.2f} ج.م"
+
+
+# ========== القوالب (تُجهز مرة واحدة عند تحميل الملف) ==========
+HEADER_TEMPLATE = Template("""<div class='patient-report'>
+<div class='report-header'>
+<h2>📋 تقرير شامل للمريض</h2>
+<h3>$name</h3>
+<p>تاريخ التقرير: $generated_at</p>
+</div>
+<div class='report-section'>
+<h3>👤 المعلومات الشخصية</h3>
+<table class='report-table'>
+<tr><th>الاسم</th><td>$name</td></tr>
+<tr><th>رقم الهاتف</th><td>$phone</td></tr>
+<tr><th>البريد الإلكتروني</th><td>$email</td></tr>
+<tr><th>العنوان</th><td>$address</td></tr>
+<tr><th>تاريخ الميلاد</th><td>$date_of_birth</td></tr>
+<tr><th>النوع</th><td>$gender</td></tr>
+<tr><th>فصيلة الدم</th><td>$blood_type</td></tr>
+<tr><th>الحساسية</th><td>$allergies</td></tr>
+<tr><th>جهة الاتصال للطوارئ</th><td>$emergency_contact</td></tr>
+</table>
+</div>
+<div class='report-section'>
+<h3>📊 الإحصائيات العامة</h3>
+<table class='report-table'>
+<tr><th>إجمالي الزيارات</th><td>$total_visits زيارة</td></tr>
+<tr><th>الزيارات المكتملة</th><td>$completed_visits زيارة</td></tr>
+<tr><th>إجمالي التكاليف</th><td>$total_spent</td></tr>
+<tr><th>المبلغ المدفوع</th><td>$total_paid</td></tr>
+<tr><th>المبلغ المتبقي</th><td style='color: $pending_color;'>$total_pending</td></tr>
+</table>
+</div>
+""")
+
+TEXT_SECTION_TEMPLATE = Template("""<div class='report-section'>
+<h3>$title</h3>
+<p>$text</p>
+</div>
+""")
+
+TABLE_START_TEMPLATE = Template("""<div class='report-section'>
+<h3>$title</h3>
+<table class='report-table'>
+<thead>
+<tr>$headers</tr>
+</thead>
+<tbody>
+""")
+
+TABLE_END = """</tbody>
+</table>
+</div>
+"""
+
+# (العمود، العنوان، التنسيق) - الأعمدة المالية تُنسق للعمود كله مرة واحدة
+APPOINTMENT_COLUMNS = [
+    ('appointment_date', 'التاريخ', None),
+    ('appointment_time', 'الوقت', None),
+    ('doctor_name', 'الطبيب', None),
+    ('treatment_name', 'العلاج', None),
+    ('status', 'الحالة', None),
+    ('total_cost', 'التكلفة', _money),
+]
+
+PAYMENT_COLUMNS = [
+    ('payment_date', 'التاريخ', None),
+    ('amount', 'المبلغ', _money),
+    ('payment_method', 'طريقة الدفع', None),
+    ('status', 'الحالة', None),
+    ('notes', 'ملاحظات', None),
+]
+
+TREATMENT_COLUMNS = [
+    ('treatment_name', 'العلاج', None),
+    ('count', 'عدد المرات', None),
+]
+
+
+def _column_cells(df, column, formatter):
+    """قيم عمود كنصوص (العمود غير الموجود يصبح خلايا فارغة)"""
+    if column not in df.columns:
+        return [''] * len(df)
+    values = df[column]
+    if formatter is not None:
+        values = values.map(formatter)
+    return values.astype(str).tolist()
+
+
+def _iter_table(title, df, columns):
+    """جدول HTML على أجزاء من ROWS_PER_CHUNK صف"""
+    headers = "".join(f"<th>{header}</th>" for _, header, _ in columns)
+    yield TABLE_START_TEMPLATE.substitute(title=title, headers=headers)
+    
+    row_format = "<tr>" + "<td>{}</td>" * len(columns) + "</tr>\n"
+    rows = zip(*(_column_cells(df, column, formatter) for column, _, formatter in columns))
+    while True:
+        chunk = list(islice(rows, ROWS_PER_CHUNK))
+        if not chunk:
+            break
+        yield "".join(row_format.format(*row) for row in chunk)
+    
+    yield TABLE_END
+
+
 class PatientReportGenerator:
     """مولد تقارير المرضى"""
     
     @staticmethod
-    def generate_html_report(patient_data, appointments_data, payments_data, treatments_data):
-        """توليد تقرير HTML شامل للمريض"""
+    def iter_html_report(patient_data, appointments_data, payments_data, treatments_data):
+        """توليد تقرير HTML شامل للمريض على أجزاء (للكتابة مباشرة في ملف)"""
         
         # حساب الإحصائيات
         total_visits = len(appointments_data)
-        completed_visits = len(appointments_data[appointments_data['status'] == 'مكتمل']) if not appointments_data.empty else 0
-        total_spent = appointments_data['total_cost'].sum() if not appointments_data.empty else 0
-        total_paid = payments_data['amount'].sum() if not payments_data.empty else 0
+        completed_visits = int((appointments_data['status'] == 'مكتمل').sum()) if not appointments_data.empty else 0
+        # نفس قواعد دفتر الأرصدة: المواعيد الملغاة والمدفوعات الملغاة/المستردة لا تُحسب
+        total_spent = appointments_data.loc[appointments_data['status'] != CANCELLED_APPOINTMENT,
+                                            'total_cost'].sum() if not appointments_data.empty else 0
+        total_paid = payments_data.loc[~payments_data['status'].isin(VOID_PAYMENT_STATUSES),
+                                       'amount'].sum() if not payments_data.empty else 0
         total_pending = total_spent - total_paid
         
-        # معلومات المريض
-        patient_info = f"""
-        <div class='patient-report'>
-            <div class='report-header'>
-                <h2>📋 تقرير شامل للمريض</h2>
-                <h3>{patient_data['name']}</h3>
-                <p>تاريخ التقرير: {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>
-            </div>
-            
-            <div class='report-section'>
-                <h3>👤 المعلومات الشخصية</h3>
-                <table class='report-table'>
-                    <tr><th>الاسم</th><td>{patient_data['name']}</td></tr>
-                    <tr><th>رقم الهاتف</th><td>{patient_data['phone']}</td></tr>
-                    <tr><th>البريد الإلكتروني</th><td>{patient_data.get('email', 'غير محدد')}</td></tr>
-                    <tr><th>العنوان</th><td>{patient_data.get('address', 'غير محدد')}</td></tr>
-                    <tr><th>تاريخ الميلاد</th><td>{patient_data.get('date_of_birth', 'غير محدد')}</td></tr>
-                    <tr><th>النوع</th><td>{patient_data.get('gender', 'غير محدد')}</td></tr>
-                    <tr><th>فصيلة الدم</th><td>{patient_data.get('blood_type', 'غير محدد')}</td></tr>
-                    <tr><th>الحساسية</th><td>{patient_data.get('allergies', 'لا يوجد')}</td></tr>
-                    <tr><th>جهة الاتصال للطوارئ</th><td>{patient_data.get('emergency_contact', 'غير محدد')}</td></tr>
-                </table>
-            </div>
-            
-            <div class='report-section'>
-                <h3>📊 الإحصائيات العامة</h3>
-                <table class='report-table'>
-                    <tr><th>إجمالي الزيارات</th><td>{total_visits} زيارة</td></tr>
-                    <tr><th>الزيارات المكتملة</th><td>{completed_visits} زيارة</td></tr>
-                    <tr><th>إجمالي التكاليف</th><td>{total_spent:,.2f} ج.م</td></tr>
-                    <tr><th>المبلغ المدفوع</th><td>{total_paid:,.2f} ج.م</td></tr>
-                    <tr><th>المبلغ المتبقي</th><td style='color: {"red" if total_pending > 0 else "green"};'>{total_pending:,.2f} ج.م</td></tr>
-                </table>
-            </div>
-        """
+        # معلومات المريض والإحصائيات
+        yield HEADER_TEMPLATE.substitute(
+            name=patient_data['name'],
+            generated_at=datetime.now().strftime('%Y-%m-%d %H:%M'),
+            phone=patient_data['phone'],
+            email=patient_data.get('email', 'غير محدد'),
+            address=patient_data.get('address', 'غير محدد'),
+            date_of_birth=patient_data.get('date_of_birth', 'غير محدد'),
+            gender=patient_data.get('gender', 'غير محدد'),
+            blood_type=patient_data.get('blood_type', 'غير محدد'),
+            allergies=patient_data.get('allergies', 'لا يوجد'),
+            emergency_contact=patient_data.get('emergency_contact', 'غير محدد'),
+            total_visits=total_visits,
+            completed_visits=completed_visits,
+            total_spent=_money(total_spent),
+            total_paid=_money(total_paid),
+            pending_color="red" if total_pending > 0 else "green",
+            total_pending=_money(total_pending),
+        )
         
         # التاريخ الطبي
         if patient_data.get('medical_history'):
-            patient_info += f"""
-            <div class='report-section'>
-                <h3>📝 التاريخ الطبي</h3>
-                <p>{patient_data['medical_history']}</p>
-            </div>
-            """
+            yield TEXT_SECTION_TEMPLATE.substitute(title="📝 التاريخ الطبي", text=patient_data['medical_history'])
         
         # ملاحظات إضافية
         if patient_data.get('notes'):
-            patient_info += f"""
-            <div class='report-section'>
-                <h3>📌 ملاحظات</h3>
-                <p>{patient_data['notes']}</p>
-            </div>
-            """
+            yield TEXT_SECTION_TEMPLATE.substitute(title="📌 ملاحظات", text=patient_data['notes'])
         
         # سجل المواعيد
         if not appointments_data.empty:
-            appointments_html = """
-            <div class='report-section'>
-                <h3>📅 سجل المواعيد</h3>
-                <table class='report-table'>
-                    <thead>
-                        <tr>
-                            <th>التاريخ</th>
-                            <th>الوقت</th>
-                            <th>الطبيب</th>
-                            <th>العلاج</th>
-                            <th>الحالة</th>
-                            <th>التكلفة</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            """
-            
-            for _, apt in appointments_data.iterrows():
-                appointments_html += f"""
-                    <tr>
-                        <td>{apt['appointment_date']}</td>
-                        <td>{apt['appointment_time']}</td>
-                        <td>{apt['doctor_name']}</td>
-                        <td>{apt['treatment_name']}</td>
-                        <td>{apt['status']}</td>
-                        <td>{apt['total_cost']:,.2f} ج.م</td>
-                    </tr>
-                """
-            
-            appointments_html += """
-                    </tbody>
-                </table>
-            </div>
-            """
-            patient_info += appointments_html
+            yield from _iter_table("📅 سجل المواعيد", appointments_data, APPOINTMENT_COLUMNS)
         
         # سجل المدفوعات
         if not payments_data.empty:
-            payments_html = """
-            <div class='report-section'>
-                <h3>💰 سجل المدفوعات</h3>
-                <table class='report-table'>
-                    <thead>
-                        <tr>
-                            <th>التاريخ</th>
-                            <th>المبلغ</th>
-                            <th>طريقة الدفع</th>
-                            <th>الحالة</th>
-                            <th>ملاحظات</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            """
-            
-            for _, pay in payments_data.iterrows():
-                payments_html += f"""
-                    <tr>
-                        <td>{pay['payment_date']}</td>
-                        <td>{pay['amount']:,.2f} ج.م</td>
-                        <td>{pay['payment_method']}</td>
-                        <td>{pay['status']}</td>
-                        <td>{pay.get('notes', '')}</td>
-                    </tr>
-                """
-            
-            payments_html += """
-                    </tbody>
-                </table>
-            </div>
-            """
-            patient_info += payments_html
+            yield from _iter_table("💰 سجل المدفوعات", payments_data, PAYMENT_COLUMNS)
         
         # العلاجات المستخدمة
         if not treatments_data.empty:
             treatments_summary = treatments_data.groupby('treatment_name').size().reset_index(name='count')
-            treatments_summary.columns = ['العلاج', 'عدد المرات']
-            
-            treatments_html = """
-            <div class='report-section'>
-                <h3>💉 ملخص العلاجات</h3>
-                <table class='report-table'>
-                    <thead>
-                        <tr>
-                            <th>العلاج</th>
-                            <th>عدد المرات</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-            """
-            
-            for _, treat in treatments_summary.iterrows():
-                treatments_html += f"""
-                    <tr>
-                        <td>{treat['العلاج']}</td>
-                        <td>{treat['عدد المرات']}</td>
-                    </tr>
-                """
-            
-            treatments_html += """
-                    </tbody>
-                </table>
-            </div>
-            """
-            patient_info += treatments_html
+            yield from _iter_table("💉 ملخص العلاجات", treatments_summary, TREATMENT_COLUMNS)
         
-        patient_info += "</div>"
-        
-        return patient_info
+        yield "</div>"
+    
+    @staticmethod
+    def generate_html_report(patient_data, appointments_data, payments_data, treatments_data):
+        """توليد تقرير HTML شامل للمريض"""
+        return "".join(PatientReportGenerator.iter_html_report(
+            patient_data, appointments_data, payments_data, treatments_data
+        ))
+    
+    @staticmethod
+    def write_html_report(stream, patient_data, appointments_data, payments_data, treatments_data):
+        """كتابة التقرير في ملف مفتوح جزءاً بجزء بدون بناء النص كاملاً في الذاكرة"""
+        stream.writelines(PatientReportGenerator.iter_html_report(
+            patient_data, appointments_data, payments_data, treatments_data
+        ))
@@ -1,18 +1,28 @@
+import os
+import tempfile
 import streamlit as st
 from database.crud import crud
-from database.models import db
+from database.models import db, PRAGMA_PROFILE
+from database.importer import IMPORT_TABLES
 
 def render():
     """صفحة الإعدادات"""
     st.markdown("### ⚙️ إعدادات النظام")
     
-    tab1, tab2 = st.tabs(["🏥 معلومات العيادة", "💾 النسخ الاحتياطي"])
+    tab1, tab2, tab3, tab4 = st.tabs(["🏥 معلومات العيادة", "💾 النسخ الاحتياطي",
+                                      "⚡ أداء قاعدة البيانات", "📥 استيراد البيانات"])
     
     with tab1:
         render_clinic_info()
     
     with tab2:
         render_backup()
+    
+    with tab3:
+        render_performance()
+    
+    with tab4:
+        render_import()
 
 def render_clinic_info():
     """معلومات العيادة"""
@@ -93,3 +103,98 @@ def render_backup():
         - يُنصح بإنشاء نسخ احتياطية دورية
         - النسخ الاحتياطية تساعد في استعادة البيانات عند الحاجة
         """)
+
+def render_performance():
+    """إعدادات أداء قاعدة البيانات (PRAGMA)"""
+    st.markdown("#### ⚡ أداء قاعدة البيانات")
+    st.info("تُطبق هذه الإعدادات على كل اتصال جديد بقاعدة البيانات")
+    
+    values = {}
+    col1, col2 = st.columns(2)
+    
+    for i, (key, pragma, default, allowed, description) in enumerate(PRAGMA_PROFILE):
+        current = crud.get_setting(key) or default
+        
+        with (col1 if i % 2 == 0 else col2):
+            if allowed is int:
+                try:
+                    current = int(current)
+                except ValueError:
+                    current = int(default)
+                values[key] = st.number_input(f"{description} ({pragma})", value=current, step=1, key=f"pragma_{key}")
+            else:
+                options = list(allowed)
+                index = options.index(current.upper()) if current.upper() in options else options.index(default)
+                values[key] = st.selectbox(f"{description} ({pragma})", options, index=index, key=f"pragma_{key}")
+    
+    if st.button("💾 حفظ إعدادات الأداء", type="primary"):
+        try:
+            for key, value in values.items():
+                crud.update_setting(key, str(value))
+            db.reload_pragma_profile()
+            st.success("✅ تم حفظ إعدادات الأداء!")
+        except Exception as e:
+            st.error(f"حدث خطأ: {str(e)}")
+    
+    st.markdown("---")
+    st.markdown("#### القيم الحالية")
+    st.json(crud.get_database_pragmas())
+    
+    st.markdown("---")
+    st.markdown("#### الذاكرة المؤقتة للاستعلامات")
+    st.json(crud.get_cache_stats())
+    if st.button("🧹 مسح الذاكرة المؤقتة"):
+        crud.cache.clear()
+        st.success("✅ تم مسح الذاكرة المؤقتة")
+    
+    st.markdown("---")
+    st.markdown("#### الجداول التجميعية للتقارير")
+    st.caption("يتم تحديثها تلقائياً مع كل عملية. أعد بناءها فقط بعد تعديل البيانات يدوياً خارج البرنامج.")
+    if st.button("🔄 إعادة بناء الجداول التجميعية"):
+        try:
+            counts = crud.rebuild_rollups()
+            st.success(f"✅ تمت إعادة البناء: {counts}")
+        except Exception as e:
+            st.error(f"حدث خطأ: {str(e)}")
+
+def render_import():
+    """استيراد بيانات من ملف CSV أو Excel"""
+    st.markdown("#### 📥 استيراد البيانات")
+    st.info("أسماء الأعمدة في الملف يجب أن تطابق أسماء أعمدة الجدول. الصفوف غير الصالحة أو المكررة لا يتم إدخالها.")
+    
+    table_name = st.selectbox(
+        "الجدول",
+        list(IMPORT_TABLES),
+        format_func=lambda name: IMPORT_TABLES[name]['label']
+    )
+    spec = IMPORT_TABLES[table_name]
+    st.caption(f"الأعمدة: {', '.join(spec['columns'])} - المطلوبة: {', '.join(spec['required'])}")
+    
+    uploaded_file = st.file_uploader("اختر ملف", type=['csv', 'xlsx'], key="import_file")
+    
+    if uploaded_file and st.button("📥 بدء الاستيراد", type="primary"):
+        progress_bar = st.progress(0.0)
+        status = st.empty()
+        
+        def report(stats):
+            if stats['fraction'] is not None:
+                progress_bar.progress(stats['fraction'])
+            status.text(f"تمت قراءة {stats['read']} صف - تم إدخال {stats['inserted']}")
+        
+        rejects_path = os.path.join(tempfile.gettempdir(), f"rejects_{table_name}.csv")
+        try:
+            stats = crud.import_file(table_name, uploaded_file, rejects_path=rejects_path, progress=report)
+            progress_bar.progress(1.0)
+            st.success(f"✅ تم إدخال {stats['inserted']} من {stats['read']} صف")
+            
+            if stats['duplicates'] or stats['rejected']:
+                st.warning(f"⚠️ صفوف مكررة: {stats['duplicates']} - صفوف مرفوضة: {stats['rejected']}")
+                with open(rejects_path, 'rb') as rejects_file:
+                    st.download_button(
+                        "📄 تحميل ملف الصفوف المرفوضة",
+                        rejects_file.read(),
+                        file_name=f"rejects_{table_name}.csv",
+                        mime="text/csv"
+                    )
+        except Exception as e:
+            st.error(f"حدث خطأ: {str(e)}")
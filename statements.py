@@ -0,0 +1,211 @@
+"""
+كشوف حساب المرضى بالجملة (كشوف نهاية الشهر)
+
+1. اختيار المرضى حسب COHORTS (كل المرضى النشطين أو المدينون من دفتر الأرصدة)
+2. جلب البيانات على دفعات من BATCH_SIZE مريض: ثلاثة استعلامات لكل دفعة
+   (المرضى، المواعيد، المدفوعات) بـ patient_id IN (...) ثم تقسيمها بـ groupby
+3. توليد الكشوف بالتوازي في ProcessPoolExecutor (كل عملية تأخذ دفعة كاملة)
+4. كل كشف يُكتب في ملف مستقل في مجلد الإخراج (كتابة ذرية)، لذلك إعادة التشغيل
+   بعد انقطاع تكمل من حيث توقفت ولا تعيد توليد الكشوف الموجودة.
+   عند طلب zip تُجمع الملفات في النهاية في ملف واحد.
+
+    python statements.py statements_2026_10 --cohort outstanding --zip statements_2026_10.zip
+"""
+
+import argparse
+import os
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from database.balances import BALANCE_TOLERANCE
+from report_generator import PatientReportGenerator
+
+BATCH_SIZE = 200
+
+# الاسم -> (الوصف، استعلام معرفات المرضى)
+COHORTS = {
+    'outstanding': ("المرضى الذين عليهم مبالغ متبقية", f'''
+        SELECT b.patient_id
+        FROM patient_balances b
+        JOIN patients p ON p.id = b.patient_id
+        WHERE b.balance > {BALANCE_TOLERANCE} AND p.is_active = 1
+        ORDER BY b.patient_id
+    '''),
+    'active': ("كل المرضى النشطين", '''
+        SELECT id FROM patients WHERE is_active = 1 ORDER BY id
+    '''),
+}
+
+STATEMENT_PAGE_START = """<!DOCTYPE html>
+<html lang='ar' dir='rtl'>
+<head>
+<meta charset='utf-8'>
+<title>كشف حساب</title>
+<style>
+body { font-family: Tahoma, Arial, sans-serif; margin: 24px; }
+.report-table { border-collapse: collapse; width: 100%; margin-bottom: 16px; }
+.report-table th, .report-table td { border: 1px solid #ccc; padding: 6px 10px; text-align: right; }
+.report-table th { background: #f4f6f8; }
+</style>
+</head>
+<body>
+"""
+
+STATEMENT_PAGE_END = "\n</body>\n</html>\n"
+
+
+def cohort_patient_ids(conn, cohort):
+    """معرفات مرضى المجموعة مرتبة"""
+    if cohort not in COHORTS:
+        raise ValueError(f"Unknown cohort: {cohort}")
+    return [row[0] for row in conn.execute(COHORTS[cohort][1])]
+
+
+def statement_path(out_dir, patient_id):
+    return os.path.join(out_dir, f"statement_{patient_id}.html")
+
+
+# ========== جلب البيانات ==========
+def fetch_batch(conn, patient_ids):
+    """بيانات دفعة مرضى في ثلاثة استعلامات: (المرضى، المواعيد، المدفوعات)"""
+    placeholders = ", ".join("?" * len(patient_ids))
+    params = list(patient_ids)
+
+    patients = pd.read_sql_query(
+        f"SELECT * FROM patients WHERE id IN ({placeholders}) ORDER BY id", conn, params=params)
+    appointments = pd.read_sql_query(f'''
+        SELECT
+            a.*,
+            d.name as doctor_name,
+            t.name as treatment_name
+        FROM appointments a
+        LEFT JOIN doctors d ON a.doctor_id = d.id
+        LEFT JOIN treatments t ON a.treatment_id = t.id
+        WHERE a.patient_id IN ({placeholders})
+        ORDER BY a.patient_id, a.appointment_date DESC, a.appointment_time DESC
+    ''', conn, params=params)
+    payments = pd.read_sql_query(f'''
+        SELECT * FROM payments
+        WHERE patient_id IN ({placeholders})
+        ORDER BY patient_id, payment_date DESC
+    ''', conn, params=params)
+    return patients, appointments, payments
+
+
+# ========== التوليد (داخل العمليات) ==========
+def _write_statement(path, patient, appointments, payments):
+    treatments = appointments.loc[appointments['treatment_id'].notna(),
+                                  ['treatment_id', 'treatment_name', 'appointment_date']]
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(STATEMENT_PAGE_START)
+        PatientReportGenerator.write_html_report(f, patient, appointments, payments, treatments)
+        f.write(STATEMENT_PAGE_END)
+    os.replace(temp_path, path)
+
+
+def render_batch(batch, out_dir):
+    """توليد كشوف دفعة واحدة (تعمل في عملية منفصلة) - يعيد عدد الكشوف"""
+    patients, appointments, payments = batch
+    appointments_by_patient = dict(tuple(appointments.groupby('patient_id')))
+    payments_by_patient = dict(tuple(payments.groupby('patient_id')))
+    no_appointments, no_payments = appointments.iloc[0:0], payments.iloc[0:0]
+
+    # القيم الفارغة None بدلاً من NaN كما في تقرير المريض الواحد
+    records = patients.astype(object).where(patients.notna(), None).to_dict('records')
+    for patient in records:
+        _write_statement(
+            statement_path(out_dir, patient['id']),
+            patient,
+            appointments_by_patient.get(patient['id'], no_appointments),
+            payments_by_patient.get(patient['id'], no_payments),
+        )
+    return len(records)
+
+
+# ========== التشغيل ==========
+def zip_statements(out_dir, patient_ids, zip_path):
+    """جمع الكشوف الموجودة في ملف zip (كتابة ذرية)"""
+    temp_path = zip_path + ".tmp"
+    with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for patient_id in patient_ids:
+            path = statement_path(out_dir, patient_id)
+            if os.path.exists(path):
+                archive.write(path, arcname=os.path.basename(path))
+    os.replace(temp_path, zip_path)
+    return zip_path
+
+
+def generate_statements(conn, out_dir, cohort='outstanding', patient_ids=None, zip_path=None,
+                        batch_size=BATCH_SIZE, workers=None, progress=None):
+    """توليد كشوف الحساب في out_dir (والكشوف الموجودة مسبقاً تُتخطى) - يعيد إحصائيات
+
+    progress(stats) تُستدعى بعد كل دفعة، و stats['fraction'] نسبة التقدم.
+    """
+    if patient_ids is None:
+        patient_ids = cohort_patient_ids(conn, cohort)
+    os.makedirs(out_dir, exist_ok=True)
+
+    pending = [patient_id for patient_id in patient_ids
+               if not os.path.exists(statement_path(out_dir, patient_id))]
+    stats = {
+        'total': len(patient_ids),
+        'skipped': len(patient_ids) - len(pending),
+        'rendered': 0,
+        'fraction': 1.0 if not pending else 0.0,
+    }
+
+    def collect(finished):
+        for future in finished:
+            stats['rendered'] += future.result()
+        stats['fraction'] = (stats['skipped'] + stats['rendered']) / max(stats['total'], 1)
+        if progress:
+            progress(dict(stats))
+
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = set()
+            for start in range(0, len(pending), batch_size):
+                batch = fetch_batch(conn, pending[start:start + batch_size])
+                running.add(pool.submit(render_batch, batch, out_dir))
+                # لا تُجلب دفعات أكثر مما تستطيع العمليات معالجته حتى لا تتراكم في الذاكرة
+                if len(running) >= 2 * workers:
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            while running:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+    if zip_path:
+        stats['zip_path'] = zip_statements(out_dir, patient_ids, zip_path)
+    return stats
+
+
+if __name__ == "__main__":
+    from database.models import add_database_arguments, open_from_args
+
+    parser = argparse.ArgumentParser(description="توليد كشوف حساب المرضى بالجملة")
+    parser.add_argument('out_dir', help="مجلد الكشوف (إعادة التشغيل على نفس المجلد تكمل الكشوف الناقصة)")
+    parser.add_argument('--cohort', choices=sorted(COHORTS), default='outstanding')
+    parser.add_argument('--zip', dest='zip_path', help="ملف zip يجمع الكشوف في النهاية")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int)
+    add_database_arguments(parser, read_only=True)
+    args = parser.parse_args()
+    db = open_from_args(args)
+
+    def report(stats):
+        print(f"... {stats['skipped'] + stats['rendered']} من {stats['total']} كشف", flush=True)
+
+    with db.connection() as conn:
+        result = generate_statements(conn, args.out_dir, args.cohort, zip_path=args.zip_path,
+                                     batch_size=args.batch_size, workers=args.workers,
+                                     progress=report)
+    print(f"✅ تم توليد {result['rendered']} كشف (موجود مسبقاً: {result['skipped']})")
+    if args.zip_path:
+        print(f"✅ {result['zip_path']}")
+    sys.exit(0)
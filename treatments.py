@@ -90,7 +90,7 @@ def show_treatments_list():
         
         with col3:
             if st.button("📊 تصدير إلى Excel"):
-                export_treatments_data(treatments_df)
+                export_treatments_data(None if selected_category == 'الكل' else selected_category)
         
         with col4:
             if st.button("💰 تحديث الأسعار"):
@@ -467,28 +467,25 @@ def show_treatments_stats(treatments_df):
         st.metric("📁 عدد الفئات", categories_count)
 
 def save_treatments_changes(edited_df, original_df):
-    """حفظ تعديلات العلاجات"""
+    """حفظ تعديلات العلاجات (كل التعديلات في معاملة واحدة)"""
     try:
-        for idx, row in edited_df.iterrows():
-            original_row = original_df[original_df['id'] == row['id']].iloc[0]
-            
-            # التحقق من وجود تغييرات
-            if (row['name'] != original_row['name'] or 
-                row['description'] != original_row['description'] or
-                row['base_price'] != original_row['base_price'] or
-                row['duration_minutes'] != original_row['duration_minutes'] or
-                row['category'] != original_row['category']):
+        columns = ['name', 'description', 'base_price', 'duration_minutes', 'category']
+        originals = original_df.set_index('id')
+        changed = 0
+        
+        with crud.batch() as batch:
+            for _, row in edited_df.iterrows():
+                original_row = originals.loc[row['id']]
                 
-                crud.update_treatment(
-                    treatment_id=row['id'],
-                    name=row['name'],
-                    description=row['description'],
-                    base_price=row['base_price'],
-                    duration_minutes=row['duration_minutes'],
-                    category=row['category']
-                )
+                # التحقق من وجود تغييرات (نسب التقسيم لا تتغير من هنا)
+                if any(row[column] != original_row[column] for column in columns):
+                    batch.update_treatment(
+                        int(row['id']),
+                        **{column: row[column] for column in columns}
+                    )
+                    changed += 1
         
-        show_success_message("تم حفظ التعديلات بنجاح")
+        show_success_message(f"تم حفظ التعديلات بنجاح ({changed} علاج)")
         st.rerun()
         
     except Exception as e:
@@ -497,8 +494,9 @@ def save_treatments_changes(edited_df, original_df):
 def delete_selected_treatments(treatment_ids):
     """حذف العلاجات المحددة"""
     try:
-        for treatment_id in treatment_ids:
-            crud.delete_treatment(treatment_id)
+        with crud.batch() as batch:
+            for treatment_id in treatment_ids:
+                batch.delete_treatment(int(treatment_id))
         
         show_success_message(f"تم إلغاء تفعيل {len(treatment_ids)} علاج بنجاح")
         st.rerun()
@@ -506,11 +504,9 @@ def delete_selected_treatments(treatment_ids):
     except Exception as e:
         show_error_message(f"خطأ في حذف العلاجات: {str(e)}")
 
-def export_treatments_data(treatments_df):
+def export_treatments_data(category=None):
     """تصدير بيانات العلاجات"""
     try:
-        from utils.helpers import export_to_excel
-        
         export_columns = {
             'id': 'المعرف',
             'name': 'اسم العلاج',
@@ -521,15 +517,15 @@ def export_treatments_data(treatments_df):
             'created_at': 'تاريخ الإضافة'
         }
         
-        export_df = treatments_df[list(export_columns.keys())].rename(columns=export_columns)
-        excel_data = export_to_excel(export_df, "treatments_report")
+        export_file = crud.export('treatments', 'xlsx', columns=export_columns, category=category)
         
-        st.download_button(
-            label="📥 تحميل Excel",
-            data=excel_data,
-            file_name=f"treatments_report_{date.today()}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        with export_file.open() as excel_data:
+            st.download_button(
+                label="📥 تحميل Excel",
+                data=excel_data,
+                file_name=export_file.file_name,
+                mime=export_file.mime
+            )
         
     except Exception as e:
         show_error_message(f"خطأ في التصدير: {str(e)}")
@@ -555,36 +551,36 @@ def update_treatment_price(treatment_id, new_price):
         show_error_message(f"خطأ في تحديث السعر: {str(e)}")
 
 def apply_percentage_update(category, percentage):
-    """تطبيق تحديث نسبة مئوية على الأسعار"""
+    """تطبيق تحديث نسبة مئوية على الأسعار (استعلام واحد لكل الفئة)"""
     try:
-        treatments_df = crud.get_all_treatments()
-        
-        if category != 'جميع الفئات':
-            treatments_df = treatments_df[treatments_df['category'] == category]
-        
-        updated_count = 0
-        
-        for _, treatment in treatments_df.iterrows():
-            new_price = treatment['base_price'] * (1 + percentage / 100)
-            new_price = round(new_price, 2)  # تقريب لأقرب قرشين
-            
-            crud.update_treatment(
-                treatment_id=treatment['id'],
-                name=treatment['name'],
-                description=treatment['description'],
-                base_price=new_price,
-                duration_minutes=treatment['duration_minutes'],
-                category=treatment['category']
-            )
-            
-            updated_count += 1
+        result = crud.bulk_update_treatment_prices(
+            category=None if category == 'جميع الفئات' else category,
+            percentage=percentage
+        )
         
-        show_success_message(f"تم تحديث أسعار {updated_count} علاج بنسبة {percentage:+.1f}%")
-        st.rerun()
+        show_success_message(f"تم تحديث أسعار {len(result['diff'])} علاج بنسبة {percentage:+.1f}%")
+        show_price_changes(result['diff'])
         
     except Exception as e:
         show_error_message(f"خطأ في تحديث الأسعار: {str(e)}")
 
+def show_price_changes(diff_df):
+    """عرض الأسعار قبل وبعد التحديث"""
+    if diff_df.empty:
+        return
+    
+    st.dataframe(
+        diff_df.rename(columns={
+            'id': 'المعرف',
+            'name': 'اسم العلاج',
+            'category': 'الفئة',
+            'old_price': 'السعر القديم',
+            'new_price': 'السعر الجديد'
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+
 def update_prices_bulk():
     """تحديث أسعار متعددة"""
     st.subheader("🔄 تحديث أسعار متعددة")
@@ -609,26 +605,15 @@ def update_prices_bulk():
                     show_error_message("الملف يجب أن يحتوي على عمودي treatment_id و new_price")
                     return
                 
-                updated_count = 0
-                
-                for _, row in df.iterrows():
-                    treatment_id = int(row['treatment_id'])
-                    new_price = float(row['new_price'])
-                    
-                    treatment = crud.get_treatment_by_id(treatment_id)
-                    if treatment:
-                        crud.update_treatment(
-                            treatment_id=treatment_id,
-                            name=treatment[1],
-                            description=treatment[2],
-                            base_price=new_price,
-                            duration_minutes=treatment[4],
-                            category=treatment[5]
-                        )
-                        updated_count += 1
+                # كل الأسعار في معاملة واحدة عبر جدول مؤقت
+                result = crud.bulk_update_treatment_prices(
+                    price_list=zip(df['treatment_id'], df['new_price'])
+                )
                 
-                show_success_message(f"تم تحديث أسعار {updated_count} علاج بنجاح")
-                st.rerun()
+                show_success_message(f"تم تحديث أسعار {len(result['diff'])} علاج بنجاح")
+                if result['unmatched']:
+                    st.warning(f"علاجات غير موجودة: {', '.join(map(str, result['unmatched']))}")
+                show_price_changes(result['diff'])
                 
             except Exception as e:
                 show_error_message(f"خطأ في معالجة الملف: {str(e)}")
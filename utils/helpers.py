@@ -21,9 +21,16 @@ def calculate_age(birth_date):
     return age
 
 def export_to_excel(dataframe, filename):
-    """تصدير بيانات إلى Excel"""
+    """تصدير بيانات إلى Excel (openpyxl في وضع write_only)"""
     try:
-        dataframe.to_excel(filename, index=False, engine='openpyxl')
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append([str(column) for column in dataframe.columns])
+        for row in dataframe.itertuples(index=False, name=None):
+            sheet.append([None if pd.isna(value) else value for value in row])
+        workbook.save(filename)
         return True
     except Exception as e:
         print(f"Error exporting to Excel: {e}")